@@ -0,0 +1,410 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+import numpy as np
+from . import metrics
+from .http_client import get_http_client, timeout_for
+from .logger import logger, SAMPLED
+from .services.open_meteo import build_selection, get_weather_batch
+from .variable_map import VARIABLE_MAP
+
+# Weather alerts for a field portfolio
+# A background evaluator pulls the next hours for every field through
+# get_weather_batch (cached cells answered locally, the rest in chunked
+# multi-location calls), aggregates each rule's variable over the window for
+# the whole chunk at once (numpy, fields x hours) and compares with the last
+# known state per (field, rule). Only changes are emitted: "triggered" when the
+# value reaches the threshold, "cleared" when it falls below the clear level
+# (hysteresis, so a value hovering at the threshold doesn't flap).
+#
+# Events go to two sinks, both bounded:
+#   GET /alerts/stream  Server-Sent Events; each client has a queue of
+#                       ALERTS_SUBSCRIBER_QUEUE_SIZE. A client that falls behind
+#                       is disconnected and resumes with Last-Event-ID from the
+#                       last ALERTS_REPLAY_SIZE events.
+#   ALERTS_WEBHOOK_URL  POSTed by ALERTS_WEBHOOK_CONCURRENCY workers from a queue
+#                       of ALERTS_WEBHOOK_QUEUE_SIZE; when it is full the
+#                       evaluator waits (backpressure) up to
+#                       ALERTS_WEBHOOK_ENQUEUE_TIMEOUT, then drops the event.
+#
+# State is per process: enable the evaluator (ALERTS_ENABLED) in one worker.
+
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "false").lower() in ("1", "true", "yes")
+# JSON list of {"id", "latitude", "longitude"}, re-read on every run
+ALERTS_FIELDS_PATH = os.getenv("ALERTS_FIELDS_PATH", "")
+# JSON list of rules replacing DEFAULT_ALERT_RULES
+ALERTS_RULES_PATH = os.getenv("ALERTS_RULES_PATH", "")
+ALERTS_INTERVAL = float(os.getenv("ALERTS_INTERVAL", "300"))
+ALERTS_HOURS = int(os.getenv("ALERTS_HOURS", "6"))
+# Fields per get_weather_batch call (bounds memory; events go out per chunk)
+ALERTS_BATCH_SIZE = int(os.getenv("ALERTS_BATCH_SIZE", "500"))
+ALERTS_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("ALERTS_SUBSCRIBER_QUEUE_SIZE", "256"))
+ALERTS_REPLAY_SIZE = int(os.getenv("ALERTS_REPLAY_SIZE", "1000"))
+ALERTS_SSE_HEARTBEAT = float(os.getenv("ALERTS_SSE_HEARTBEAT", "15"))
+ALERTS_WEBHOOK_URL = os.getenv("ALERTS_WEBHOOK_URL", "")
+ALERTS_WEBHOOK_CONCURRENCY = int(os.getenv("ALERTS_WEBHOOK_CONCURRENCY", "4"))
+ALERTS_WEBHOOK_QUEUE_SIZE = int(os.getenv("ALERTS_WEBHOOK_QUEUE_SIZE", "1000"))
+ALERTS_WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv("ALERTS_WEBHOOK_ENQUEUE_TIMEOUT", "2"))
+ALERTS_WEBHOOK_TIMEOUT = float(os.getenv("ALERTS_WEBHOOK_TIMEOUT", "5"))
+ALERTS_WEBHOOK_RETRIES = int(os.getenv("ALERTS_WEBHOOK_RETRIES", "2"))
+
+DEFAULT_ALERT_RULES: List[Dict[str, Any]] = [
+    # Rain accumulated over the next ALERTS_HOURS (mm)
+    {"name": "heavy_rain", "variable": "hourly_precipitation", "aggregate": "sum", "threshold": 20, "clear": 10},
+    # Strongest gust over the next ALERTS_HOURS (km/h)
+    {"name": "strong_gusts", "variable": "hourly_wind_gusts_10m", "aggregate": "max", "threshold": 60, "clear": 45},
+]
+
+_AGGREGATES = {"sum": np.nansum, "max": np.nanmax}
+
+
+class AlertField(NamedTuple):
+    id: str
+    latitude: float
+    longitude: float
+
+
+class AlertRule(NamedTuple):
+    name: str
+    variable: str  # VARIABLE_MAP name
+    column: str  # Open-Meteo hourly name, as in next_hours
+    aggregate: str
+    threshold: float
+    clear: float
+
+
+def compile_rules(specs: List[Dict[str, Any]]) -> List[AlertRule]:
+    rules = []
+    for spec in specs:
+        variable = spec.get("variable")
+        entry = VARIABLE_MAP.get(variable)
+        if entry is None or entry["source"] != "hourly":
+            raise ValueError(f"Alert rule variable must be an hourly variable: {variable}")
+        if spec.get("aggregate") not in _AGGREGATES:
+            raise ValueError(f"Unknown aggregate in alert rule {spec.get('name')}: {spec.get('aggregate')}")
+        threshold = float(spec["threshold"])
+        clear = float(spec.get("clear", threshold))
+        if clear > threshold:
+            raise ValueError(f"clear must not be above threshold in alert rule {spec['name']}")
+        rules.append(AlertRule(str(spec["name"]), variable, entry["path"][1], spec["aggregate"], threshold, clear))
+    if len({rule.name for rule in rules}) != len(rules):
+        raise ValueError("Alert rule names must be unique")
+    return rules
+
+
+def load_rules(path: str = ALERTS_RULES_PATH) -> List[AlertRule]:
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return compile_rules(json.load(f))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.error(f"Could not load alert rules from {path}: {e}. Using built-in rules.")
+    return compile_rules(DEFAULT_ALERT_RULES)
+
+
+def load_fields(path: str = ALERTS_FIELDS_PATH) -> List[AlertField]:
+    if not path:
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        return [AlertField(str(item["id"]), float(item["latitude"]), float(item["longitude"])) for item in raw]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Could not read alert fields {path}: {e}")
+        return []
+
+
+def aggregate_window(rows: List[Optional[List[Dict[str, Any]]]], rule: AlertRule, hours: int) -> np.ndarray:
+    """Rule aggregate over the next `hours` rows per field (NaN where there is no data)"""
+    values = np.full((len(rows), hours), np.nan)
+    for i, next_hours in enumerate(rows):
+        if next_hours:
+            column = [row.get(rule.column) for row in next_hours[:hours]]
+            values[i, :len(column)] = [np.nan if v is None else v for v in column]
+    known = ~np.isnan(values).all(axis=1)
+    result = np.full(len(rows), np.nan)
+    if known.any():
+        result[known] = _AGGREGATES[rule.aggregate](values[known], axis=1)
+    return result
+
+
+def transitions(previous: np.ndarray, values: np.ndarray, rule: AlertRule) -> np.ndarray:
+    """New active state per field: on at the threshold, off below the clear level, unchanged without data"""
+    with np.errstate(invalid="ignore"):
+        active = np.where(previous, values >= rule.clear, values >= rule.threshold)
+    return np.where(np.isnan(values), previous, active)
+
+
+class AlertBroker:
+    """Fan-out of alert events to SSE subscribers, with a replay buffer"""
+
+    def __init__(self, queue_size: int = ALERTS_SUBSCRIBER_QUEUE_SIZE, replay_size: int = ALERTS_REPLAY_SIZE):
+        self.queue_size = queue_size
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=replay_size)
+        self._subscribers: Set["Subscription"] = set()
+        self._next_id = 1
+        self._delivered = metrics.alert_deliveries.labels("sse", "ok")
+        self._dropped = metrics.alert_deliveries.labels("sse", "dropped")
+
+    def publish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        event = {"id": self._next_id, **event}
+        self._next_id += 1
+        self._recent.append(event)
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+                self._delivered.inc()
+            except asyncio.QueueFull:
+                # Too slow: cut it off; it resumes from the replay buffer
+                self._dropped.inc()
+                subscription.overflowed = True
+                self._remove(subscription)
+        return event
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> "Subscription":
+        subscription = Subscription(self, self.queue_size)
+        if last_event_id is not None:
+            missed = [event for event in self._recent if event["id"] > last_event_id]
+            for event in missed[-self.queue_size:]:
+                subscription.queue.put_nowait(event)
+        self._subscribers.add(subscription)
+        metrics.alert_subscribers.labels().inc()
+        return subscription
+
+    def _remove(self, subscription: "Subscription") -> None:
+        if subscription in self._subscribers:
+            self._subscribers.discard(subscription)
+            metrics.alert_subscribers.labels().dec()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+
+class Subscription:
+    def __init__(self, broker: AlertBroker, queue_size: int):
+        self.broker = broker
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None after `timeout` seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    @property
+    def finished(self) -> bool:
+        """Overflowed and drained: the stream should end"""
+        return self.overflowed and self.queue.empty()
+
+    def close(self) -> None:
+        self.broker._remove(self)
+
+
+class WebhookDispatcher:
+    """POSTs events to a URL from a bounded queue with a fixed number of workers"""
+
+    def __init__(self, url: str, concurrency: int = ALERTS_WEBHOOK_CONCURRENCY, queue_size: int = ALERTS_WEBHOOK_QUEUE_SIZE,
+                 enqueue_timeout: float = ALERTS_WEBHOOK_ENQUEUE_TIMEOUT, retries: int = ALERTS_WEBHOOK_RETRIES):
+        self.url = url
+        self.concurrency = concurrency
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._results = {result: metrics.alert_deliveries.labels("webhook", result) for result in ("ok", "error", "dropped")}
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, event: Dict[str, Any]) -> bool:
+        """Queue an event, waiting for room up to enqueue_timeout; False if dropped"""
+        try:
+            await asyncio.wait_for(self.queue.put(event), self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._results["dropped"].inc()
+            logger.warning(f"Alert webhook queue full, dropping event for {event.get('field_id')}", extra=SAMPLED)
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            event = await self.queue.get()
+            try:
+                await self._deliver(event)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, event: Dict[str, Any]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                response = await get_http_client().post(self.url, json=event, timeout=timeout_for(ALERTS_WEBHOOK_TIMEOUT))
+                if response.status_code < 500:
+                    if response.status_code >= 400:
+                        break
+                    self._results["ok"].inc()
+                    return
+            except Exception as e:
+                logger.warning(f"Alert webhook attempt {attempt + 1} failed: {e}", extra=SAMPLED)
+            if attempt < self.retries:
+                await asyncio.sleep(0.5 * 2 ** attempt * random.uniform(0.5, 1.5))
+        self._results["error"].inc()
+        logger.error(f"Alert webhook delivery failed for {event.get('field_id')}/{event.get('rule')}", extra=SAMPLED)
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class AlertEngine:
+    """Evaluates the rules for all fields and emits the state changes"""
+
+    def __init__(self, rules: List[AlertRule], broker: AlertBroker, webhook: Optional[WebhookDispatcher] = None,
+                 hours: int = ALERTS_HOURS, batch_size: int = ALERTS_BATCH_SIZE):
+        self.rules = rules
+        self.broker = broker
+        self.webhook = webhook
+        self.hours = hours
+        self.batch_size = batch_size
+        # Two days so the window never runs past the end of the fetched horizon
+        self.selection = build_selection(2, list(dict.fromkeys(rule.variable for rule in rules)), hours)
+        # (field id, rule) -> (value, since) of the active alerts
+        self.active: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._events = {
+            (rule.name, state): metrics.alert_events.labels(rule.name, state)
+            for rule in rules for state in ("triggered", "cleared")
+        }
+
+    async def evaluate(self, fields: List[AlertField]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        stats = {"fields": len(fields), "failed": 0, "triggered": 0, "cleared": 0}
+        # Fields removed from the portfolio drop their state silently
+        ids = {field.id for field in fields}
+        self.active = {key: value for key, value in self.active.items() if key[0] in ids}
+        for offset in range(0, len(fields), self.batch_size):
+            await self._evaluate_chunk(fields[offset:offset + self.batch_size], stats)
+        metrics.alert_evaluation_duration.labels().observe(time.perf_counter() - started)
+        stats["active"] = len(self.active)
+        stats["duration_seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+    async def _evaluate_chunk(self, fields: List[AlertField], stats: Dict[str, Any]) -> None:
+        rows: List[Optional[List[Dict[str, Any]]]] = [None] * len(fields)
+        async for index, outcome in get_weather_batch([(f.latitude, f.longitude) for f in fields], self.selection):
+            if outcome.get("status") == "ok":
+                rows[index] = outcome["data"].get("next_hours")
+        stats["failed"] += sum(1 for r in rows if r is None)
+
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        for rule in self.rules:
+            values = aggregate_window(rows, rule, self.hours)
+            previous = np.array([(f.id, rule.name) in self.active for f in fields], dtype=bool)
+            changed = np.flatnonzero(transitions(previous, values, rule) != previous)
+            for i in changed:
+                field = fields[i]
+                state = "cleared" if previous[i] else "triggered"
+                if state == "triggered":
+                    self.active[(field.id, rule.name)] = (float(values[i]), now)
+                else:
+                    self.active.pop((field.id, rule.name), None)
+                stats[state] += 1
+                self._events[(rule.name, state)].inc()
+                await self._emit({
+                    "field_id": field.id,
+                    "rule": rule.name,
+                    "state": state,
+                    "value": round(float(values[i]), 2),
+                    "threshold": rule.threshold if state == "triggered" else rule.clear,
+                    "hours": self.hours,
+                    "latitude": field.latitude,
+                    "longitude": field.longitude,
+                    "at": now,
+                })
+
+    async def _emit(self, event: Dict[str, Any]) -> None:
+        event = self.broker.publish(event)
+        if self.webhook is not None:
+            await self.webhook.submit(event)
+
+    def active_alerts(self) -> List[Dict[str, Any]]:
+        return [
+            {"field_id": field_id, "rule": rule, "value": round(value, 2), "since": since}
+            for (field_id, rule), (value, since) in sorted(self.active.items())
+        ]
+
+
+broker = AlertBroker()
+_engine: Optional[AlertEngine] = None
+_webhook: Optional[WebhookDispatcher] = None
+_scheduler_task: Optional[asyncio.Task] = None
+
+
+def get_engine() -> AlertEngine:
+    global _engine
+    if _engine is None:
+        _engine = AlertEngine(load_rules(), broker, _webhook)
+    return _engine
+
+
+async def run_alert_scheduler(interval: float = ALERTS_INTERVAL) -> None:
+    engine = get_engine()
+    while True:
+        try:
+            stats = await engine.evaluate(load_fields())
+            logger.info(f"Alert run finished: {stats}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Alert run failed: {e}", exc_info=True)
+        await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+
+def start_alerts() -> None:
+    """Start the evaluator and webhook workers (no-op unless ALERTS_ENABLED)"""
+    global _scheduler_task, _webhook
+    if not ALERTS_ENABLED or _scheduler_task is not None:
+        return
+    if ALERTS_WEBHOOK_URL:
+        _webhook = WebhookDispatcher(ALERTS_WEBHOOK_URL)
+        _webhook.start()
+    _scheduler_task = asyncio.create_task(run_alert_scheduler())
+    logger.info(f"Alert evaluator started (every {ALERTS_INTERVAL}s, next {ALERTS_HOURS}h)")
+
+
+async def stop_alerts() -> None:
+    global _scheduler_task, _webhook, _engine
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        try:
+            await _scheduler_task
+        except asyncio.CancelledError:
+            pass
+        _scheduler_task = None
+    if _webhook is not None:
+        await _webhook.stop()
+        _webhook = None
+    _engine = None
+
+
+async def sse_events(subscription: Subscription, heartbeat: float = ALERTS_SSE_HEARTBEAT) -> AsyncIterator[str]:
+    """Server-Sent Events for a subscription, with comment heartbeats"""
+    try:
+        yield "retry: 5000\n\n"
+        while not subscription.finished:
+            event = await subscription.get(heartbeat)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {event['id']}\nevent: alert\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    finally:
+        subscription.close()
@@ -1,20 +1,37 @@
 import json
 import os
+import time
+import uuid
+import asyncio
 import redis
+import redis.asyncio as aioredis
+from dataclasses import dataclass
 from typing import Dict, Tuple, List, Any, Optional
 from .schemas import City
-from .logger import logger
+from .logger import logger, SAMPLED
+from .memory_cache import MemoryCache
+from . import metrics
 
-# Cache TTL in seconds
+# Cache TTL in seconds (soft TTL: after this an entry is stale and gets refreshed)
 WEATHER_CACHE_TTL = 600
 GEOCODING_CACHE_TTL = 3600
 
+# Extra time stale entries are kept (hard TTL = TTL + STALE_TTL). Stale entries
+# are served immediately while a background refresh runs, and are used as a
+# fallback when the upstream API fails.
+WEATHER_CACHE_STALE_TTL = int(os.getenv("WEATHER_CACHE_STALE_TTL", "3600"))
+GEOCODING_CACHE_STALE_TTL = int(os.getenv("GEOCODING_CACHE_STALE_TTL", "86400"))
+CACHE_SWR_ENABLED = os.getenv("CACHE_SWR_ENABLED", "true").lower() in ("1", "true", "yes")
+
 # Redis Connection Setup
 # We do NOT connect or ping here to avoid startup crashes in Serverless environments
 # if the Redis URL is invalid or unreachable (e.g. localhost in Vercel).
 
 redis_url = os.getenv("REDIS_URL", "")
 redis_client = None
+# asyncio-native client used from request handlers so cache I/O never blocks the event loop
+async_redis_client = None
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
 
 # Determine if we should attempt Redis connection
 # In Vercel, if REDIS_URL is missing or is localhost, we skip directly to memory cache
@@ -34,56 +51,323 @@ if should_use_redis:
             socket_timeout=2.0,
             socket_connect_timeout=2.0
         )
+        async_redis_client = aioredis.from_url(
+            redis_url,
+            decode_responses=True,
+            socket_timeout=2.0,
+            socket_connect_timeout=2.0,
+            max_connections=REDIS_MAX_CONNECTIONS
+        )
         logger.info(f"Redis client configured for {redis_url}")
     except Exception as e:
         logger.warning(f"Failed to configure Redis client: {e}. Using in-memory cache.")
         redis_client = None
+        async_redis_client = None
 else:
     logger.info("Redis disabled or invalid URL. Using in-memory cache.")
 
-# In-memory fallback
-_memory_cache = {}
+# In-memory fallback (bounded LRU with per-entry TTL)
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "2048"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", "0"))  # 0 = no byte budget
+
+_memory_cache = MemoryCache(max_entries=MEMORY_CACHE_MAX_ENTRIES, max_bytes=MEMORY_CACHE_MAX_BYTES)
+
+# L1: small per-process cache in front of Redis (L2). Entries keep the decoded
+# payload so hot keys skip the network round trip and json.loads. Their TTL is
+# capped by CACHE_L1_MAX_TTL and by the envelope's remaining soft TTL, so L1
+# never holds a stale entry: stale reads always go to Redis, where another
+# worker's refresh is visible. Single-flight probes read L2 only (l1=False).
+# With CACHE_PUBSUB_ENABLED, writes are broadcast so other workers drop their copy.
+CACHE_L1_ENABLED = os.getenv("CACHE_L1_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "256"))
+CACHE_L1_MAX_TTL = float(os.getenv("CACHE_L1_MAX_TTL", "30"))
+CACHE_PUBSUB_ENABLED = os.getenv("CACHE_PUBSUB_ENABLED", "").lower() in ("1", "true", "yes")
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+_l1_cache = MemoryCache(max_entries=CACHE_L1_MAX_ENTRIES)
+_instance_id = uuid.uuid4().hex
+_invalidation_task = None
+
+# Metric children bound once; recording is a plain increment/observe
+_redis_get_duration = metrics.redis_operation_duration.labels("get")
+_redis_set_duration = metrics.redis_operation_duration.labels("setex")
+_redis_publish_duration = metrics.redis_operation_duration.labels("publish")
+_redis_get_errors = metrics.redis_errors.labels("get")
+_redis_set_errors = metrics.redis_errors.labels("setex")
+_lookups = {
+    namespace: (
+        metrics.cache_lookups.labels(namespace, "hit"),
+        metrics.cache_lookups.labels(namespace, "stale"),
+        metrics.cache_lookups.labels(namespace, "miss"),
+    )
+    for namespace in ("weather", "geo")
+}
 
-def _get_from_redis(key: str) -> Optional[Any]:
+def _record_lookup(namespace: str, entry: Optional["CacheEntry"]) -> None:
+    hit, stale, miss = _lookups[namespace]
+    if entry is None:
+        miss.inc()
+    elif entry.stale:
+        stale.inc()
+    else:
+        hit.inc()
+
+def _l1_ttl(value: Any, ttl: Optional[int]) -> float:
+    """L1 lifetime: at most the envelope's remaining soft TTL (<= 0: don't keep it)"""
+    if ttl is not None and isinstance(value, dict) and value.get("stored_at") is not None:
+        remaining = value["stored_at"] + ttl - time.time()
+        return min(CACHE_L1_MAX_TTL, remaining)
+    return CACHE_L1_MAX_TTL
+
+def _l1_store(key: str, value: Any, ttl: Optional[int]) -> None:
+    l1_ttl = _l1_ttl(value, ttl)
+    if l1_ttl > 0:
+        _l1_cache.set(key, value, l1_ttl)
+
+def _get_from_redis(key: str, ttl: Optional[int] = None, l1: bool = True) -> Optional[Any]:
+    """Cached value for key; ttl is the soft TTL of envelopes (bounds their L1 copy)"""
     if not redis_client:
         return _memory_cache.get(key)
+    if CACHE_L1_ENABLED and l1:
+        value = _l1_cache.get(key)
+        if value is not None:
+            return value
+    started = time.perf_counter()
     try:
         val = redis_client.get(key)
-        return json.loads(val) if val else None
+        value = json.loads(val) if val else None
     except Exception as e:
         # If Redis fails during operation, log and fallback to memory (optional, currently just returns None)
-        logger.error(f"Redis get error: {e}")
+        _redis_get_errors.inc()
+        logger.error(f"Redis get error: {e}", extra=SAMPLED)
         return None
+    finally:
+        _redis_get_duration.observe(time.perf_counter() - started)
+    if value is not None and CACHE_L1_ENABLED:
+        _l1_store(key, value, ttl)
+    return value
 
 def _set_in_redis(key: str, value: Any, ttl: int) -> None:
     if not redis_client:
-        _memory_cache[key] = value
+        _memory_cache.set(key, value, ttl)
         return
     try:
+        started = time.perf_counter()
         redis_client.setex(key, ttl, json.dumps(value))
+        _redis_set_duration.observe(time.perf_counter() - started)
+        # Next read picks up the new value from Redis; other workers drop theirs
+        _l1_cache.delete(key)
+        if CACHE_PUBSUB_ENABLED:
+            started = time.perf_counter()
+            redis_client.publish(CACHE_INVALIDATION_CHANNEL, f"{_instance_id}|{key}")
+            _redis_publish_duration.observe(time.perf_counter() - started)
     except Exception as e:
-        logger.error(f"Redis set error: {e}")
+        _redis_set_errors.inc()
+        logger.error(f"Redis set error: {e}", extra=SAMPLED)
         # Fallback to memory on write failure
-        _memory_cache[key] = value
+        _memory_cache.set(key, value, ttl)
 
-def get_geocoding_cache(key: str) -> Optional[List[City]]:
-    """Get cached geocoding results"""
-    data = _get_from_redis(f"geo:{key}")
-    if data:
+async def _aget_from_redis(key: str, ttl: Optional[int] = None, l1: bool = True) -> Optional[Any]:
+    """Cached value for key; l1=False reads Redis even if L1 has a copy"""
+    if not async_redis_client:
+        return _memory_cache.get(key)
+    if CACHE_L1_ENABLED and l1:
+        value = _l1_cache.get(key)
+        if value is not None:
+            return value
+    started = time.perf_counter()
+    try:
+        val = await async_redis_client.get(key)
+        value = json.loads(val) if val else None
+    except Exception as e:
+        _redis_get_errors.inc()
+        logger.error(f"Redis get error: {e}", extra=SAMPLED)
+        return None
+    finally:
+        _redis_get_duration.observe(time.perf_counter() - started)
+    if value is not None and CACHE_L1_ENABLED:
+        _l1_store(key, value, ttl)
+    return value
+
+async def _aset_in_redis(key: str, value: Any, ttl: int) -> None:
+    if not async_redis_client:
+        _memory_cache.set(key, value, ttl)
+        return
+    try:
+        started = time.perf_counter()
+        await async_redis_client.setex(key, ttl, json.dumps(value))
+        _redis_set_duration.observe(time.perf_counter() - started)
+        _l1_cache.delete(key)
+        if CACHE_PUBSUB_ENABLED:
+            started = time.perf_counter()
+            await async_redis_client.publish(CACHE_INVALIDATION_CHANNEL, f"{_instance_id}|{key}")
+            _redis_publish_duration.observe(time.perf_counter() - started)
+    except Exception as e:
+        _redis_set_errors.inc()
+        logger.error(f"Redis set error: {e}", extra=SAMPLED)
+        # Fallback to memory on write failure
+        _memory_cache.set(key, value, ttl)
+
+def _handle_invalidation(message: Dict[str, Any]) -> None:
+    data = message.get("data")
+    if not isinstance(data, str) or "|" not in data:
+        return
+    origin, key = data.split("|", 1)
+    if origin != _instance_id:
+        _l1_cache.delete(key)
+
+async def _listen_for_invalidations() -> None:
+    pubsub = async_redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+        logger.info(f"Listening for cache invalidations on {CACHE_INVALIDATION_CHANNEL}")
+        async for message in pubsub.listen():
+            _handle_invalidation(message)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Cache invalidation listener stopped: {e}. L1 relies on TTL only.")
+    finally:
+        await pubsub.aclose()
+
+def start_cache_invalidation_listener() -> None:
+    """Subscribe to cross-worker L1 invalidations (no-op without Redis/pub-sub)"""
+    global _invalidation_task
+    if not (async_redis_client and CACHE_L1_ENABLED and CACHE_PUBSUB_ENABLED) or _invalidation_task:
+        return
+    _invalidation_task = asyncio.create_task(_listen_for_invalidations())
+
+async def stop_cache_invalidation_listener() -> None:
+    global _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        try:
+            await _invalidation_task
+        except asyncio.CancelledError:
+            pass
+        _invalidation_task = None
+
+async def close_async_redis() -> None:
+    """Release the asyncio connection pool on shutdown"""
+    if async_redis_client is not None:
+        await async_redis_client.aclose()
+
+@dataclass
+class CacheEntry:
+    """A cached value plus the time it was stored"""
+    data: Any
+    stored_at: Optional[float]
+    ttl: int
+
+    @property
+    def age(self) -> Optional[float]:
+        if self.stored_at is None:
+            return None
+        return max(0.0, time.time() - self.stored_at)
+
+    @property
+    def stale(self) -> bool:
+        # Entries written before timestamps were stored have an unknown age
+        age = self.age
+        return age is None or age >= self.ttl
+
+def _wrap(data: Any) -> Dict[str, Any]:
+    return {"data": data, "stored_at": time.time()}
+
+def _to_entry(raw: Any, ttl: int, stale_ttl: int) -> Optional[CacheEntry]:
+    if raw is None:
+        return None
+    if isinstance(raw, dict) and "stored_at" in raw and "data" in raw:
+        entry = CacheEntry(data=raw["data"], stored_at=raw["stored_at"], ttl=ttl)
+        if entry.age is not None and entry.age >= ttl + stale_ttl:
+            return None
+        return entry
+    return CacheEntry(data=raw, stored_at=None, ttl=ttl)
+
+def _to_geocoding_entry(entry: Optional[CacheEntry]) -> Optional[CacheEntry]:
+    if entry and entry.data:
         # Reconstruct City objects
-        return [City(**item) for item in data]
+        return CacheEntry(data=[City(**item) for item in entry.data], stored_at=entry.stored_at, ttl=entry.ttl)
     return None
 
+def memory_cache_stats() -> Dict[str, int]:
+    """Hit/miss/eviction counters of the in-process cache"""
+    return _memory_cache.stats()
+
+def l1_cache_stats() -> Dict[str, int]:
+    """Hit/miss/eviction counters of the L1 in front of Redis"""
+    return _l1_cache.stats()
+
+def get_geocoding_entry(key: str) -> Optional[CacheEntry]:
+    """Get cached geocoding results with their age"""
+    raw = _get_from_redis(f"geo:{key}", GEOCODING_CACHE_TTL)
+    entry = _to_geocoding_entry(_to_entry(raw, GEOCODING_CACHE_TTL, GEOCODING_CACHE_STALE_TTL))
+    _record_lookup("geo", entry)
+    return entry
+
+def get_geocoding_cache(key: str) -> Optional[List[City]]:
+    """Get cached geocoding results"""
+    entry = get_geocoding_entry(key)
+    return entry.data if entry else None
+
 def set_geocoding_cache(key: str, cities: List[City]) -> None:
     """Store geocoding results in cache"""
     # Store as list of dicts
     data = [city.model_dump() for city in cities]
-    _set_in_redis(f"geo:{key}", data, GEOCODING_CACHE_TTL)
+    _set_in_redis(f"geo:{key}", _wrap(data), GEOCODING_CACHE_TTL + GEOCODING_CACHE_STALE_TTL)
+
+def get_weather_entry(key: str) -> Optional[CacheEntry]:
+    """Get cached weather data with its age"""
+    raw = _get_from_redis(f"weather:{key}", WEATHER_CACHE_TTL)
+    entry = _to_entry(raw, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL)
+    entry = entry if entry and entry.data else None
+    _record_lookup("weather", entry)
+    return entry
 
 def get_weather_cache(key: str) -> Optional[Any]:
     """Get cached weather data"""
-    return _get_from_redis(f"weather:{key}")
+    entry = get_weather_entry(key)
+    return entry.data if entry else None
 
 def set_weather_cache(key: str, data: Any) -> None:
     """Store weather data in cache"""
-    _set_in_redis(f"weather:{key}", data, WEATHER_CACHE_TTL)
+    _set_in_redis(f"weather:{key}", _wrap(data), WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL)
+
+# Async variants (used by the services; never block the event loop on Redis)
+
+async def aget_geocoding_entry(key: str, l1: bool = True) -> Optional[CacheEntry]:
+    """Get cached geocoding results with their age (l1=False: skip the per-process copy)"""
+    raw = await _aget_from_redis(f"geo:{key}", GEOCODING_CACHE_TTL, l1)
+    entry = _to_geocoding_entry(_to_entry(raw, GEOCODING_CACHE_TTL, GEOCODING_CACHE_STALE_TTL))
+    _record_lookup("geo", entry)
+    return entry
+
+async def aget_geocoding_cache(key: str) -> Optional[List[City]]:
+    """Get cached geocoding results"""
+    entry = await aget_geocoding_entry(key)
+    return entry.data if entry else None
+
+async def aset_geocoding_cache(key: str, cities: List[City]) -> CacheEntry:
+    """Store geocoding results in cache; returns the entry as written"""
+    envelope = _wrap([city.model_dump() for city in cities])
+    await _aset_in_redis(f"geo:{key}", envelope, GEOCODING_CACHE_TTL + GEOCODING_CACHE_STALE_TTL)
+    return CacheEntry(data=cities, stored_at=envelope["stored_at"], ttl=GEOCODING_CACHE_TTL)
+
+async def aget_weather_entry(key: str, l1: bool = True) -> Optional[CacheEntry]:
+    """Get cached weather data with its age (l1=False: skip the per-process copy)"""
+    raw = await _aget_from_redis(f"weather:{key}", WEATHER_CACHE_TTL, l1)
+    entry = _to_entry(raw, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL)
+    entry = entry if entry and entry.data else None
+    _record_lookup("weather", entry)
+    return entry
+
+async def aget_weather_cache(key: str) -> Optional[Any]:
+    """Get cached weather data"""
+    entry = await aget_weather_entry(key)
+    return entry.data if entry else None
+
+async def aset_weather_cache(key: str, data: Any) -> CacheEntry:
+    """Store weather data in cache; returns the entry as written"""
+    envelope = _wrap(data)
+    await _aset_in_redis(f"weather:{key}", envelope, WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL)
+    return CacheEntry(data=data, stored_at=envelope["stored_at"], ttl=WEATHER_CACHE_TTL)
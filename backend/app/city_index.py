@@ -0,0 +1,319 @@
+import bisect
+import csv
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import numpy as np
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from .schemas import City
+from .logger import logger
+
+# Offline municipality index
+# All IBGE municipalities loaded once from a bundled CSV and searched in
+# memory: accent-insensitive prefix matching on the name and on each word
+# ("preto" finds Ribeirão Preto), results ranked by population. Names the
+# index does not know go to the remote geocoding API; trigram similarity is
+# only a typo-tolerant last resort when that lookup fails or finds nothing
+# (a near miss like "rio pardo" -> "Rio Preto" is a different city).
+
+CITY_INDEX_ENABLED = os.getenv("CITY_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+CITY_INDEX_PATH = os.getenv("CITY_INDEX_PATH", str(Path(__file__).parent / "data" / "municipios_br.csv"))
+CITY_INDEX_FUZZY_MIN_SCORE = float(os.getenv("CITY_INDEX_FUZZY_MIN_SCORE", "0.4"))
+CITY_INDEX_LIMIT = 10
+# Reverse lookups: grid cell size (degrees) and the farthest municipality seat
+# accepted; past it a point gets no locality rather than a far-away town
+CITY_GRID_CELL_DEGREES = float(os.getenv("CITY_GRID_CELL_DEGREES", "0.5"))
+REVERSE_GEOCODING_MAX_DISTANCE_KM = float(os.getenv("REVERSE_GEOCODING_MAX_DISTANCE_KM", "50"))
+EARTH_RADIUS_KM = 6371.0
+
+# UF -> (state name, default timezone, IBGE state code)
+STATES: Dict[str, Tuple[str, str, int]] = {
+    "RO": ("Rondônia", "America/Porto_Velho", 11),
+    "AC": ("Acre", "America/Rio_Branco", 12),
+    "AM": ("Amazonas", "America/Manaus", 13),
+    "RR": ("Roraima", "America/Boa_Vista", 14),
+    "PA": ("Pará", "America/Belem", 15),
+    "AP": ("Amapá", "America/Belem", 16),
+    "TO": ("Tocantins", "America/Araguaina", 17),
+    "MA": ("Maranhão", "America/Fortaleza", 21),
+    "PI": ("Piauí", "America/Fortaleza", 22),
+    "CE": ("Ceará", "America/Fortaleza", 23),
+    "RN": ("Rio Grande do Norte", "America/Fortaleza", 24),
+    "PB": ("Paraíba", "America/Fortaleza", 25),
+    "PE": ("Pernambuco", "America/Recife", 26),
+    "AL": ("Alagoas", "America/Maceio", 27),
+    "SE": ("Sergipe", "America/Maceio", 28),
+    "BA": ("Bahia", "America/Bahia", 29),
+    "MG": ("Minas Gerais", "America/Sao_Paulo", 31),
+    "ES": ("Espírito Santo", "America/Sao_Paulo", 32),
+    "RJ": ("Rio de Janeiro", "America/Sao_Paulo", 33),
+    "SP": ("São Paulo", "America/Sao_Paulo", 35),
+    "PR": ("Paraná", "America/Sao_Paulo", 41),
+    "SC": ("Santa Catarina", "America/Sao_Paulo", 42),
+    "RS": ("Rio Grande do Sul", "America/Sao_Paulo", 43),
+    "MS": ("Mato Grosso do Sul", "America/Campo_Grande", 50),
+    "MT": ("Mato Grosso", "America/Cuiaba", 51),
+    "GO": ("Goiás", "America/Sao_Paulo", 52),
+    "DF": ("Distrito Federal", "America/Sao_Paulo", 53),
+}
+_UF_BY_CODE = {code: uf for uf, (_name, _tz, code) in STATES.items()}
+
+
+class NearestCity(NamedTuple):
+    city: City
+    uf: str
+    distance_km: float
+
+
+def normalize_key(text: str) -> str:
+    """Lowercase, accent-free, punctuation collapsed to single spaces"""
+    # The geocoding service imports this module, so import its helper lazily
+    from .services.geocoding import normalize_city_name
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", normalize_city_name(text).lower()).split())
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CityIndex:
+    def __init__(self, rows: List[Dict[str, str]]):
+        self.names: List[str] = []
+        self.ufs: List[str] = []
+        self.timezones: List[str] = []
+        self.keys: List[str] = []
+        latitudes, longitudes, populations = [], [], []
+
+        for row in rows:
+            uf = row["uf"]
+            self.names.append(row["name"])
+            self.ufs.append(uf)
+            self.timezones.append(row.get("timezone") or STATES[uf][1])
+            self.keys.append(normalize_key(row["name"]))
+            latitudes.append(float(row["latitude"]))
+            longitudes.append(float(row["longitude"]))
+            populations.append(int(float(row.get("population") or 0)))
+
+        self.latitudes = np.array(latitudes, dtype=np.float64)
+        self.longitudes = np.array(longitudes, dtype=np.float64)
+        self.populations = np.array(populations, dtype=np.int64)
+        self.loaded_at = time.time()
+        # Identifies the index contents (HTTP validators): the same in every worker
+        self.version = hashlib.blake2b(
+            "\n".join(f"{n}|{u}|{tz}" for n, u, tz in zip(self.names, self.ufs, self.timezones)).encode()
+            + self.latitudes.tobytes() + self.longitudes.tobytes() + self.populations.tobytes(),
+            digest_size=12,
+        ).hexdigest()
+        # Last-Modified of results: the data file's mtime when loaded from one
+        self.modified_at: Optional[float] = None
+
+        # Sorted suffixes starting at each word: bisect finds every name with a
+        # word that starts with the query
+        suffixes = []
+        for i, key in enumerate(self.keys):
+            for match in re.finditer(r"\S+", key):
+                suffixes.append((key[match.start():], i))
+        suffixes.sort()
+        self._suffixes = [s for s, _ in suffixes]
+        self._suffix_ids = [i for _, i in suffixes]
+
+        postings = defaultdict(list)
+        self._gram_counts = np.zeros(len(self.keys), dtype=np.int32)
+        for i, key in enumerate(self.keys):
+            grams = _trigrams(key)
+            self._gram_counts[i] = len(grams)
+            for gram in grams:
+                postings[gram].append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        # Uniform lat/lon grid for nearest-municipality lookups
+        cells = defaultdict(list)
+        for i, (lat, lon) in enumerate(zip(latitudes, longitudes)):
+            cells[self._cell(lat, lon)].append(i)
+        self._cells = {cell: np.array(ids, dtype=np.int32) for cell, ids in cells.items()}
+        self._max_ring = self._ring_bound()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def city(self, i: int) -> City:
+        uf = self.ufs[i]
+        admin1 = STATES[uf][0]
+        return City(
+            name=self.names[i],
+            admin1=admin1,
+            country="Brasil",
+            latitude=float(self.latitudes[i]),
+            longitude=float(self.longitudes[i]),
+            timezone=self.timezones[i],
+            label=f"{self.names[i]} - {admin1} - Brasil",
+        )
+
+    def search(self, query: str, limit: int = CITY_INDEX_LIMIT) -> List[City]:
+        """Best matches for a (partial) city name, optionally suffixed with a UF ("campo grande ms")"""
+        key = normalize_key(query)
+        if not key:
+            return []
+        ids = self._prefix_matches(key, None)
+        head, _, tail = key.rpartition(" ")
+        uf = tail.upper() if head and tail.upper() in STATES else None
+        # "ribeirao pr" is a name prefix; only read a trailing UF when it is not
+        if not ids and uf:
+            ids = self._prefix_matches(head, uf)
+        return [self.city(i) for i in ids[:limit]]
+
+    def fuzzy_search(self, query: str, limit: int = CITY_INDEX_LIMIT) -> List[City]:
+        """Typo-tolerant matches by trigram similarity (fallback when nothing else matched)"""
+        key = normalize_key(query)
+        if not key:
+            return []
+        head, _, tail = key.rpartition(" ")
+        uf = tail.upper() if head and tail.upper() in STATES else None
+        ids = self._fuzzy_matches(head, uf) if uf else []
+        if not ids:
+            ids = self._fuzzy_matches(key, None)
+        return [self.city(i) for i in ids[:limit]]
+
+    def _prefix_matches(self, key: str, uf: Optional[str]) -> List[int]:
+        start = bisect.bisect_left(self._suffixes, key)
+        ids = set()
+        for pos in range(start, len(self._suffixes)):
+            if not self._suffixes[pos].startswith(key):
+                break
+            ids.add(self._suffix_ids[pos])
+        if uf:
+            ids = {i for i in ids if self.ufs[i] == uf}
+        # Names starting with the query first, then by population
+        return sorted(ids, key=lambda i: (not self.keys[i].startswith(key), -self.populations[i]))
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[NearestCity]:
+        """Nearest municipality to a point (grid search in growing rings of cells)"""
+        if not self._cells:
+            return None
+        row, col = self._cell(latitude, longitude)
+        best, best_km = -1, math.inf
+        cell_km = CITY_GRID_CELL_DEGREES * math.pi / 180 * EARTH_RADIUS_KM * math.cos(math.radians(min(abs(latitude), 89.0)))
+        for ring in range(self._max_ring + 1):
+            # Everything beyond this ring is at least (ring - 1) cells away
+            if best >= 0 and (ring - 1) * cell_km > best_km:
+                break
+            ids = [self._cells[c] for c in self._ring(row, col, ring) if c in self._cells]
+            if not ids:
+                continue
+            ids = np.concatenate(ids)
+            km = _haversine_km(latitude, longitude, self.latitudes[ids], self.longitudes[ids])
+            pos = int(np.argmin(km))
+            if km[pos] < best_km:
+                best, best_km = int(ids[pos]), float(km[pos])
+        if best < 0:
+            return None
+        return NearestCity(self.city(best), self.ufs[best], best_km)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / CITY_GRID_CELL_DEGREES), math.floor(longitude / CITY_GRID_CELL_DEGREES)
+
+    def _ring_bound(self) -> int:
+        if not self._cells:
+            return 0
+        rows = [r for r, _ in self._cells]
+        cols = [c for _, c in self._cells]
+        return max(max(rows) - min(rows), max(cols) - min(cols)) + 1
+
+    @staticmethod
+    def _ring(row: int, col: int, ring: int):
+        if ring == 0:
+            yield row, col
+            return
+        for dc in range(-ring, ring + 1):
+            yield row - ring, col + dc
+            yield row + ring, col + dc
+        for dr in range(-ring + 1, ring):
+            yield row + dr, col - ring
+            yield row + dr, col + ring
+
+    def _fuzzy_matches(self, key: str, uf: Optional[str]) -> List[int]:
+        grams = [self._postings[g] for g in _trigrams(key) if g in self._postings]
+        if not grams:
+            return []
+        shared = np.bincount(np.concatenate(grams), minlength=len(self.keys))
+        scores = shared / (len(_trigrams(key)) + self._gram_counts - shared)
+        candidates = np.nonzero(scores >= CITY_INDEX_FUZZY_MIN_SCORE)[0]
+        if uf:
+            candidates = np.array([i for i in candidates if self.ufs[i] == uf], dtype=np.int64)
+        order = np.lexsort((-self.populations[candidates], -scores[candidates]))
+        return candidates[order].tolist()
+
+
+def _haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    phi1, phi2 = math.radians(lat), np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lons) - math.radians(lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _read_rows(path: str) -> List[Dict[str, str]]:
+    """Rows from the bundled CSV or a full IBGE list (nome/codigo_uf/fuso_horario columns)"""
+    with open(path, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip() and not line.startswith("#")]
+    rows = []
+    for raw in csv.DictReader(lines):
+        uf = raw.get("uf") or _UF_BY_CODE.get(int(raw.get("codigo_uf") or 0))
+        if uf not in STATES:
+            continue
+        rows.append({
+            "name": raw.get("name") or raw["nome"],
+            "uf": uf,
+            "latitude": raw["latitude"],
+            "longitude": raw["longitude"],
+            "population": raw.get("population") or raw.get("populacao") or "0",
+            "timezone": raw.get("timezone") or raw.get("fuso_horario") or "",
+        })
+    return rows
+
+
+_index: Optional[CityIndex] = None
+_index_failed = False
+_index_lock = threading.Lock()
+
+
+def load_city_index(path: Optional[str] = None) -> CityIndex:
+    path = path or CITY_INDEX_PATH
+    index = CityIndex(_read_rows(path))
+    index.modified_at = os.path.getmtime(path)
+    logger.info(f"City index loaded: {len(index)} municipalities")
+    return index
+
+
+def get_city_index() -> Optional[CityIndex]:
+    """Shared index, loaded on first use (None when disabled or unreadable)"""
+    global _index, _index_failed
+    if not CITY_INDEX_ENABLED or _index_failed:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None and not _index_failed:
+                try:
+                    _index = load_city_index()
+                except (OSError, KeyError, ValueError) as e:
+                    # Don't retry on every keystroke; the remote API still works
+                    logger.error(f"Could not load city index from {CITY_INDEX_PATH}: {e}")
+                    _index_failed = True
+    return _index
+
+
+def nearest_city(latitude: float, longitude: float) -> Optional[NearestCity]:
+    """Nearest municipality seat within REVERSE_GEOCODING_MAX_DISTANCE_KM (None if farther or outside Brazil)"""
+    index = get_city_index()
+    if index is None:
+        return None
+    found = index.nearest(latitude, longitude)
+    if found is None or found.distance_km > REVERSE_GEOCODING_MAX_DISTANCE_KM:
+        return None
+    return found
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+from typing import Dict, List, NamedTuple, Optional
+
+# Soil water balance (FAO-56 root-zone depletion, single crop coefficient)
+# For every field the engine carries the root-zone depletion Dr (mm below
+# field capacity) from one day to the next:
+#     ETc = Ks * Kc(stage) * ET0
+#     Dr  = clip(Dr_prev - P + ETc, 0, TAW)      (rain beyond field capacity drains)
+# TAW is the field's available water capacity in the root zone; below the
+# readily available water RAW = p * TAW the cane is water stressed and Ks
+# drops linearly to 0 at TAW. All fields advance together as numpy arrays, so
+# a season for thousands of fields is one loop over days, not over fields.
+
+# Fraction of TAW the cane can use before stress (FAO-56 table 22, sugarcane)
+WATER_BALANCE_DEPLETION_FRACTION = float(os.getenv("WATER_BALANCE_DEPLETION_FRACTION", "0.65"))
+WATER_BALANCE_DEFAULT_AWC_MM = float(os.getenv("WATER_BALANCE_DEFAULT_AWC_MM", "100"))
+
+# Kc by days after planting/ratooning (FAO-56, sugarcane): initial,
+# development, mid-season and late-season stages; linear in between
+CANE_STAGES = (
+    # name, first day, Kc at that day
+    ("inicial", 0, 0.40),
+    ("desenvolvimento", 60, 0.40),
+    ("maximo_desenvolvimento", 150, 1.25),
+    ("maturacao", 300, 1.25),
+)
+CANE_KC_END = (360, 0.75)
+
+_KC_DAYS = np.array([day for _, day, _ in CANE_STAGES] + [CANE_KC_END[0]], dtype=np.float64)
+_KC_VALUES = np.array([kc for _, _, kc in CANE_STAGES] + [CANE_KC_END[1]], dtype=np.float64)
+_STAGE_STARTS = np.array([day for _, day, _ in CANE_STAGES], dtype=np.float64)
+STAGE_NAMES = [name for name, _, _ in CANE_STAGES]
+
+
+def crop_coefficient(days_after_planting: np.ndarray) -> np.ndarray:
+    """Kc for each field's crop age in days (flat after the last stage)"""
+    return np.interp(days_after_planting, _KC_DAYS, _KC_VALUES)
+
+
+def crop_stage(days_after_planting: np.ndarray) -> np.ndarray:
+    """Index into STAGE_NAMES for each crop age"""
+    return np.clip(np.searchsorted(_STAGE_STARTS, days_after_planting, side="right") - 1, 0, len(STAGE_NAMES) - 1)
+
+
+class BalanceState(NamedTuple):
+    """Per-field arrays: depletion (mm), last day applied, planting day, TAW (mm)"""
+    depletion: np.ndarray
+    as_of: np.ndarray
+    planted_on: np.ndarray
+    taw: np.ndarray
+
+
+def new_state(planted_on: np.ndarray, taw: np.ndarray, as_of: np.ndarray) -> BalanceState:
+    """Fields at field capacity (no depletion) at the end of `as_of`"""
+    n = len(taw)
+    return BalanceState(
+        np.zeros(n),
+        np.asarray(as_of, dtype="datetime64[D]"),
+        np.asarray(planted_on, dtype="datetime64[D]"),
+        np.asarray(taw, dtype=np.float64),
+    )
+
+
+def water_stress_coefficient(depletion: np.ndarray, taw: np.ndarray, p: float = WATER_BALANCE_DEPLETION_FRACTION) -> np.ndarray:
+    raw = p * taw
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ks = (taw - depletion) / ((1 - p) * taw)
+    return np.where(depletion <= raw, 1.0, np.clip(ks, 0.0, 1.0))
+
+
+def advance(state: BalanceState, start: np.datetime64, precipitation: np.ndarray, et0: np.ndarray,
+            through: Optional[np.ndarray] = None, p: float = WATER_BALANCE_DEPLETION_FRACTION) -> BalanceState:
+    """Apply daily rain and ET0 (arrays of shape (fields, days) starting at `start`).
+
+    A field only takes the days after its own as_of (and up to its `through`
+    day, if given), so fields at different points of their history can be
+    advanced together; NaN inputs count as 0.
+    """
+    precipitation = np.nan_to_num(np.asarray(precipitation, dtype=np.float64))
+    et0 = np.nan_to_num(np.asarray(et0, dtype=np.float64))
+    depletion = state.depletion.copy()
+    as_of = state.as_of.copy()
+    start = np.datetime64(start, "D")
+    for d in range(precipitation.shape[1]):
+        day = start + d
+        active = (day > as_of) & (day >= state.planted_on)
+        if through is not None:
+            active &= day <= through
+        if not active.any():
+            continue
+        age = (day - state.planted_on).astype(np.float64)
+        etc = water_stress_coefficient(depletion, state.taw, p) * crop_coefficient(age) * et0[:, d]
+        updated = np.clip(depletion - precipitation[:, d] + etc, 0.0, state.taw)
+        depletion = np.where(active, updated, depletion)
+        as_of = np.where(active, day, as_of)
+    return state._replace(depletion=depletion, as_of=as_of)
+
+
+def classify(state: BalanceState, p: float = WATER_BALANCE_DEPLETION_FRACTION) -> List[str]:
+    """Water status class per field, in the same vocabulary as the daily balance.
+
+    Boundaries are on relative depletion Dr/TAW: near field capacity, within
+    half of RAW, within RAW (no stress yet), halfway to TAW, beyond.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.where(state.taw > 0, state.depletion / state.taw, 0.0)
+    bins = np.array([0.05, p / 2, p, (1 + p) / 2])
+    names = np.array(["Excedente", "Neutro", "Déficit leve", "Déficit moderado", "Déficit severo"])
+    return names[np.searchsorted(bins, relative, side="right")].tolist()
+
+
+def summarize(state: BalanceState, day: Optional[np.datetime64] = None,
+              p: float = WATER_BALANCE_DEPLETION_FRACTION) -> List[Dict[str, object]]:
+    """Per-field result dicts (depletion, TAW/RAW, Kc, stage, Ks, class) as of each field's last day"""
+    day = state.as_of if day is None else np.datetime64(day, "D")
+    age = np.maximum((day - state.planted_on).astype(np.float64), 0)
+    kc = crop_coefficient(age)
+    stages = crop_stage(age)
+    ks = water_stress_coefficient(state.depletion, state.taw, p)
+    classes = classify(state, p)
+    as_of = np.broadcast_to(state.as_of, state.depletion.shape)
+    return [
+        {
+            "as_of": str(as_of[i]),
+            "soil_water_deficit_mm": round(float(state.depletion[i]), 1),
+            "taw_mm": round(float(state.taw[i]), 1),
+            "raw_mm": round(float(p * state.taw[i]), 1),
+            "relative_depletion": round(float(state.depletion[i] / state.taw[i]), 3) if state.taw[i] > 0 else None,
+            "crop_stage": STAGE_NAMES[stages[i]],
+            "crop_age_days": int(age[i]),
+            "kc": round(float(kc[i]), 3),
+            "ks": round(float(ks[i]), 3),
+            "soil_water_class": classes[i],
+        }
+        for i in range(len(state.depletion))
+    ]
@@ -0,0 +1,102 @@
+import math
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional
+
+# Columnar forecast arrays
+# One Open-Meteo time section (hourly or daily) held as a datetime64 time axis
+# plus one float64 array per variable (NaN for nulls). Lookups use binary
+# search and window statistics are vectorized, so long horizons and batches
+# do not pay a Python loop per hour per field.
+
+
+def _to_float_array(values: Any, length: int) -> np.ndarray:
+    if not isinstance(values, list):
+        return np.full(length, np.nan)
+    values = values[:length]
+    arr = np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(values))
+    if len(arr) < length:
+        arr = np.concatenate([arr, np.full(length - len(arr), np.nan)])
+    return arr
+
+
+def _parse_times(times: List[str]) -> np.ndarray:
+    try:
+        return np.array([t.replace("Z", "") for t in times], dtype="datetime64[m]")
+    except (ValueError, AttributeError):
+        return np.array([], dtype="datetime64[m]")
+
+
+def _value(v: float) -> Optional[float]:
+    return None if math.isnan(v) else float(v)
+
+
+class ForecastFrame:
+    def __init__(self, labels: List[str], times: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.labels = labels
+        self.times = times
+        self.columns = columns
+
+    @classmethod
+    def from_section(cls, section: Optional[Dict[str, Any]], variables: Iterable[str], limit: Optional[int] = None) -> "ForecastFrame":
+        """Build a frame from an Open-Meteo section ({"time": [...], "<var>": [...]})"""
+        section = section or {}
+        labels = list(section.get("time") or [])
+        if limit is not None:
+            labels = labels[:limit]
+        n = len(labels)
+        columns = {name: _to_float_array(section.get(name), n) for name in variables}
+        return cls(labels, _parse_times(labels), columns)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def column(self, name: str) -> np.ndarray:
+        arr = self.columns.get(name)
+        return arr if arr is not None else np.full(len(self), np.nan)
+
+    def index_at(self, when: Optional[str]) -> int:
+        """Index of the first row at or after `when` (0 if unknown or past the end)"""
+        if not when or len(self.times) != len(self.labels) or not len(self.labels):
+            return 0
+        try:
+            target = np.datetime64(when.replace("Z", ""), "m")
+        except ValueError:
+            return 0
+        idx = int(np.searchsorted(self.times, target, side="left"))
+        return idx if idx < len(self.labels) else 0
+
+    def window(self, start: int, stop: int) -> "ForecastFrame":
+        """Rows [start, stop) as array views"""
+        return ForecastFrame(
+            self.labels[start:stop],
+            self.times[start:stop],
+            {name: arr[start:stop] for name, arr in self.columns.items()},
+        )
+
+    def sum(self, name: str) -> Optional[float]:
+        arr = self.column(name)
+        if not len(arr) or np.isnan(arr).all():
+            return None
+        return float(np.nansum(arr))
+
+    def max(self, name: str) -> Optional[float]:
+        arr = self.column(name)
+        if not len(arr) or np.isnan(arr).all():
+            return None
+        return float(np.nanmax(arr))
+
+    def within(self, limits: Dict[str, float], missing: float = 0.0) -> np.ndarray:
+        """Per-row mask: every variable <= its limit (nulls count as `missing`)"""
+        mask = np.ones(len(self), dtype=bool)
+        for name, limit in limits.items():
+            mask &= np.nan_to_num(self.column(name), nan=missing) <= limit
+        return mask
+
+    def rows(self, label_field: str = "time") -> List[Dict[str, Any]]:
+        """Serialize as one dict per row (None for nulls)"""
+        names = list(self.columns)
+        values = [self.columns[name].tolist() for name in names]
+        return [
+            {label_field: label, **{name: _value(col[i]) for name, col in zip(names, values)}}
+            for i, label in enumerate(self.labels)
+        ]
@@ -0,0 +1,234 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .logger import logger
+
+# Weather history store
+# Past daily and hourly observations per cache grid cell in SQLite: one wide
+# table per resolution, clustered on (cell, date/time) (WITHOUT ROWID), so a
+# season for one cell is a single index range scan. Each row records where it
+# came from: "archive" rows are final, "forecast" rows (days too recent for the
+# archive) are provisional and count as missing once the archive has them.
+# Provisional rows written because the archive had no values yet carry the time
+# the archive was asked (checked_at), so callers can back off before asking again.
+# Dates and times are local to the cell's timezone, recorded in the cells table.
+# sqlite3 is blocking: the async service calls this through asyncio.to_thread,
+# and one connection is shared behind a lock.
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(tempfile.gettempdir(), "clima_manejo_history.sqlite3"))
+
+HISTORY_DAILY_VARIABLES = (
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "precipitation_sum",
+    "precipitation_hours",
+    "et0_fao_evapotranspiration",
+    "shortwave_radiation_sum",
+    "wind_speed_10m_max",
+    "wind_gusts_10m_max",
+)
+HISTORY_HOURLY_VARIABLES = (
+    "temperature_2m",
+    "relative_humidity_2m",
+    "precipitation",
+    "et0_fao_evapotranspiration",
+    "wind_speed_10m",
+    "wind_gusts_10m",
+)
+
+# table -> (time column, variables)
+_TABLES = {
+    "daily": ("date", HISTORY_DAILY_VARIABLES),
+    "hourly": ("time", HISTORY_HOURLY_VARIABLES),
+}
+# An hourly day counts as stored when it has this many rows
+_HOURS_PER_DAY = 24
+
+
+def date_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def missing_ranges(wanted: Sequence[date], present: Iterable[date]) -> List[Tuple[date, date]]:
+    """Contiguous (start, end) runs of `wanted` days that are not `present`"""
+    present = set(present)
+    ranges: List[Tuple[date, date]] = []
+    for day in wanted:
+        if day in present:
+            continue
+        if ranges and ranges[-1][1] == day - timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+class HistoryStore:
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for table, (time_column, variables) in _TABLES.items():
+                self._create_table(table, time_column, variables)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cells (cell TEXT PRIMARY KEY, timezone TEXT NOT NULL) WITHOUT ROWID"
+            )
+            # Running soil water balance per field (see services/water_balance.py)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS water_balance ("
+                "field_id TEXT PRIMARY KEY, signature TEXT NOT NULL, as_of TEXT NOT NULL, depletion REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+
+    def _create_table(self, table: str, time_column: str, variables: Sequence[str]) -> None:
+        columns = ", ".join(f"{name} REAL" for name in variables)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"cell TEXT NOT NULL, {time_column} TEXT NOT NULL, source TEXT NOT NULL, {columns}, "
+            f"PRIMARY KEY (cell, {time_column})) WITHOUT ROWID"
+        )
+        # Variables added after the table was created
+        existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        for name in (*variables, "checked_at"):
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} REAL")
+
+    def stored_days(self, cell: str, resolution: str, start: date, end: date, final_before: date,
+                    checked_after: Optional[float] = None) -> List[date]:
+        """Days in [start, end] already stored.
+
+        Provisional rows on or before final_before don't count, unless the archive
+        was checked for them at or after checked_after (a Unix timestamp).
+        """
+        params = (cell, start.isoformat(), end.isoformat(), final_before.isoformat(), checked_after)
+        if resolution == "daily":
+            sql = (
+                "SELECT date FROM daily WHERE cell = ? AND date BETWEEN ? AND ? "
+                "AND (source = 'archive' OR date > ? OR checked_at >= ?)"
+            )
+        else:
+            sql = (
+                "SELECT substr(time, 1, 10) AS day FROM hourly "
+                "WHERE cell = ? AND time >= ? AND time < ? || 'T99' "
+                "AND (source = 'archive' OR substr(time, 1, 10) > ? OR checked_at >= ?) "
+                f"GROUP BY day HAVING COUNT(*) >= {_HOURS_PER_DAY}"
+            )
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [date.fromisoformat(row[0]) for row in rows]
+
+    def write(self, cell: str, resolution: str, section: Dict[str, Any], source: str,
+              checked_at: Optional[float] = None) -> int:
+        """Upsert an Open-Meteo section ({"time": [...], "<var>": [...]}); returns rows written"""
+        time_column, variables = _TABLES[resolution]
+        times = section.get("time") or []
+        columns = [section.get(name) or [None] * len(times) for name in variables]
+        rows = [(cell, t, source, checked_at, *(col[i] if i < len(col) else None for col in columns)) for i, t in enumerate(times)]
+        placeholders = ", ".join("?" * (4 + len(variables)))
+        sql = (
+            f"INSERT OR REPLACE INTO {resolution} (cell, {time_column}, source, checked_at, {', '.join(variables)}) "
+            f"VALUES ({placeholders})"
+        )
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+        return len(rows)
+
+    def read(self, cell: str, resolution: str, start: date, end: date, variables: Sequence[str]) -> Dict[str, List[Any]]:
+        """Columns {"time": [...], "<var>": [...]} for [start, end], in time order"""
+        time_column, known = _TABLES[resolution]
+        unknown = [name for name in variables if name not in known]
+        if unknown:
+            raise ValueError(f"Unknown {resolution} history variable: {unknown[0]}")
+        selected = ", ".join((time_column, *variables))
+        if resolution == "daily":
+            where = "date BETWEEN ? AND ?"
+        else:
+            where = "time >= ? AND time < ? || 'T99'"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {selected} FROM {resolution} WHERE cell = ? AND {where} ORDER BY {time_column}",
+                (cell, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * (1 + len(variables))
+        return {"time": list(columns[0]), **{name: list(values) for name, values in zip(variables, columns[1:])}}
+
+    def cell_timezone(self, cell: str) -> Optional[str]:
+        """Timezone the cell's dates are local to, once known"""
+        with self._lock:
+            row = self._conn.execute("SELECT timezone FROM cells WHERE cell = ?", (cell,)).fetchone()
+        return row[0] if row else None
+
+    def set_cell_timezone(self, cell: str, timezone: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO cells (cell, timezone) VALUES (?, ?)", (cell, timezone))
+
+    def load_balance_states(self, field_ids: Sequence[str]) -> Dict[str, Tuple[str, str, float]]:
+        """{field_id: (signature, as_of, depletion)} for the stored fields among field_ids"""
+        states: Dict[str, Tuple[str, str, float]] = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(field_ids), 500):
+                chunk = list(field_ids[i:i + 500])
+                rows = self._conn.execute(
+                    f"SELECT field_id, signature, as_of, depletion FROM water_balance WHERE field_id IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                states.update((row[0], row[1:]) for row in rows)
+        return states
+
+    def save_balance_states(self, rows: Iterable[Tuple[str, str, str, float]]) -> None:
+        """Upsert (field_id, signature, as_of, depletion) rows"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO water_balance (field_id, signature, as_of, depletion) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def prune_balance_states(self, prefix: str, older_than: str, max_rows: int) -> int:
+        """Delete prefix* states whose as_of is before older_than, then the oldest beyond max_rows"""
+        # field_id range covering every id that starts with prefix
+        bounds = (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM water_balance WHERE field_id >= ? AND field_id < ? AND as_of < ?", (*bounds, older_than)
+            ).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM water_balance WHERE field_id IN ("
+                "SELECT field_id FROM water_balance WHERE field_id >= ? AND field_id < ? "
+                "ORDER BY as_of DESC LIMIT -1 OFFSET ?)",
+                (*bounds, max_rows),
+            ).rowcount
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Shared store at HISTORY_DB_PATH, opened on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore(HISTORY_DB_PATH)
+                logger.info(f"Weather history store at {HISTORY_DB_PATH}")
+    return _store
+
+
+def set_history_store(store: Optional[HistoryStore]) -> None:
+    """Replace the shared store (e.g. with a temporary database in tests)"""
+    global _store
+    _store = store
@@ -0,0 +1,80 @@
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from .response_cache import CachedResponse
+
+# HTTP caching validators
+# ETag/Last-Modified identify the cache entry a response was built from (not
+# the body bytes, whose meta.age_seconds changes on every rebuild), and
+# Cache-Control mirrors the entry's remaining soft TTL plus its stale window.
+# Browsers and the CDN can then revalidate with If-None-Match and get a 304.
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    # Weak: gzip and identity bodies of the same entry are equivalent, not byte-identical
+    return f'W/"{digest}"'
+
+
+def cache_headers(etag: str, stored_at: float, ttl: float, stale_ttl: float, now: Optional[float] = None,
+                  modified_at: Optional[float] = None) -> Dict[str, str]:
+    """Validators plus Cache-Control; freshness follows stored_at, Last-Modified modified_at (default stored_at)"""
+    now = time.time() if now is None else now
+    age = max(0.0, now - stored_at)
+    max_age = max(0, int(ttl - age))
+    stale_window = max(0, int(ttl + stale_ttl - max(age, ttl)))
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(stored_at if modified_at is None else modified_at, usegmt=True),
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={stale_window}",
+        "Vary": "Accept-Encoding",
+    }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified_since(if_modified_since: Optional[str], stored_at: float) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have one-second resolution
+    return int(stored_at) <= since
+
+
+def conditional_response(request: Request, cached: CachedResponse, ttl: float, stale_ttl: float) -> Response:
+    """Render `cached`, or a bodyless 304 when the client's copy is current"""
+    accept_encoding = request.headers.get("accept-encoding", "")
+    etag, stored_at = cached.etag, cached.stored_at
+    if etag is None or stored_at is None:
+        # Errors and upstream failures must not be reused by browsers or the CDN
+        return cached.render(accept_encoding, {"Cache-Control": "no-store"})
+
+    modified_at = stored_at if cached.modified_at is None else cached.modified_at
+    headers = cache_headers(etag, stored_at, ttl, stale_ttl, modified_at=modified_at)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        unchanged = etag_matches(if_none_match, etag)
+    else:
+        unchanged = not_modified_since(request.headers.get("if-modified-since"), modified_at)
+    if unchanged:
+        return Response(status_code=304, headers=headers)
+    return cached.render(accept_encoding, headers)
@@ -0,0 +1,85 @@
+import os
+import httpx
+from typing import Optional
+from .logger import logger
+
+# Upstream HTTP client
+# A single AsyncClient is shared by every service for the lifetime of the app so
+# TCP/TLS connections to Open-Meteo are kept alive and reused between requests.
+# It is created/closed by the FastAPI lifespan hook in main.py; if a service runs
+# before startup (tests, serverless cold paths) the client is created lazily.
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5.0"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Per-host read timeouts (seconds)
+OPEN_METEO_TIMEOUT = float(os.getenv("OPEN_METEO_TIMEOUT", "15.0"))
+GEOCODING_TIMEOUT = float(os.getenv("GEOCODING_TIMEOUT", "10.0"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build the pooled upstream client from environment settings"""
+    http2 = HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed. Using HTTP/1.1.")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPEN_METEO_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+def timeout_for(read_timeout: float) -> httpx.Timeout:
+    """Per-request timeout keeping the shared connect timeout"""
+    return httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared upstream client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+def set_http_client(client: Optional[httpx.AsyncClient]) -> None:
+    """Replace the shared client (e.g. with an httpx.MockTransport/respx stand-in in tests)"""
+    global _client
+    _client = client
+
+
+async def startup_http_client() -> None:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    logger.info(
+        f"Upstream HTTP client ready (max_connections={HTTP_MAX_CONNECTIONS}, "
+        f"keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS}, http2={HTTP2_ENABLED})"
+    )
+
+
+async def shutdown_http_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    logger.info("Upstream HTTP client closed")
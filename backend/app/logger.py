@@ -1,37 +1,184 @@
+import atexit
+import contextvars
 import logging
+import logging.handlers
 import json
+import os
+import queue
+import re
 import sys
+import threading
+import time
+import uuid
 from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Logging
+# JSON lines on stdout. With LOG_ASYNC (default) the calling thread only puts
+# the record on a bounded queue; a QueueListener thread formats and writes it,
+# so a slow sink never stalls the event loop. When the queue is full records
+# are dropped and counted (dropped_log_records, log_records_dropped_total).
+# Records logged with extra=SAMPLED are rate limited per call site: at most
+# LOG_SAMPLE_BURST per LOG_SAMPLE_WINDOW seconds, the next one reports how many
+# were suppressed. Every record carries the request_id of the request it was
+# logged from (X-Request-ID, or generated by RequestIdMiddleware).
+
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "10"))
+
+# Opt-in sampling for repetitive errors: logger.error(..., extra=SAMPLED)
+SAMPLED = {"sampled": True}
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
         log_record = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # Creation time, not format time: formatting may happen later on the listener thread
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
             "function": record.funcName,
         }
-        
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            log_record["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            log_record["suppressed"] = suppressed
+
         if record.exc_info:
             log_record["exception"] = self.formatException(record.exc_info)
-            
+
         return json.dumps(log_record)
 
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id (runs on the calling thread, where the context is)"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Let through LOG_SAMPLE_BURST SAMPLED records per call site and window"""
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, window: float = LOG_SAMPLE_WINDOW):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None or now - state[0] >= self.window:
+                # [window start, emitted, suppressed since last emitted]
+                suppressed = state[2] if state else 0
+                state = self._sites[site] = [now, 0, suppressed]
+            if state[1] >= self.burst:
+                state[2] += 1
+                return False
+            state[1] += 1
+            record.suppressed, state[2] = state[2], 0
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The base class formats here, on the caller's thread; only resolve
+        # the message so later mutation of the args can't change it
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def dropped_log_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+def shutdown_logging() -> None:
+    """Flush the queue and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def setup_logger(name: str = "clima_manejo_backend"):
+    global _queue_handler, _listener
     logger = logging.getLogger(name)
-    
+
     # Only add handler if not already added to avoid duplicates
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
         handler.setFormatter(JsonFormatter())
+        if LOG_ASYNC:
+            _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            _listener = logging.handlers.QueueListener(_queue_handler.queue, handler)
+            _listener.start()
+            atexit.register(shutdown_logging)
+            handler = _queue_handler
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(SamplingFilter())
         logger.addHandler(handler)
-        
+
         # Set level from env or default to INFO
-        import os
         level = os.getenv("LOG_LEVEL", "INFO").upper()
         logger.setLevel(getattr(logging, level, logging.INFO))
-    
+
     return logger
 
 logger = setup_logger()
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+class RequestIdMiddleware:
+    """ASGI middleware: take X-Request-ID (or generate one), expose it to logs and echo it back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
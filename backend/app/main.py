@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -5,9 +6,20 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
-from .routes import cities, weather, health
-from .logger import logger
-from .cache import redis_url, should_use_redis
+from .routes import cities, weather, health, alerts as alerts_route, metrics as metrics_route
+from . import metrics
+from .metrics import MetricsMiddleware
+from .logger import logger, RequestIdMiddleware
+from .cache import (
+    redis_url,
+    should_use_redis,
+    start_cache_invalidation_listener,
+    stop_cache_invalidation_listener,
+    close_async_redis,
+)
+from .http_client import startup_http_client, shutdown_http_client
+from .prewarm import start_prewarm_scheduler, stop_prewarm_scheduler
+from .alerts import start_alerts, stop_alerts
 
 # Rate Limiter Setup
 # If Redis is available (and valid), we use it as storage backend for distributed rate limiting.
@@ -20,15 +32,40 @@ limiter = Limiter(
     storage_uri=limiter_storage_uri
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Application starting up...")
+    logger.info(f"Rate Limiter storage: {limiter_storage_uri}")
+    await startup_http_client()
+    start_cache_invalidation_listener()
+    start_prewarm_scheduler()
+    start_alerts()
+    try:
+        yield
+    finally:
+        await stop_alerts()
+        await stop_prewarm_scheduler()
+        await stop_cache_invalidation_listener()
+        await close_async_redis()
+        await shutdown_http_client()
+        logger.info("Application shut down")
+
 app = FastAPI(
     title="Clima para Manejo API",
     description="API para consulta de dados climáticos para manejo de cana-de-açúcar",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Rate Limit Config
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+_rate_limit_rejections = metrics.rate_limit_rejections.labels()
+
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    _rate_limit_rejections.inc()
+    return _rate_limit_exceeded_handler(request, exc)
+
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
 
 # CORS middleware
@@ -40,15 +77,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so rate-limited and CORS-rejected requests are counted too
+if metrics.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+# Added last so the request id is set before anything else logs
+app.add_middleware(RequestIdMiddleware)
+
 # Include routes
 app.include_router(cities.router, prefix="/cities", tags=["cities"])
 app.include_router(weather.router, prefix="/weather", tags=["weather"])
 app.include_router(health.router, prefix="/health", tags=["health"])
-
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Application starting up...")
-    logger.info(f"Rate Limiter storage: {limiter_storage_uri}")
+app.include_router(alerts_route.router, prefix="/alerts", tags=["alerts"])
+if metrics.METRICS_ENABLED:
+    app.include_router(metrics_route.router, prefix="/metrics", tags=["metrics"])
 
 @app.get("/")
 async def root():
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Bounded in-process cache
+# LRU eviction with a per-entry TTL, capped by entry count and (optionally) an
+# approximate byte budget. Used as the cache backend when Redis is unavailable
+# and as the per-process L1 in front of Redis.
+
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at, _size = item
+            if expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds until key expires, or None if absent"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            remaining = item[1] - time.time()
+            return remaining if remaining > 0 else None
+
+    def set(self, key: str, value: Any, ttl: float, size: Optional[int] = None) -> None:
+        if ttl <= 0:
+            self.delete(key)
+            return
+        if size is None:
+            size = _estimate_size(value) if self.max_bytes else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.time() + ttl, size)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __contains__(self, key: str) -> bool:
+        return self.ttl(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _remove(self, key: str) -> None:
+        _value, _expires_at, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        # Least recently used entries sit at the front of the OrderedDict
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
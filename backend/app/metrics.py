@@ -0,0 +1,230 @@
+import bisect
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from starlette.routing import Match
+from .logger import dropped_log_records
+
+# In-process metrics (Prometheus text exposition format)
+# Deliberately tiny instead of a client library: children for known label
+# values are created once and kept by the instrumented modules, so recording
+# is an attribute increment (counters/gauges) or a bisect plus two increments
+# (histograms), with no dicts, tuples or strings built per request. Values are
+# per process; scrape every worker.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+def status_class(status_code: int) -> str:
+    return STATUS_CLASSES[min(max(status_code // 100, 1), 5) - 1]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Metrics backed by a function (unlabelled) are read at scrape time only
+        self.function = function
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.labels()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child for these label values (keep a reference on hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            self.labels().set(self.function())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            le = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        inf = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, inf)} {child.count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Application metrics
+
+http_requests = Counter("http_requests_total", "HTTP responses by route and status class", ("route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("route",))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+rate_limit_rejections = Counter("rate_limit_rejections_total", "Requests rejected by the rate limiter")
+
+upstream_responses = Counter("upstream_responses_total", "Open-Meteo responses by API and status class (error = no response)", ("api", "status"))
+upstream_request_duration = Histogram("upstream_request_duration_seconds", "Open-Meteo request latency by API", ("api",))
+
+cache_lookups = Counter("cache_lookups_total", "Cache lookups by namespace and result (hit, stale, miss)", ("namespace", "result"))
+redis_operation_duration = Histogram("redis_operation_duration_seconds", "Redis command latency", ("operation",), buckets=REDIS_BUCKETS)
+redis_errors = Counter("redis_errors_total", "Failed Redis commands", ("operation",))
+
+log_records_dropped = Counter("log_records_dropped_total", "Log records dropped because the log queue was full", function=dropped_log_records)
+
+alert_events = Counter("alert_events_total", "Alert state changes by rule and state (triggered, cleared)", ("rule", "state"))
+alert_deliveries = Counter("alert_deliveries_total", "Alert deliveries by sink and result (ok, error, dropped)", ("sink", "result"))
+alert_subscribers = Gauge("alert_subscribers", "Connected alert stream (SSE) clients")
+alert_evaluation_duration = Histogram("alert_evaluation_duration_seconds", "Duration of one alert evaluation run",
+                                      buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status class and in-flight count per route.
+
+    The label is the matched route template ("/weather/history"), so every
+    endpoint is covered without a hand-kept list; paths no route matches are
+    recorded as "other" so scanners can't blow up the label cardinality.
+    """
+
+    def __init__(self, app, routes: Sequence[Any]):
+        self.app = app
+        # The application's route list (filled in as routers are included)
+        self._routes = routes
+        self._bound = {}
+        self._in_flight = http_requests_in_flight.labels()
+
+    def _children(self, route: str):
+        bound = self._bound.get(route)
+        if bound is None:
+            statuses = {status: http_requests.labels(route, status) for status in STATUS_CLASSES}
+            bound = self._bound[route] = (http_request_duration.labels(route), statuses)
+        return bound
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")
+        if route is None:
+            # Answered before routing (rate limited, CORS preflight): match it here
+            route = next((r for r in self._routes if r.matches(scope)[0] != Match.NONE), None)
+            if route is None:
+                return "other"
+        return route.path.rstrip("/") or "/"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self._in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration, statuses = self._children(self._route(scope))
+            duration.observe(time.perf_counter() - started)
+            statuses[status_class(status_code)].inc()
+            self._in_flight.dec()
@@ -0,0 +1,243 @@
+import json
+import os
+import numpy as np
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from .forecast_frame import ForecastFrame
+from .logger import logger
+from .variable_map import VARIABLE_MAP
+
+# Operation windows from declarative rules
+# Each field operation (spraying, harvest, ...) is a list of threshold
+# conditions on hourly variables, named as in variable_map.py. The rule set is
+# compiled once: every distinct condition becomes one vectorized comparison,
+# and each operation is a row of a membership matrix, so evaluating all
+# operations over a multi-day hourly frame is a few numpy ops, and the windows
+# (runs of consecutive valid hours of at least min_hours) come out of one diff.
+# "checks" are the same conditions on current values (e.g. temp_ok_22_30).
+# OPERATION_RULES_PATH points to a JSON file with the same shape as
+# DEFAULT_RULES to replace the built-in rules.
+
+OPERATION_RULES_PATH = os.getenv("OPERATION_RULES_PATH", "")
+
+DEFAULT_RULES: Dict[str, Any] = {
+    # Drives derived.operation_window_ok (its lookahead from the current hour)
+    "default_operation": "pulverizacao",
+    "operations": {
+        "pulverizacao": {
+            "label": "Pulverização",
+            "min_hours": 3,
+            "lookahead_hours": 3,
+            "conditions": [
+                {"variable": "hourly_precipitation_probability", "op": "<=", "value": 20, "missing_ok": True},
+                {"variable": "hourly_wind_speed_10m", "op": "<=", "value": 12, "missing_ok": True},
+            ],
+        },
+        "colheita": {
+            "label": "Colheita",
+            "min_hours": 6,
+            "conditions": [
+                {"variable": "hourly_precipitation", "op": "<=", "value": 0.5},
+                {"variable": "hourly_precipitation_probability", "op": "<=", "value": 40},
+            ],
+        },
+        "plantio": {
+            "label": "Plantio",
+            "min_hours": 4,
+            "conditions": [
+                {"variable": "hourly_precipitation", "op": "<=", "value": 2},
+                {"variable": "hourly_wind_gusts_10m", "op": "<=", "value": 40},
+            ],
+        },
+        "adubacao": {
+            "label": "Adubação",
+            "min_hours": 3,
+            "conditions": [
+                {"variable": "hourly_precipitation", "op": "<=", "value": 0.2},
+                {"variable": "hourly_precipitation_probability", "op": "<=", "value": 30},
+                {"variable": "hourly_wind_speed_10m", "op": "<=", "value": 15},
+            ],
+        },
+    },
+    "checks": {
+        "temp_ok_22_30": [{"variable": "temperature_2m", "op": "between", "value": [22, 30]}],
+    },
+}
+
+_OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+class Condition(NamedTuple):
+    column: str  # Open-Meteo name within its section
+    op: str
+    value: Any
+    missing_ok: bool
+
+    def evaluate(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            if self.op == "between":
+                low, high = self.value
+                result = (values >= low) & (values <= high)
+            else:
+                result = _OPERATORS[self.op](values, self.value)
+        # Comparisons with NaN are False; nulls pass only when allowed
+        return result | np.isnan(values) if self.missing_ok else result
+
+
+class Operation(NamedTuple):
+    name: str
+    label: str
+    min_hours: int
+    lookahead_hours: int
+    conditions: Tuple[int, ...]  # indexes into RuleSet.conditions
+
+
+def _compile_condition(spec: Dict[str, Any], source: str) -> Condition:
+    variable = spec.get("variable")
+    entry = VARIABLE_MAP.get(variable)
+    if entry is None or entry["source"] != source:
+        raise ValueError(f"Unknown {source} variable in rule: {variable}")
+    op = spec.get("op")
+    value = spec.get("value")
+    if op == "between":
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise ValueError(f"'between' needs [low, high] for {variable}")
+        value = (float(value[0]), float(value[1]))
+    elif op in _OPERATORS:
+        value = float(value)
+    else:
+        raise ValueError(f"Unknown operator in rule for {variable}: {op}")
+    return Condition(entry["path"][1], op, value, bool(spec.get("missing_ok", False)))
+
+
+class RuleSet:
+    def __init__(self, config: Dict[str, Any]):
+        self.conditions: List[Condition] = []
+        index: Dict[Condition, int] = {}
+
+        def intern(condition: Condition) -> int:
+            if condition not in index:
+                index[condition] = len(self.conditions)
+                self.conditions.append(condition)
+            return index[condition]
+
+        self.operations: List[Operation] = []
+        for name, spec in (config.get("operations") or {}).items():
+            conditions = tuple(intern(_compile_condition(c, "hourly")) for c in spec.get("conditions", []))
+            if not conditions:
+                raise ValueError(f"Operation {name} has no conditions")
+            min_hours = int(spec.get("min_hours", 1))
+            self.operations.append(Operation(
+                name, spec.get("label", name), min_hours, int(spec.get("lookahead_hours", min_hours)), conditions,
+            ))
+        self.default_operation = config.get("default_operation")
+        if self.default_operation is not None and self.default_operation not in {op.name for op in self.operations}:
+            raise ValueError(f"default_operation {self.default_operation} is not an operation")
+
+        # Membership matrix: operation x condition
+        self._members = np.zeros((len(self.operations), len(self.conditions)), dtype=bool)
+        for i, operation in enumerate(self.operations):
+            self._members[i, list(operation.conditions)] = True
+        self._min_hours = np.array([op.min_hours for op in self.operations], dtype=np.int64)
+
+        self.checks: Dict[str, List[Condition]] = {
+            name: [_compile_condition(c, "current") for c in conditions]
+            for name, conditions in (config.get("checks") or {}).items()
+        }
+
+    @property
+    def hourly_variables(self) -> List[str]:
+        """Open-Meteo hourly variables the operations read"""
+        return list(dict.fromkeys(c.column for c in self.conditions))
+
+    def evaluable(self, available: Sequence[str]) -> np.ndarray:
+        """Per operation: all of its variables are in `available`"""
+        present = np.array([c.column in available for c in self.conditions], dtype=bool)
+        return ~(self._members & ~present).any(axis=1)
+
+    def evaluate(self, frame: ForecastFrame) -> np.ndarray:
+        """(operations, hours) mask of hours where every condition of the operation holds"""
+        if not self.conditions:
+            return np.zeros((len(self.operations), len(frame)), dtype=bool)
+        satisfied = np.stack([c.evaluate(frame.column(c.column)) for c in self.conditions])
+        # An hour is valid unless some member condition fails
+        failed = self._members[:, :, None] & ~satisfied[None, :, :]
+        return ~failed.any(axis=1)
+
+    def windows(self, frame: ForecastFrame, available: Optional[Sequence[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Every run of at least min_hours valid hours, per operation"""
+        mask = self.evaluate(frame)
+        n_ops, n_hours = mask.shape
+        padded = np.zeros((n_ops, n_hours + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        # Row-major nonzero: starts and ends pair up in order within each operation
+        start_ops, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        lengths = ends - starts
+        keep = lengths >= self._min_hours[start_ops]
+
+        evaluable = self.evaluable(frame.columns if available is None else available)
+        result: Dict[str, List[Dict[str, Any]]] = {op.name: [] for op, ok in zip(self.operations, evaluable) if ok}
+        times = frame.times if len(frame.times) == n_hours else None
+        for op_index, start, end, hours in zip(start_ops[keep], starts[keep], ends[keep], lengths[keep]):
+            operation = self.operations[op_index]
+            if operation.name not in result:
+                continue
+            end_label = str(times[end - 1] + np.timedelta64(1, "h")) if times is not None else frame.labels[end - 1]
+            result[operation.name].append({"start": frame.labels[start], "end": end_label, "hours": int(hours)})
+        return result
+
+    def operation_ok(self, frame: ForecastFrame, name: Optional[str] = None) -> Optional[bool]:
+        """Whether `name` (default operation) holds for its whole lookahead from the first row"""
+        name = name or self.default_operation
+        for i, operation in enumerate(self.operations):
+            if operation.name == name:
+                lookahead = frame.window(0, operation.lookahead_hours)
+                if not len(lookahead) or not self.evaluable(lookahead.columns)[i]:
+                    return None
+                return bool(self.evaluate(lookahead)[i].all())
+        return None
+
+    def check(self, name: str, current: Dict[str, Any]) -> Optional[bool]:
+        """Evaluate a current-value check; None when it doesn't exist or its variables weren't requested"""
+        conditions = self.checks.get(name)
+        if conditions is None or any(c.column not in current for c in conditions):
+            return None
+        return all(
+            bool(c.evaluate(np.array([np.nan if current[c.column] is None else current[c.column]], dtype=np.float64))[0])
+            for c in conditions
+        )
+
+
+def load_rules(path: str = OPERATION_RULES_PATH) -> RuleSet:
+    """Compile the rules file (or the built-in rules); a broken file falls back to the defaults"""
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return RuleSet(json.load(f))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.error(f"Could not load operation rules from {path}: {e}. Using built-in rules.")
+    return RuleSet(DEFAULT_RULES)
+
+
+_rules: Optional[RuleSet] = None
+
+
+def get_rules() -> RuleSet:
+    global _rules
+    if _rules is None:
+        _rules = load_rules()
+    return _rules
+
+
+def set_rules(rules: Optional[RuleSet]) -> None:
+    """Replace the compiled rules (tests, reloads)"""
+    global _rules
+    _rules = rules
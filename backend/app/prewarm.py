@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from . import cache
+from .cache import WEATHER_CACHE_TTL
+from .http_client import shutdown_http_client
+from .logger import logger, SAMPLED
+from .services.open_meteo import get_weather_data, build_selection
+from .spatial import snap_coordinates
+
+# Cache pre-warming
+# Refreshes the weather entries of a known watchlist (mills, farms) shortly
+# before they expire, so user requests for those points never pay the cold
+# upstream call. Runs as a background task in the API process
+# (PREWARM_ENABLED) or once per invocation from cron / a serverless scheduler:
+#
+#   python -m app.prewarm --watchlist watchlist.json
+#
+# Watchlist sources (merged, duplicates by grid cell removed):
+#   PREWARM_WATCHLIST_PATH  JSON list of {"latitude", "longitude", "days"?, "variables"?}
+#   PREWARM_WATCHLIST_KEY   Redis set of "lat,lon" or "lat,lon,days" members
+#
+# With Redis, the scheduler runs in every worker but each cycle is claimed
+# with a PREWARM_LOCK_KEY lock (set nx px) that expires after one interval, so
+# only one worker warms the shared cache per interval. Without Redis every
+# worker has its own cache and warms it.
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "false").lower() in ("1", "true", "yes")
+PREWARM_WATCHLIST_PATH = os.getenv("PREWARM_WATCHLIST_PATH", "")
+PREWARM_WATCHLIST_KEY = os.getenv("PREWARM_WATCHLIST_KEY", "prewarm:watchlist")
+# How often the scheduler wakes up, and how long before expiry an entry is refreshed
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "60"))
+PREWARM_LEAD_TIME = float(os.getenv("PREWARM_LEAD_TIME", "120"))
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "8"))
+# Each refresh starts after a random delay up to this many seconds
+PREWARM_JITTER = float(os.getenv("PREWARM_JITTER", "5"))
+PREWARM_LOCK_KEY = os.getenv("PREWARM_LOCK_KEY", "lock:prewarm")
+
+
+class WatchItem(NamedTuple):
+    latitude: float
+    longitude: float
+    days: int = 1
+    variables: Optional[Tuple[str, ...]] = None
+
+
+def _parse_member(member: str) -> WatchItem:
+    parts = [p.strip() for p in member.split(",")]
+    days = int(parts[2]) if len(parts) > 2 and parts[2] else 1
+    return WatchItem(float(parts[0]), float(parts[1]), days)
+
+
+def load_watchlist_file(path: str) -> List[WatchItem]:
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    items = []
+    for item in raw:
+        variables = item.get("variables")
+        items.append(WatchItem(
+            float(item["latitude"]),
+            float(item["longitude"]),
+            int(item.get("days", 1)),
+            tuple(variables) if variables else None,
+        ))
+    return items
+
+
+async def load_watchlist_redis(key: str) -> List[WatchItem]:
+    if cache.async_redis_client is None or not key:
+        return []
+    items = []
+    for member in await cache.async_redis_client.smembers(key):
+        try:
+            items.append(_parse_member(member))
+        except (ValueError, IndexError):
+            logger.warning(f"Skipping malformed prewarm member {member!r} in {key}")
+    return items
+
+
+async def load_watchlist(path: Optional[str] = None, key: Optional[str] = None) -> List[WatchItem]:
+    """Watchlist from the file and the Redis set, one item per grid cell and selection"""
+    path = PREWARM_WATCHLIST_PATH if path is None else path
+    key = PREWARM_WATCHLIST_KEY if key is None else key
+    items: List[WatchItem] = []
+    if path:
+        try:
+            items.extend(load_watchlist_file(path))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Could not read prewarm watchlist {path}: {e}")
+    try:
+        items.extend(await load_watchlist_redis(key))
+    except Exception as e:
+        logger.error(f"Could not read prewarm watchlist from Redis set {key}: {e}")
+
+    unique: Dict[Tuple[str, str], WatchItem] = {}
+    for item in items:
+        try:
+            selection_key = build_selection(item.days, item.variables).key
+        except ValueError as e:
+            logger.warning(f"Skipping prewarm item {item}: {e}")
+            continue
+        unique.setdefault((snap_coordinates(item.latitude, item.longitude).key, selection_key), item)
+    return list(unique.values())
+
+
+async def prewarm_once(
+    watchlist: Optional[List[WatchItem]] = None,
+    concurrency: int = PREWARM_CONCURRENCY,
+    jitter: float = PREWARM_JITTER,
+) -> Dict[str, Any]:
+    """Refresh every watchlist entry that expires within PREWARM_LEAD_TIME"""
+    if watchlist is None:
+        watchlist = await load_watchlist()
+    max_age = max(0.0, WEATHER_CACHE_TTL - PREWARM_LEAD_TIME)
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+
+    async def warm(item: WatchItem) -> bool:
+        # Jitter spreads the refreshes instead of bursting them at the upstream
+        if jitter > 0:
+            await asyncio.sleep(random.uniform(0, jitter))
+        async with semaphore:
+            try:
+                await get_weather_data(item.latitude, item.longitude, item.days, item.variables, max_age=max_age)
+                return True
+            except Exception as e:
+                logger.warning(f"Prewarm failed for {item.latitude},{item.longitude}: {e}", extra=SAMPLED)
+                return False
+
+    results = await asyncio.gather(*(warm(item) for item in watchlist))
+    stats = {
+        "locations": len(watchlist),
+        "ok": sum(results),
+        "failed": len(results) - sum(results),
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info(f"Prewarm run finished: {stats}")
+    return stats
+
+
+async def _claim_cycle(interval: float) -> bool:
+    """Whether this worker runs the current cycle (at most one worker per interval)"""
+    if cache.async_redis_client is None:
+        return True
+    try:
+        # Not released: the lock expiring is what opens the next cycle
+        acquired = await cache.async_redis_client.set(PREWARM_LOCK_KEY, uuid.uuid4().hex, nx=True, px=int(interval * 1000))
+    except Exception as e:
+        logger.error(f"Redis lock error: {e}")
+        return True
+    return bool(acquired)
+
+
+async def prewarm_cycle(interval: float = PREWARM_INTERVAL) -> Optional[Dict[str, Any]]:
+    """One scheduler cycle: a prewarm run, or None if another worker has this interval"""
+    if not await _claim_cycle(interval):
+        return None
+    return await prewarm_once()
+
+
+async def run_prewarm_scheduler(interval: float = PREWARM_INTERVAL) -> None:
+    while True:
+        try:
+            await prewarm_cycle(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Prewarm run failed: {e}", exc_info=True)
+        # +-10% so several workers don't wake up in lockstep
+        await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+
+_scheduler_task: Optional[asyncio.Task] = None
+
+
+def start_prewarm_scheduler() -> None:
+    """Start the background scheduler (no-op unless PREWARM_ENABLED)"""
+    global _scheduler_task
+    if not PREWARM_ENABLED or _scheduler_task is not None:
+        return
+    _scheduler_task = asyncio.create_task(run_prewarm_scheduler())
+    logger.info(f"Prewarm scheduler started (every {PREWARM_INTERVAL}s)")
+
+
+async def stop_prewarm_scheduler() -> None:
+    global _scheduler_task
+    if _scheduler_task is None:
+        return
+    _scheduler_task.cancel()
+    try:
+        await _scheduler_task
+    except asyncio.CancelledError:
+        pass
+    _scheduler_task = None
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        watchlist = await load_watchlist(args.watchlist, args.redis_key)
+        return await prewarm_once(watchlist, concurrency=args.concurrency, jitter=args.jitter)
+    finally:
+        await cache.close_async_redis()
+        await shutdown_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh cached forecasts for a watchlist of locations")
+    parser.add_argument("--watchlist", default=None, help="JSON watchlist file (default: PREWARM_WATCHLIST_PATH)")
+    parser.add_argument("--redis-key", default=None, help="Redis set with 'lat,lon' members (default: PREWARM_WATCHLIST_KEY)")
+    parser.add_argument("--concurrency", type=int, default=PREWARM_CONCURRENCY)
+    parser.add_argument("--jitter", type=float, default=PREWARM_JITTER)
+    stats = asyncio.run(_main(parser.parse_args()))
+    print(json.dumps(stats))
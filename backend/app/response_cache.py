@@ -0,0 +1,92 @@
+import gzip
+import os
+import time
+import orjson
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from fastapi.responses import Response
+from .memory_cache import MemoryCache
+
+# Precomputed response cache
+# Successful /weather responses are serialized once (orjson) and optionally
+# gzip-compressed, then kept as ready-to-send bytes keyed by the request
+# parameters. Hits skip the service layer, the City/WeatherResponse models and
+# response_model validation entirely. Entries never outlive the freshness of the
+# forecast they were built from, and are capped at RESPONSE_CACHE_MAX_TTL so
+# the meta.age_seconds baked into the body stays close to the truth.
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_TTL = float(os.getenv("RESPONSE_CACHE_MAX_TTL", "60"))
+RESPONSE_CACHE_GZIP = os.getenv("RESPONSE_CACHE_GZIP", "true").lower() in ("1", "true", "yes")
+# Bodies smaller than this are not worth compressing
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+
+
+class PrecomputedJSONResponse(Response):
+    """Sends already-serialized JSON bytes as-is"""
+    media_type = "application/json"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    gzip_body: Optional[bytes]
+    created_at: float
+    # Validators of the data the body was built from (see http_cache)
+    etag: Optional[str] = None
+    stored_at: Optional[float] = None
+    media_type: str = PrecomputedJSONResponse.media_type
+    # Last-Modified, when it differs from stored_at (e.g. the bundled city index)
+    modified_at: Optional[float] = None
+
+    def render(self, accept_encoding: str = "", headers: Optional[Dict[str, str]] = None) -> Response:
+        headers = {"Vary": "Accept-Encoding", **(headers or {})}
+        if self.gzip_body is not None and "gzip" in accept_encoding.lower():
+            return PrecomputedJSONResponse(self.gzip_body, headers={**headers, "Content-Encoding": "gzip"}, media_type=self.media_type)
+        return PrecomputedJSONResponse(self.body, headers=headers, media_type=self.media_type)
+
+
+_response_cache = MemoryCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def response_key(namespace: str, *parts: Any) -> str:
+    return namespace + "|" + "|".join("" if p is None else str(p) for p in parts)
+
+
+def serialize(payload: Any) -> bytes:
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def build_response(payload: Any, etag: Optional[str] = None, stored_at: Optional[float] = None,
+                   modified_at: Optional[float] = None) -> CachedResponse:
+    """Serialize (and compress, if large enough) a response payload once"""
+    return build_body_response(serialize(payload), etag, stored_at, modified_at=modified_at)
+
+
+def build_body_response(body: bytes, etag: Optional[str] = None, stored_at: Optional[float] = None,
+                        media_type: str = PrecomputedJSONResponse.media_type,
+                        modified_at: Optional[float] = None) -> CachedResponse:
+    """Cache-ready response for an already-encoded body (e.g. a binary grid tile)"""
+    gzip_body = None
+    if RESPONSE_CACHE_GZIP and len(body) >= RESPONSE_GZIP_MIN_BYTES:
+        gzip_body = gzip.compress(body, compresslevel=5)
+    return CachedResponse(body, gzip_body, time.time(), etag, stored_at, media_type, modified_at)
+
+
+def get_cached_response(key: str) -> Optional[CachedResponse]:
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    return _response_cache.get(key)
+
+
+def store_response(key: str, cached: CachedResponse, ttl: float) -> None:
+    if not RESPONSE_CACHE_ENABLED:
+        return
+    ttl = min(ttl, RESPONSE_CACHE_MAX_TTL)
+    size = len(cached.body) + len(cached.gzip_body or b"")
+    _response_cache.set(key, cached, ttl, size=size)
+
+
+def response_cache_stats() -> Dict[str, int]:
+    return _response_cache.stats()
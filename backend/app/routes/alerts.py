@@ -0,0 +1,31 @@
+from typing import Optional
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from .. import alerts
+
+router = APIRouter()
+
+@router.get("")
+async def get_active_alerts():
+    """Alerts currently active in this worker's evaluator"""
+    engine = alerts.get_engine()
+    return {
+        "enabled": alerts.ALERTS_ENABLED,
+        "hours": engine.hours,
+        "rules": [rule._asdict() for rule in engine.rules],
+        "active": engine.active_alerts(),
+        "subscribers": alerts.broker.subscribers,
+    }
+
+@router.get("/stream")
+async def stream_alerts(
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    since: Optional[int] = Query(None, description="Replay events after this id (same as Last-Event-ID)"),
+):
+    """Alert state changes as Server-Sent Events"""
+    subscription = alerts.broker.subscribe(last_event_id if last_event_id is not None else since)
+    return StreamingResponse(
+        alerts.sse_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import List
-from ..services.geocoding import search_cities
+from ..services.geocoding import lookup_cities
 from ..schemas import City
+from ..cache import GEOCODING_CACHE_TTL, GEOCODING_CACHE_STALE_TTL
+from ..response_cache import build_response
+from ..http_cache import make_etag, conditional_response
 
 router = APIRouter()
 
 @router.get("", response_model=List[City])
-async def get_cities(q: str = Query(..., description="City name to search for")):
+async def get_cities(request: Request, q: str = Query(..., description="City name to search for")):
     """Search cities by name with autocomplete"""
     if not q or len(q.strip()) < 2:
         raise HTTPException(status_code=400, detail="Query must be at least 2 characters long")
     
-    cities = await search_cities(q.strip())
-    return cities
\ No newline at end of file
+    result = await lookup_cities(q.strip())
+    etag = make_etag("cities", q.strip().lower(), result.version or result.stored_at) if result.stored_at else None
+    cached = build_response([city.model_dump() for city in result.cities], etag, result.stored_at, result.modified_at)
+    return conditional_response(request, cached, GEOCODING_CACHE_TTL, GEOCODING_CACHE_STALE_TTL)
@@ -1,8 +1,18 @@
 from fastapi import APIRouter
 from datetime import datetime
+from ..services.geocoding import geocoding_cache_stats
+from ..upstream import upstream_status
 
 router = APIRouter()
 
 @router.get("/")
 async def health_check():
-    return {"status": "ok", "service": "Clima para Manejo Backend"}
\ No newline at end of file
+    upstream = upstream_status()
+    # Still 200: stale cache keeps serving while an upstream circuit is open
+    degraded = any(c["state"] != "closed" for c in upstream["circuits"].values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "service": "Clima para Manejo Backend",
+        "upstream": upstream,
+        "cache": {"geocoding": geocoding_cache_stats()},
+    }
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..metrics import render_metrics
+
+router = APIRouter()
+
+@router.get("", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,33 +1,87 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
-from ..services.open_meteo import get_weather_data
+import json
+import os
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from ..cache import WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL
+from ..response_cache import response_key, get_cached_response, build_response, build_body_response, store_response
+from ..http_cache import make_etag, conditional_response
+from ..services.open_meteo import get_weather_data, get_weather_batch, build_selection, MAX_FORECAST_DAYS
 from ..services.geocoding import search_cities
-from ..schemas import WeatherResponse, City
+from ..services import grid, history
+from ..services.water_balance import FieldSpec, field_balances, point_balance
+from ..fao56 import WATER_BALANCE_DEFAULT_AWC_MM
+from ..city_index import nearest_city
+from ..schemas import WeatherResponse, City, WeatherBatchRequest, WeatherBatchItem, WaterBalanceRequest
 
 router = APIRouter()
 
+WEATHER_BATCH_MAX_LOCATIONS = int(os.getenv("WEATHER_BATCH_MAX_LOCATIONS", "1000"))
+WATER_BALANCE_MAX_FIELDS = int(os.getenv("WATER_BALANCE_MAX_FIELDS", "5000"))
+
 @router.get("", response_model=WeatherResponse)
 async def get_weather(
+    request: Request,
     city: str = Query(..., description="City name"),
     lat: Optional[float] = Query(None, description="Latitude"),
-    lon: Optional[float] = Query(None, description="Longitude")
+    lon: Optional[float] = Query(None, description="Longitude"),
+    days: int = Query(1, ge=1, le=MAX_FORECAST_DAYS, description="Forecast horizon in days"),
+    variables: Optional[str] = Query(None, description="Comma-separated variable names (default: all)"),
+    hours: Optional[int] = Query(None, ge=1, description="Hourly rows in next_hours (default: 6)"),
+    planted_on: Optional[date] = Query(None, description="Planting/ratoon date: adds the soil water balance to derived"),
+    awc_mm: Optional[float] = Query(None, gt=0, le=1000, description="Available water capacity of the root zone (mm)")
 ):
     """Get weather data for a specific city"""
     
+    variable_list = [v.strip() for v in variables.split(",")] if variables else None
+    try:
+        selection = build_selection(days, variable_list, hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Fast path: ready-to-send bytes from a previous identical request
+    key = response_key("weather", city.strip().lower(), lat, lon, selection.key, selection.hours, planted_on, awc_mm)
+    cached = get_cached_response(key)
+    if cached is None:
+        response = await _weather_response(city, lat, lon, days, variable_list, hours, planted_on, awc_mm)
+        etag = stored_at = None
+        meta = (response.data or {}).get("meta") or {}
+        if response.status == "ok" and meta.get("fetched_at"):
+            stored_at = datetime.fromisoformat(meta["fetched_at"]).timestamp()
+            etag = make_etag(key, meta["fetched_at"])
+        cached = build_response(response.model_dump(), etag, stored_at)
+        # A response waiting on a soil water backfill must not outlive it
+        if etag is not None and not meta.get("stale") and not meta.get("soil_water_pending"):
+            store_response(key, cached, WEATHER_CACHE_TTL - (meta.get("age_seconds") or 0))
+    return conditional_response(request, cached, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL)
+
+
+async def _weather_response(city: str, lat: Optional[float], lon: Optional[float], days: int,
+                            variable_list: Optional[List[str]], hours: Optional[int],
+                            planted_on: Optional[date] = None, awc_mm: Optional[float] = None) -> WeatherResponse:
+    """Resolve the location and build the /weather response model"""
     # If lat/lon provided, use them directly
     if lat is not None and lon is not None:
         try:
-            weather_data = await get_weather_data(lat, lon)
+            weather_data = await get_weather_data(lat, lon, days, variable_list, hours)
+            if planted_on is not None:
+                await _add_soil_water(weather_data, lat, lon, planted_on, awc_mm)
             
-            # Create a city object for the response
+            # Create a city object for the response; state and timezone come from
+            # the nearest municipality (offline spatial index, no network call).
+            # Far from any seat, keep the timezone Open-Meteo resolved for the point
+            nearest = nearest_city(lat, lon)
+            admin1 = nearest.city.admin1 if nearest else ""
+            forecast_timezone = weather_data.get("meta", {}).get("timezone") or "America/Sao_Paulo"
             city_obj = City(
                 name=city,
-                admin1="",
+                admin1=admin1,
                 country="Brasil",
                 latitude=lat,
                 longitude=lon,
-                timezone="America/Sao_Paulo",
-                label=f"{city} - Brasil"
+                timezone=nearest.city.timezone if nearest else forecast_timezone,
+                label=f"{city} - {admin1} - Brasil" if admin1 else f"{city} - Brasil"
             )
             
             return WeatherResponse(
@@ -63,7 +117,9 @@ async def get_weather(
     city_obj = cities[0]
     
     try:
-        weather_data = await get_weather_data(city_obj.latitude, city_obj.longitude)
+        weather_data = await get_weather_data(city_obj.latitude, city_obj.longitude, days, variable_list, hours)
+        if planted_on is not None:
+            await _add_soil_water(weather_data, city_obj.latitude, city_obj.longitude, planted_on, awc_mm)
         
         return WeatherResponse(
             status="ok",
@@ -76,4 +132,115 @@ async def get_weather(
         return WeatherResponse(
             status="not_found",
             message=f"Error fetching weather data: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+async def _add_soil_water(weather_data: dict, lat: float, lon: float, planted_on: date, awc_mm: Optional[float]) -> None:
+    """Classify water status from the running soil balance instead of today's P - ET0"""
+    balance = await point_balance(lat, lon, planted_on, awc_mm)
+    if balance is None:
+        return
+    if balance.get("pending"):
+        # Season backfill still running: the next request gets the balance
+        weather_data["meta"]["soil_water_pending"] = True
+        return
+    derived = weather_data["derived"]
+    derived["soil_water_deficit_mm"] = balance["soil_water_deficit_mm"]
+    derived["soil_water_class"] = balance["soil_water_class"]
+    derived["water_balance_class"] = balance["soil_water_class"]
+
+@router.post("/batch")
+async def get_weather_batch_route(request: WeatherBatchRequest):
+    """Get weather data for many locations as a stream of NDJSON lines (one per location)"""
+    locations = request.locations
+    if not locations:
+        raise HTTPException(status_code=400, detail="At least one location is required")
+    if len(locations) > WEATHER_BATCH_MAX_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {WEATHER_BATCH_MAX_LOCATIONS} locations per request")
+    try:
+        selection = build_selection(request.days, request.variables, request.hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        async for index, outcome in get_weather_batch([(loc.latitude, loc.longitude) for loc in locations], selection):
+            loc = locations[index]
+            item = WeatherBatchItem(
+                index=index,
+                id=loc.id,
+                latitude=loc.latitude,
+                longitude=loc.longitude,
+                **outcome
+            )
+            yield json.dumps(item.model_dump(), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/history")
+async def get_weather_history(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude"),
+    start: Optional[date] = Query(None, description="First day (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Last day (default and maximum: yesterday)"),
+    resolution: str = Query("daily", description="daily or hourly"),
+    variables: Optional[str] = Query(None, description="Comma-separated variable names (default: all stored)"),
+):
+    """Past observations for a location, backfilled from the Open-Meteo archive on demand"""
+    end = end or history.today() - timedelta(days=1)
+    start = start or end - timedelta(days=29)
+    variable_list = [v.strip() for v in variables.split(",") if v.strip()] if variables else None
+    try:
+        return await history.get_history(lat, lon, start, end, resolution, variable_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/water-balance")
+async def get_water_balance(request: WaterBalanceRequest):
+    """Soil water balance (root-zone deficit, crop stage, stress class) for many fields"""
+    if not request.fields:
+        raise HTTPException(status_code=400, detail="At least one field is required")
+    if len(request.fields) > WATER_BALANCE_MAX_FIELDS:
+        raise HTTPException(status_code=400, detail=f"At most {WATER_BALANCE_MAX_FIELDS} fields per request")
+    if len({f.id for f in request.fields}) != len(request.fields):
+        raise HTTPException(status_code=400, detail="Field ids must be unique")
+    fields = [
+        FieldSpec(f.id, f.latitude, f.longitude, f.planted_on,
+                  awc_mm=WATER_BALANCE_DEFAULT_AWC_MM if f.awc_mm is None else f.awc_mm)
+        for f in request.fields
+    ]
+    return {"fields": await field_balances(fields)}
+
+@router.get("/grid")
+async def get_weather_grid(
+    request: Request,
+    bbox: str = Query(..., description="west,south,east,north in degrees"),
+    resolution: Optional[float] = Query(None, gt=0, le=10, description="Node spacing in degrees (default: the cache grid)"),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Web-map zoom level; picks the resolution when none is given"),
+    variables: Optional[str] = Query(None, description="Comma-separated hourly variable names"),
+    hours: int = Query(grid.DEFAULT_GRID_HOURS, ge=1, description="Hourly time steps from the current hour"),
+    format: str = Query("json", description="json or binary"),
+):
+    """Hourly forecast grid over a bounding box, as compact JSON or a binary float32 tile"""
+    if format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'binary'")
+    variable_list = [v.strip() for v in variables.split(",") if v.strip()] if variables else None
+    try:
+        spec = grid.grid_spec([v for v in bbox.split(",")], resolution, zoom, variable_list, hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    start = grid.current_hour()
+    key = response_key("grid", spec.key, start, format)
+    cached = get_cached_response(key)
+    if cached is None:
+        tile = await grid.get_grid(spec, start)
+        etag = stored_at = None
+        if not tile.missing_points:
+            stored_at = tile.stored_at
+            etag = make_etag(key, stored_at)
+        if format == "binary":
+            cached = build_body_response(tile.to_bytes(), etag, stored_at, grid.BINARY_MEDIA_TYPE)
+        else:
+            cached = build_response(tile.to_json(), etag, stored_at)
+        if etag is not None:
+            store_response(key, cached, WEATHER_CACHE_TTL - (datetime.now().timestamp() - stored_at))
+    return conditional_response(request, cached, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL)
@@ -1,5 +1,6 @@
-from typing import List, Optional, Literal
-from pydantic import BaseModel
+from datetime import date
+from typing import Dict, List, Optional, Literal
+from pydantic import BaseModel, Field
 
 class City(BaseModel):
     name: str
@@ -52,13 +53,55 @@ class WeatherDerived(BaseModel):
     water_balance_class: Optional[str] = None
     operation_window_ok: Optional[bool] = None
     temp_ok_22_30: Optional[bool] = None
+    precipitation_next_hours_mm: Optional[float] = None
+    wind_gusts_max_next_hours: Optional[float] = None
+    # Every window per operation from the current hour on: {operation: [{start, end, hours}]}
+    operation_windows: Optional[Dict[str, List[dict]]] = None
+    # Running root-zone balance (only when the field's planting date is given)
+    soil_water_deficit_mm: Optional[float] = None
+    soil_water_class: Optional[str] = None
 
 class Meta(BaseModel):
     timezone: Optional[str] = None
     units: Optional[dict] = None
+    fetched_at: Optional[str] = None
+    age_seconds: Optional[float] = None
+    stale: Optional[bool] = None
+    grid: Optional[dict] = None
+    forecast_days: Optional[int] = None
 
 class WeatherResponse(BaseModel):
     status: Literal["ok", "ambiguous", "not_found"]
     data: Optional[dict] = None
     candidates: Optional[List[City]] = None
     message: Optional[str] = None
+
+class BatchLocation(BaseModel):
+    id: Optional[str] = None
+    latitude: float
+    longitude: float
+
+class WeatherBatchRequest(BaseModel):
+    locations: List[BatchLocation]
+    days: int = 1
+    variables: Optional[List[str]] = None
+    hours: Optional[int] = None
+
+class WeatherBatchItem(BaseModel):
+    index: int
+    id: Optional[str] = None
+    latitude: float
+    longitude: float
+    status: Literal["ok", "not_found"]
+    data: Optional[dict] = None
+    message: Optional[str] = None
+
+class WaterBalanceField(BaseModel):
+    id: str
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    planted_on: date
+    awc_mm: Optional[float] = Field(None, gt=0, le=1000)
+
+class WaterBalanceRequest(BaseModel):
+    fields: List[WaterBalanceField]
@@ -1,64 +1,194 @@
 import httpx
 import unicodedata
 import os
-from typing import List, Optional
+import time
+import bisect
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from ..schemas import City
-from ..cache import get_geocoding_cache, set_geocoding_cache
-from ..logger import logger
+from ..cache import aget_geocoding_entry, aset_geocoding_cache, CacheEntry, CACHE_SWR_ENABLED, GEOCODING_CACHE_TTL
+from ..city_index import get_city_index, normalize_key
+from ..http_client import timeout_for, GEOCODING_TIMEOUT
+from ..upstream import upstream_get
+from ..logger import logger, SAMPLED
+from ..singleflight import geocoding_flight
+from ..memory_cache import MemoryCache
+
+# Results requested per upstream query; fewer raw results means the list is complete
+GEOCODING_RESULT_COUNT = 10
+
+# Prefix-aware cache
+# Autocomplete sends every keystroke ("rib", "ribe", ... "ribeirao preto"). When
+# the upstream answer for a prefix is complete (fewer than GEOCODING_RESULT_COUNT
+# raw results), every longer query is a subset of it, so it is answered by
+# filtering that list locally instead of calling the API again. Open-Meteo only
+# returns exact name matches for 1-2 character queries, so those short answers
+# are never treated as complete prefix sets.
+GEOCODING_PREFIX_CACHE_ENABLED = os.getenv("GEOCODING_PREFIX_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+GEOCODING_PREFIX_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODING_PREFIX_CACHE_MAX_ENTRIES", "1024"))
+GEOCODING_PREFIX_MIN_LENGTH = 3
+
+class PrefixResults(NamedTuple):
+    """A complete upstream result set, sorted by normalized name for prefix filtering"""
+    keys: List[str]
+    cities: List[Tuple[int, City]]  # (upstream rank, city), same order as keys
+    stored_at: float
+
+    @classmethod
+    def build(cls, cities: List[City], stored_at: float) -> "PrefixResults":
+        ranked = sorted((normalize_key(city.name), rank, city) for rank, city in enumerate(cities))
+        return cls([key for key, _, _ in ranked], [(rank, city) for _, rank, city in ranked], stored_at)
+
+    def filter(self, query_key: str) -> List[City]:
+        lo = bisect.bisect_left(self.keys, query_key)
+        hi = bisect.bisect_left(self.keys, query_key + "\uffff")
+        # Back to upstream relevance order
+        return [city for _, city in sorted(self.cities[lo:hi], key=lambda item: item[0])]
+
+_prefix_cache = MemoryCache(max_entries=GEOCODING_PREFIX_CACHE_MAX_ENTRIES)
+_prefix_stats: Dict[str, int] = {"local_index_hits": 0, "exact_hits": 0, "prefix_hits": 0, "fuzzy_hits": 0, "upstream_calls": 0}
+
+class CitySearch(NamedTuple):
+    cities: List[City]
+    # When the list was fetched from upstream (None if the lookup failed)
+    stored_at: Optional[float]
+    stale: bool = False
+    # Local index results: content version (ETag) and data file mtime (Last-Modified)
+    version: Optional[str] = None
+    modified_at: Optional[float] = None
 
 async def search_cities(query: str) -> List[City]:
     """Search cities using Open-Meteo Geocoding API"""
-    
+    return (await lookup_cities(query)).cities
+
+async def lookup_cities(query: str) -> CitySearch:
+    """search_cities plus the age of the cached list (for HTTP validators)"""
+
+    # Offline municipality index first; names it doesn't know go to the remote API
+    index = get_city_index()
+    if index is not None:
+        cities = index.search(query)
+        if cities:
+            _prefix_stats["local_index_hits"] += 1
+            # Local results never go stale: freshness restarts with each TTL window
+            # (aligned to the epoch, so every worker agrees) and the validators
+            # come from the index contents, so revalidation keeps matching
+            window_start = time.time() // GEOCODING_CACHE_TTL * GEOCODING_CACHE_TTL
+            return CitySearch(cities, window_start, version=index.version,
+                              modified_at=index.modified_at or index.loaded_at)
+
+    result = await _remote_lookup(query)
+    # Typo-tolerant local matches only once the remote lookup failed or found nothing
+    if not result.cities and index is not None:
+        cities = index.fuzzy_search(query)
+        if cities:
+            _prefix_stats["fuzzy_hits"] += 1
+            return result._replace(cities=cities)
+    return result
+
+async def _remote_lookup(query: str) -> CitySearch:
+    """Geocoding API through the exact, prefix and stale-while-revalidate caches"""
     # Normalize and cache key
     normalized_query = normalize_city_name(query)
     cache_key = normalized_query.lower()
     
     # Check cache first
-    cached_result = get_geocoding_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    entry = await aget_geocoding_entry(cache_key)
+    if entry and not entry.stale:
+        _prefix_stats["exact_hits"] += 1
+        return CitySearch(entry.data, entry.stored_at)
+
+    # A complete result set for a shorter prefix already contains the answer
+    complete = _complete_prefix(cache_key)
+    if complete is not None:
+        _prefix_stats["prefix_hits"] += 1
+        return CitySearch(complete.filter(normalize_key(query)), complete.stored_at)
+
+    fetch = lambda: _fetch_cities(normalized_query, cache_key)
+    probe = lambda: _fresh_cities(cache_key)
+
+    # Stale-while-revalidate: answer with the stale list, refresh in background
+    if entry and CACHE_SWR_ENABLED:
+        geocoding_flight.refresh(cache_key, fetch, probe=probe)
+        return CitySearch(entry.data, entry.stored_at, stale=True)
+
+    # Concurrent misses for the same normalized query share one upstream call
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            api_url = os.getenv("OPEN_METEO_GEOCODING_API_URL", "https://geocoding-api.open-meteo.com/v1/search")
-            response = await client.get(
-                api_url,
-                params={
-                    "name": normalized_query,
-                    "count": 10,
-                    "language": "pt",
-                    "format": "json"
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            cities = []
-            if "results" in data:
-                for result in data["results"]:
-                    # Filter for Brazilian cities
-                    if result.get("country_code") == "BR":
-                        city = City(
-                            name=result["name"],
-                            admin1=result.get("admin1", ""),
-                            country="Brasil",
-                            latitude=result["latitude"],
-                            longitude=result["longitude"],
-                            timezone=result.get("timezone", "America/Sao_Paulo"),
-                            label=f"{result['name']} - {result.get('admin1', '')} - Brasil"
-                        )
-                        cities.append(city)
-            
-            # Cache the result
-            set_geocoding_cache(cache_key, cities)
-            return cities
-            
+        fresh = await geocoding_flight.do(cache_key, fetch, probe=probe)
+        return CitySearch(fresh.data, fresh.stored_at)
     except httpx.RequestError as e:
-        logger.error(f"Error searching cities: {e}", exc_info=True)
-        return []
+        logger.error(f"Error searching cities: {e}", exc_info=True, extra=SAMPLED)
     except Exception as e:
-        logger.error(f"Unexpected error searching cities: {e}", exc_info=True)
-        return []
+        logger.error(f"Unexpected error searching cities: {e}", exc_info=True, extra=SAMPLED)
+
+    if entry:
+        logger.warning(f"Serving stale geocoding results for {cache_key} after upstream error", extra=SAMPLED)
+        return CitySearch(entry.data, entry.stored_at, stale=True)
+    return CitySearch([], None)
+
+async def _fresh_cities(cache_key: str) -> Optional[CacheEntry]:
+    # Straight from Redis: the leader's write must be visible to other workers
+    entry = await aget_geocoding_entry(cache_key, l1=False)
+    return entry if entry and not entry.stale else None
+
+def _complete_prefix(cache_key: str) -> Optional[PrefixResults]:
+    """Longest cached complete result set for a prefix of cache_key"""
+    if not GEOCODING_PREFIX_CACHE_ENABLED:
+        return None
+    for end in range(len(cache_key), GEOCODING_PREFIX_MIN_LENGTH - 1, -1):
+        prefix = cache_key[:end]
+        if prefix in _prefix_cache:
+            return _prefix_cache.get(prefix)
+    return None
+
+def geocoding_cache_stats() -> Dict[str, float]:
+    """Where /cities answers came from, and the share that avoided an upstream call"""
+    stats = dict(_prefix_stats)
+    # Fuzzy hits are answered after an upstream call or cache lookup, not instead of one
+    total = sum(stats.values()) - stats["fuzzy_hits"]
+    stats["prefix_entries"] = len(_prefix_cache)
+    stats["hit_rate"] = round((total - stats["upstream_calls"]) / total, 4) if total else 0.0
+    return stats
+
+async def _fetch_cities(normalized_query: str, cache_key: str) -> CacheEntry:
+    """Query the geocoding API and cache the Brazilian results"""
+    _prefix_stats["upstream_calls"] += 1
+    api_url = os.getenv("OPEN_METEO_GEOCODING_API_URL", "https://geocoding-api.open-meteo.com/v1/search")
+    response = await upstream_get(
+        "geocoding",
+        api_url,
+        params={
+            "name": normalized_query,
+            "count": GEOCODING_RESULT_COUNT,
+            "language": "pt",
+            "format": "json"
+        },
+        timeout=timeout_for(GEOCODING_TIMEOUT),
+    )
+    response.raise_for_status()
+    data = response.json()
+    
+    cities = []
+    if "results" in data:
+        for result in data["results"]:
+            # Filter for Brazilian cities
+            if result.get("country_code") == "BR":
+                city = City(
+                    name=result["name"],
+                    admin1=result.get("admin1", ""),
+                    country="Brasil",
+                    latitude=result["latitude"],
+                    longitude=result["longitude"],
+                    timezone=result.get("timezone", "America/Sao_Paulo"),
+                    label=f"{result['name']} - {result.get('admin1', '')} - Brasil"
+                )
+                cities.append(city)
+    
+    # Cache the result
+    entry = await aset_geocoding_cache(cache_key, cities)
+    if (GEOCODING_PREFIX_CACHE_ENABLED and len(cache_key) >= GEOCODING_PREFIX_MIN_LENGTH
+            and len(data.get("results") or []) < GEOCODING_RESULT_COUNT):
+        _prefix_cache.set(cache_key, PrefixResults.build(cities, entry.stored_at), GEOCODING_CACHE_TTL)
+    return entry
 
 def normalize_city_name(city_name: str) -> str:
     """Normalize city name for better search results"""
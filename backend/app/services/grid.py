@@ -0,0 +1,281 @@
+import asyncio
+import json
+import math
+import os
+import struct
+import time
+import numpy as np
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from ..cache import aget_weather_entry, WEATHER_CACHE_TTL, CACHE_SWR_ENABLED
+from ..forecast_frame import ForecastFrame
+from ..logger import logger, SAMPLED
+from ..memory_cache import MemoryCache
+from ..spatial import snap_coordinates, GridPoint, WEATHER_GRID_RESOLUTION
+from ..variable_map import VARIABLE_MAP
+from .open_meteo import BatchFetcher, ForecastSelection, covers, widen, MAX_FORECAST_DAYS, UNITS
+
+# Gridded forecasts for map rendering
+# A bounding box is sampled on the nodes of the weather cache grid (multiples
+# of WEATHER_GRID_RESOLUTION), so every node is a regular cache cell: cached
+# cells are read locally (stale ones refreshed in the background) and the rest
+# are fetched in the same chunked multi-location calls as /weather/batch. Coarser resolutions (or low zoom
+# levels) take every k-th node, which downsamples without extra upstream
+# calls and keeps coarse nodes shared with the fine grids.
+#
+# The assembled grid is one float32 array per variable, shaped
+# (time, latitude, longitude), on a UTC hourly axis starting at the current
+# hour (points in different time zones line up). It is kept in memory until the
+# oldest forecast it was built from expires, and rendered either as compact
+# JSON or as a binary tile:
+#
+#   b"CMG1" | uint32 header length | JSON header (padded to 4 bytes)
+#   | float32 little-endian arrays, one per header["variables"], C order
+#
+# NaN marks missing values in the binary form (null in JSON).
+
+WEATHER_GRID_MAX_POINTS = int(os.getenv("WEATHER_GRID_MAX_POINTS", "2500"))
+# Nodes across one web-map tile when the resolution comes from a zoom level
+WEATHER_GRID_TILE_POINTS = int(os.getenv("WEATHER_GRID_TILE_POINTS", "32"))
+WEATHER_GRID_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_GRID_CACHE_MAX_ENTRIES", "64"))
+# JSON values are rounded to this many decimals
+WEATHER_GRID_JSON_DECIMALS = int(os.getenv("WEATHER_GRID_JSON_DECIMALS", "1"))
+
+DEFAULT_GRID_VARIABLES = ("hourly_precipitation", "hourly_wind_speed_10m", "hourly_wind_gusts_10m")
+DEFAULT_GRID_HOURS = 24
+# The hourly payload starts at local midnight: one extra day covers the hours already gone
+MAX_GRID_HOURS = (MAX_FORECAST_DAYS - 1) * 24
+
+BINARY_MAGIC = b"CMG1"
+BINARY_MEDIA_TYPE = "application/vnd.clima-manejo.grid"
+
+_grids = MemoryCache(max_entries=WEATHER_GRID_CACHE_MAX_ENTRIES)
+
+
+class GridSpec(NamedTuple):
+    """Nodes lat0 + i*step (i < n_lat), lon0 + j*step (j < n_lon), plus what to sample on them"""
+    lat0: float
+    lon0: float
+    step: float
+    n_lat: int
+    n_lon: int
+    variables: Tuple[str, ...]  # Open-Meteo hourly names
+    hours: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.lat0},{self.lon0},{self.step},{self.n_lat},{self.n_lon}|{','.join(self.variables)}|{self.hours}"
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.hours, self.n_lat, self.n_lon
+
+    def latitudes(self) -> np.ndarray:
+        return np.round(self.lat0 + np.arange(self.n_lat) * self.step, 6)
+
+    def longitudes(self) -> np.ndarray:
+        return np.round(self.lon0 + np.arange(self.n_lon) * self.step, 6)
+
+
+def zoom_resolution(zoom: int, tile_points: int = WEATHER_GRID_TILE_POINTS) -> float:
+    """Node spacing (degrees) giving about tile_points nodes across a web-map tile at `zoom`"""
+    return 360.0 / (2 ** zoom) / tile_points
+
+
+def grid_spec(
+    bbox: Sequence[float],
+    resolution: Optional[float] = None,
+    zoom: Optional[int] = None,
+    variables: Optional[Sequence[str]] = None,
+    hours: int = DEFAULT_GRID_HOURS,
+    max_points: int = WEATHER_GRID_MAX_POINTS,
+) -> GridSpec:
+    """Validate a grid request; bbox is (west, south, east, north) in degrees"""
+    if len(bbox) != 4:
+        raise ValueError("bbox must be west,south,east,north")
+    west, south, east, north = (float(v) for v in bbox)
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValueError("bbox must be west,south,east,north with west <= east and south <= north")
+    if not 1 <= hours <= MAX_GRID_HOURS:
+        raise ValueError(f"hours must be between 1 and {MAX_GRID_HOURS}")
+
+    names = []
+    for name in variables or DEFAULT_GRID_VARIABLES:
+        spec = VARIABLE_MAP.get(name)
+        if spec is None or spec["source"] != "hourly":
+            raise ValueError(f"Grid variables must be hourly variables: {name}")
+        if spec["path"][1] not in names:
+            names.append(spec["path"][1])
+
+    # Resolution: explicit, from the zoom level, or the cache grid itself;
+    # always a whole multiple of the cache grid spacing
+    if resolution is None and zoom is not None:
+        resolution = zoom_resolution(zoom)
+    base = WEATHER_GRID_RESOLUTION
+    factor = max(1, math.ceil((resolution or base) / base - 1e-9))
+    step = round(factor * base, 6)
+
+    # Nodes inside the box, aligned to multiples of step
+    i0, i1 = math.ceil(south / step - 1e-9), math.floor(north / step + 1e-9)
+    j0, j1 = math.ceil(west / step - 1e-9), math.floor(east / step + 1e-9)
+    n_lat, n_lon = i1 - i0 + 1, j1 - j0 + 1
+    if n_lat < 1 or n_lon < 1:
+        raise ValueError(f"bbox contains no grid node at {step} degrees")
+    if n_lat * n_lon > max_points:
+        raise ValueError(f"{n_lat * n_lon} grid points exceed the limit of {max_points}; use a coarser resolution or zoom")
+    return GridSpec(round(i0 * step, 6), round(j0 * step, 6), step, n_lat, n_lon, tuple(names), hours)
+
+
+@dataclass
+class GridTile:
+    spec: GridSpec
+    start: np.datetime64  # first hour (UTC)
+    data: Dict[str, np.ndarray]  # variable -> float32 (time, lat, lon)
+    stored_at: float  # when the oldest forecast in the grid was fetched
+    missing_points: int = 0
+
+    @property
+    def times(self) -> List[str]:
+        hours = self.start + np.arange(self.spec.hours).astype("timedelta64[h]")
+        return [f"{t}Z" for t in hours.astype("datetime64[m]")]
+
+    def header(self) -> Dict[str, Any]:
+        spec = self.spec
+        return {
+            "bbox": [spec.lon0, spec.lat0, float(spec.longitudes()[-1]), float(spec.latitudes()[-1])],
+            "step": spec.step,
+            "shape": list(spec.shape),
+            "latitudes": spec.latitudes().tolist(),
+            "longitudes": spec.longitudes().tolist(),
+            "times": self.times,
+            "variables": list(spec.variables),
+            "units": {name: UNITS.get(name) for name in spec.variables},
+            "fetched_at": datetime.fromtimestamp(self.stored_at, timezone.utc).isoformat(),
+            "missing_points": self.missing_points,
+        }
+
+    def to_json(self, decimals: int = WEATHER_GRID_JSON_DECIMALS) -> Dict[str, Any]:
+        """Header plus one flat (time, lat, lon) value list per variable"""
+        values = {}
+        for name, arr in self.data.items():
+            rounded = np.round(arr.astype(np.float64), decimals).ravel()
+            values[name] = [None if math.isnan(v) else v for v in rounded.tolist()]
+        return {**self.header(), "values": values}
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps(self.header(), separators=(",", ":")).encode()
+        header += b" " * (-len(header) % 4)
+        arrays = b"".join(self.data[name].astype("<f4", copy=False).tobytes() for name in self.spec.variables)
+        return BINARY_MAGIC + struct.pack("<I", len(header)) + header + arrays
+
+
+def decode_tile(body: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Parse a binary tile back into (header, {variable: array})"""
+    if body[:4] != BINARY_MAGIC:
+        raise ValueError("Not a grid tile")
+    (length,) = struct.unpack_from("<I", body, 4)
+    header = json.loads(body[8:8 + length])
+    shape = tuple(header["shape"])
+    size = int(np.prod(shape))
+    data = {}
+    offset = 8 + length
+    for name in header["variables"]:
+        data[name] = np.frombuffer(body, dtype="<f4", count=size, offset=offset).reshape(shape)
+        offset += size * 4
+    return header, data
+
+
+def current_hour() -> np.datetime64:
+    return np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), "h")
+
+
+async def get_grid(spec: GridSpec, start: Optional[np.datetime64] = None) -> GridTile:
+    """Grid of hourly forecasts over the spec's nodes, from `start` (default: the current UTC hour)"""
+    start = current_hour() if start is None else np.datetime64(start, "h")
+    cache_key = f"{spec.key}|{start}"
+    tile = _grids.get(cache_key)
+    if tile is not None:
+        return tile
+
+    # One extra day: the payload starts at local midnight, behind the current hour
+    days = min(MAX_FORECAST_DAYS, math.ceil(spec.hours / 24) + 1)
+    selection = ForecastSelection(days, (), (), spec.variables, spec.hours)
+    lat_grid, lon_grid = np.meshgrid(spec.latitudes(), spec.longitudes(), indexing="ij")
+    points = [snap_coordinates(lat, lon) for lat, lon in zip(lat_grid.ravel().tolist(), lon_grid.ravel().tolist())]
+    cells = list({point.key: point for point in points}.values())
+    entries = await asyncio.gather(*(aget_weather_entry(cell.key) for cell in cells))
+
+    payloads: Dict[str, Dict[str, Any]] = {}
+    cached_at: Dict[str, Optional[float]] = {}
+    fetcher = BatchFetcher()
+    fetches = {}
+    for cell, entry in zip(cells, entries):
+        covered = entry is not None and covers(entry.data, selection)
+        # Keep the coverage already cached for this cell
+        fetch_selection = widen(selection, entry.data if entry else None)
+        if covered:
+            # Stale forecasts are served as they are, or kept in case the fetch fails
+            payloads[cell.key] = entry.data["payload"]
+            cached_at[cell.key] = entry.stored_at
+            if not entry.stale:
+                continue
+            if CACHE_SWR_ENABLED:
+                fetcher.refresh(cell, fetch_selection, selection)
+                continue
+        fetches[cell.key] = fetcher.fetch(cell, fetch_selection, selection)
+
+    # Failed fetches are logged by the fetcher and leave their cells missing (or stale)
+    results = await asyncio.gather(*fetches.values(), return_exceptions=True)
+    for key, fetched in zip(fetches, results):
+        if not isinstance(fetched, BaseException):
+            payloads[key] = fetched.data["payload"]
+            cached_at[key] = fetched.stored_at
+    # Age of the grid: its oldest forecast
+    stored_at = min([time.time()] + [t if t is not None else 0.0 for t in cached_at.values()])
+
+    tile = _assemble(spec, start, points, payloads, stored_at)
+    if tile.missing_points:
+        logger.warning(f"Grid {spec.key}: {tile.missing_points} of {len(points)} points unavailable", extra=SAMPLED)
+    else:
+        # Until the oldest forecast in it goes stale
+        ttl = WEATHER_CACHE_TTL - (time.time() - stored_at)
+        if ttl > 0:
+            _grids.set(cache_key, tile, ttl, size=sum(arr.nbytes for arr in tile.data.values()))
+    return tile
+
+
+def _assemble(spec: GridSpec, start: np.datetime64, points: List[GridPoint], payloads: Dict[str, Dict[str, Any]], stored_at: float) -> GridTile:
+    hours, n_lat, n_lon = spec.shape
+    flat = {name: np.full((hours, n_lat * n_lon), np.nan, dtype=np.float32) for name in spec.variables}
+    frames: Dict[str, Tuple[ForecastFrame, int]] = {}
+    missing = 0
+    for p, point in enumerate(points):
+        payload = payloads.get(point.key)
+        if payload is None:
+            missing += 1
+            continue
+        if point.key not in frames:
+            frame = ForecastFrame.from_section(payload.get("hourly"), spec.variables)
+            offset = 0
+            if len(frame.times) and len(frame.times) == len(frame):
+                # Local times -> UTC, then the row that lands on `start`
+                utc_first = frame.times[0].astype("datetime64[h]") - np.timedelta64(int(payload.get("utc_offset_seconds") or 0) // 3600, "h")
+                offset = int((start - utc_first) / np.timedelta64(1, "h"))
+            frames[point.key] = (frame, offset)
+        frame, offset = frames[point.key]
+        # Rows [offset, offset + hours) of the frame fill time steps [dst, dst + n)
+        src = max(offset, 0)
+        dst = src - offset
+        n = min(hours - dst, len(frame) - src)
+        if n <= 0:
+            missing += 1
+            continue
+        for name in spec.variables:
+            flat[name][dst:dst + n, p] = frame.column(name)[src:src + n]
+    data = {name: arr.reshape(hours, n_lat, n_lon) for name, arr in flat.items()}
+    return GridTile(spec, start, data, stored_at, missing)
+
+
+def grid_cache_stats() -> Dict[str, int]:
+    return _grids.stats()
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+from ..history_store import (
+    HISTORY_DAILY_VARIABLES,
+    HISTORY_HOURLY_VARIABLES,
+    date_range,
+    get_history_store,
+    missing_ranges,
+)
+from ..http_client import timeout_for, OPEN_METEO_TIMEOUT
+from ..upstream import upstream_get
+from ..logger import logger, SAMPLED
+from ..singleflight import SingleFlight
+from ..spatial import snap_coordinates
+from ..variable_map import VARIABLE_MAP
+
+# Weather history with incremental backfill
+# A range query first asks the store which days it lacks for the grid cell and
+# fetches only those runs: days older than HISTORY_ARCHIVE_LAG_DAYS from the
+# Open-Meteo archive API (final), more recent ones from the forecast API's past
+# days (provisional, replaced by archive data once it exists). Today is never
+# stored because it is still incomplete. Dates are local to the cell's timezone
+# as Open-Meteo resolves it (timezone=auto); HISTORY_TIMEZONE stands in until the
+# first response for a cell tells the store which one that is.
+# Near the lag boundary the archive may answer a day with nothing but nulls;
+# such days are taken from the forecast API as provisional, never stored as final,
+# and the archive is asked for them again only after HISTORY_ARCHIVE_RETRY_HOURS.
+
+HISTORY_MAX_DAYS = int(os.getenv("HISTORY_MAX_DAYS", "366"))
+HISTORY_ARCHIVE_LAG_DAYS = int(os.getenv("HISTORY_ARCHIVE_LAG_DAYS", "5"))
+HISTORY_TIMEZONE = os.getenv("HISTORY_TIMEZONE", "America/Sao_Paulo")
+HISTORY_ARCHIVE_RETRY_HOURS = float(os.getenv("HISTORY_ARCHIVE_RETRY_HOURS", "6"))
+# More gaps than this are fetched as one span (re-fetching the stored days in between)
+HISTORY_MAX_GAPS = int(os.getenv("HISTORY_MAX_GAPS", "4"))
+
+RESOLUTIONS = {"daily": HISTORY_DAILY_VARIABLES, "hourly": HISTORY_HOURLY_VARIABLES}
+
+history_flight = SingleFlight("history", mode="local")
+
+
+def today(timezone: Optional[str] = None) -> date:
+    return datetime.now(ZoneInfo(timezone or HISTORY_TIMEZONE)).date()
+
+
+def validate_range(start: date, end: date, timezone: Optional[str] = None) -> Tuple[date, date]:
+    """Check a requested range; end is capped at yesterday"""
+    yesterday = today(timezone) - timedelta(days=1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    if start > yesterday:
+        raise ValueError("start must be before today")
+    end = min(end, yesterday)
+    if (end - start).days + 1 > HISTORY_MAX_DAYS:
+        raise ValueError(f"range must be at most {HISTORY_MAX_DAYS} days")
+    return start, end
+
+
+def _select_variables(resolution: str, variables: Optional[Sequence[str]]) -> List[str]:
+    known = RESOLUTIONS.get(resolution)
+    if known is None:
+        raise ValueError("resolution must be 'daily' or 'hourly'")
+    if not variables:
+        return list(known)
+    for name in variables:
+        if name not in known:
+            raise ValueError(f"Unknown {resolution} history variable: {name}")
+    return list(dict.fromkeys(variables))
+
+
+async def get_history(
+    latitude: float,
+    longitude: float,
+    start: date,
+    end: date,
+    resolution: str = "daily",
+    variables: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Stored observations for a grid cell over [start, end], backfilling missing days"""
+    selected = _select_variables(resolution, variables)
+    point = snap_coordinates(latitude, longitude)
+    store = get_history_store()
+    timezone = await asyncio.to_thread(store.cell_timezone, point.key) or HISTORY_TIMEZONE
+    start, end = validate_range(start, end, timezone)
+    archive_cutoff = today(timezone) - timedelta(days=HISTORY_ARCHIVE_LAG_DAYS)
+    # Null archive days checked since then are not asked for again yet
+    checked_after = time.time() - HISTORY_ARCHIVE_RETRY_HOURS * 3600
+
+    present = await asyncio.to_thread(store.stored_days, point.key, resolution, start, end, archive_cutoff, checked_after)
+    gaps = missing_ranges(date_range(start, end), present)
+    if len(gaps) > HISTORY_MAX_GAPS:
+        gaps = [(gaps[0][0], gaps[-1][1])]
+
+    fetched_days = 0
+    complete = True
+    for gap_start, gap_end in gaps:
+        # Concurrent requests for the same cell and gap share one backfill
+        flight_key = f"{point.key}|{resolution}|{gap_start}|{gap_end}"
+        try:
+            fetched_days += await history_flight.do(
+                flight_key,
+                lambda s=gap_start, e=gap_end: _backfill(point.latitude, point.longitude, point.key, resolution,
+                                                         s, e, archive_cutoff, timezone),
+            )
+        except Exception as e:
+            # Serve what is stored; the next request retries the gap
+            logger.error(f"History backfill failed for {point.key} {gap_start}..{gap_end}: {e}", extra=SAMPLED)
+            complete = False
+    if gaps:
+        # The first backfill for a cell records its actual timezone
+        timezone = await asyncio.to_thread(store.cell_timezone, point.key) or timezone
+
+    columns = await asyncio.to_thread(store.read, point.key, resolution, start, end, selected)
+    return {
+        "time": columns.pop("time"),
+        "data": columns,
+        "summary": _summary(columns, resolution),
+        "units": {name: VARIABLE_MAP[name]["unit"] for name in selected if name in VARIABLE_MAP},
+        "meta": {
+            "resolution": resolution,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "timezone": timezone,
+            "complete": complete,
+            "fetched_days": fetched_days,
+            "grid": {"latitude": point.latitude, "longitude": point.longitude, "cell": point.cell, "scheme": point.scheme},
+        },
+    }
+
+
+def _total(values: List[Optional[float]]) -> Optional[float]:
+    known = [v for v in values if v is not None]
+    return round(sum(known), 2) if known else None
+
+
+def _summary(columns: Dict[str, List[Any]], resolution: str) -> Dict[str, Any]:
+    """Accumulated rainfall/ET0 (and the resulting water balance) over the range"""
+    rain_name = "precipitation_sum" if resolution == "daily" else "precipitation"
+    summary: Dict[str, Any] = {}
+    if rain_name in columns:
+        summary["precipitation_total_mm"] = _total(columns[rain_name])
+    if "et0_fao_evapotranspiration" in columns:
+        summary["et0_total_mm"] = _total(columns["et0_fao_evapotranspiration"])
+    if rain_name in columns and "et0_fao_evapotranspiration" in columns:
+        balance = [
+            p - et0
+            for p, et0 in zip(columns[rain_name], columns["et0_fao_evapotranspiration"])
+            if p is not None and et0 is not None
+        ]
+        summary["water_balance_mm"] = round(sum(balance), 2) if balance else None
+    return summary
+
+
+async def _backfill(latitude: float, longitude: float, cell: str, resolution: str,
+                    start: date, end: date, archive_cutoff: date, timezone: str) -> int:
+    """Fetch and store [start, end]; returns the number of days written"""
+    store = get_history_store()
+    days = 0
+    # Final days from the archive, the rest (if any) from the forecast API
+    spans = []
+    if start <= archive_cutoff:
+        spans.append(("archive", start, min(end, archive_cutoff)))
+    if end > archive_cutoff:
+        spans.append(("forecast", max(start, archive_cutoff + timedelta(days=1)), end))
+    for source, span_start, span_end in spans:
+        section, section_timezone = await _fetch_section(source, latitude, longitude, resolution, span_start, span_end)
+        if section_timezone and section_timezone != timezone:
+            await asyncio.to_thread(store.set_cell_timezone, cell, section_timezone)
+            timezone = section_timezone
+        empty = _null_days(section, RESOLUTIONS[resolution]) if source == "archive" else set()
+        # The range was checked against a stand-in timezone before the cell's was known
+        current = today(timezone).isoformat()
+        unfinished = {t[:10] for t in section["time"] if t[:10] >= current}
+        await asyncio.to_thread(store.write, cell, resolution, _select_days(section, empty | unfinished, keep=False), source)
+        if empty:
+            # Not in the archive yet: provisional values until it has them
+            logger.info(f"Archive has no data for {cell} on {len(empty)} days; using the forecast API")
+            checked_at = time.time()
+            fallback, _ = await _fetch_section("forecast", latitude, longitude, resolution,
+                                               date.fromisoformat(min(empty)), date.fromisoformat(max(empty)))
+            await asyncio.to_thread(store.write, cell, resolution, _select_days(fallback, empty, keep=True), "forecast",
+                                    checked_at)
+        days += (span_end - span_start).days + 1
+    logger.info(f"History backfill for {cell} ({resolution}) {start}..{end}: {days} days")
+    return days
+
+
+def _null_days(section: Dict[str, Any], variables: Sequence[str]) -> set:
+    """Days (YYYY-MM-DD) on which every variable of every row is null"""
+    seen, filled = set(), set()
+    for i, t in enumerate(section["time"]):
+        day = t[:10]
+        seen.add(day)
+        if any(i < len(section.get(name) or []) and section[name][i] is not None for name in variables):
+            filled.add(day)
+    return seen - filled
+
+
+def _select_days(section: Dict[str, Any], days: set, keep: bool) -> Dict[str, Any]:
+    """The rows of a section whose day is (keep=True) or is not (keep=False) in days"""
+    rows = [i for i, t in enumerate(section["time"]) if (t[:10] in days) == keep]
+    if len(rows) == len(section["time"]):
+        return section
+    return {name: [values[i] for i in rows if i < len(values)] for name, values in section.items() if isinstance(values, list)}
+
+
+async def _fetch_section(source: str, latitude: float, longitude: float, resolution: str,
+                         start: date, end: date) -> Tuple[Dict[str, Any], Optional[str]]:
+    """One section of history and the timezone Open-Meteo resolved for the point"""
+    if source == "archive":
+        api_url = os.getenv("OPEN_METEO_ARCHIVE_API_URL", "https://archive-api.open-meteo.com/v1/archive")
+    else:
+        api_url = os.getenv("OPEN_METEO_API_URL", "https://api.open-meteo.com/v1/forecast")
+    response = await upstream_get(
+        source,
+        api_url,
+        params={
+            "latitude": latitude,
+            "longitude": longitude,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            resolution: ",".join(RESOLUTIONS[resolution]),
+            "timezone": "auto",
+            "wind_speed_unit": "kmh",
+            "temperature_unit": "celsius",
+            "precipitation_unit": "mm",
+        },
+        timeout=timeout_for(OPEN_METEO_TIMEOUT),
+    )
+    response.raise_for_status()
+    data = response.json()
+    section = data.get(resolution) or {}
+    if not section.get("time"):
+        raise ValueError(f"Empty {resolution} history from {source} for {start}..{end}")
+    return section, data.get("timezone")
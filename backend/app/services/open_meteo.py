@@ -1,213 +1,489 @@
+import asyncio
 import httpx
 import os
-from typing import Dict, Any
-from datetime import datetime, timedelta
-from ..schemas import WeatherCurrent, WeatherToday, WeatherDerived, NextHour
-from ..cache import get_weather_cache, set_weather_cache
-from ..logger import logger
+from typing import Dict, Any, Optional, AsyncIterator, Tuple, NamedTuple, Iterable, Set
+from datetime import datetime, timedelta, timezone
+from ..schemas import WeatherCurrent, WeatherDerived
+from ..forecast_frame import ForecastFrame
+from ..operation_rules import get_rules
+from ..cache import aget_weather_entry, aset_weather_cache, CacheEntry, CACHE_SWR_ENABLED
+from ..http_client import timeout_for, OPEN_METEO_TIMEOUT
+from ..upstream import upstream_get
+from ..logger import logger, SAMPLED
+from ..singleflight import weather_flight
+from ..spatial import snap_coordinates, GridPoint
+from ..variable_map import VARIABLE_MAP
 from typing import List
 
-async def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
-    """Get weather data from Open-Meteo API"""
-    
-    # Cache key
-    cache_key = f"{latitude},{longitude}"
-    
+# Batch requests: locations per upstream call and concurrent upstream calls
+WEATHER_BATCH_CHUNK_SIZE = int(os.getenv("WEATHER_BATCH_CHUNK_SIZE", "50"))
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "4"))
+
+# Forecast horizon
+MAX_FORECAST_DAYS = 16
+DEFAULT_NEXT_HOURS = 6
+
+# Variables requested from Open-Meteo when the client does not pick a subset
+CURRENT_VARIABLES = [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "apparent_temperature",
+    "precipitation",
+    "wind_speed_10m",
+    "wind_gusts_10m",
+    "wind_direction_10m",
+    "cloud_cover",
+    "pressure_msl",
+    "vapour_pressure_deficit",
+]
+DAILY_VARIABLES = [
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "precipitation_sum",
+    "precipitation_hours",
+    "precipitation_probability_max",
+    "precipitation_probability_mean",
+    "wind_speed_10m_max",
+    "wind_gusts_10m_max",
+    "wind_direction_10m_dominant",
+    "shortwave_radiation_sum",
+    "sunshine_duration",
+    "uv_index_max",
+    "et0_fao_evapotranspiration",
+]
+HOURLY_VARIABLES = [
+    "precipitation_probability",
+    "precipitation",
+    "wind_speed_10m",
+    "wind_gusts_10m",
+    "cloud_cover",
+]
+
+UNITS = {
+    "temperature_2m": "°C",
+    "relative_humidity_2m": "%",
+    "apparent_temperature": "°C",
+    "precipitation": "mm",
+    "wind_speed_10m": "km/h",
+    "wind_gusts_10m": "km/h",
+    "cloud_cover": "%",
+    "pressure_msl": "hPa",
+    "vapour_pressure_deficit": "kPa",
+    "et0_fao_evapotranspiration": "mm",
+    "shortwave_radiation_sum": "MJ/m²",
+    "sunshine_duration": "min",
+}
+
+
+class ForecastSelection(NamedTuple):
+    """Horizon and variables of a forecast request (Open-Meteo variable names per section)"""
+    days: int
+    current: Tuple[str, ...]
+    daily: Tuple[str, ...]
+    hourly: Tuple[str, ...]
+    hours: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.days}|{','.join(self.current)}|{','.join(self.daily)}|{','.join(self.hourly)}"
+
+
+DEFAULT_SELECTION = ForecastSelection(
+    1, tuple(CURRENT_VARIABLES), tuple(DAILY_VARIABLES), tuple(HOURLY_VARIABLES), DEFAULT_NEXT_HOURS
+)
+
+
+def build_selection(days: int = 1, variables: Optional[Iterable[str]] = None, hours: Optional[int] = None) -> ForecastSelection:
+    """Validate horizon/variable parameters. Variable names are the VARIABLE_MAP keys."""
+    if not 1 <= days <= MAX_FORECAST_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_FORECAST_DAYS}")
+    hours = DEFAULT_NEXT_HOURS if hours is None else hours
+    if not 1 <= hours <= days * 24:
+        raise ValueError(f"hours must be between 1 and {days * 24} for a {days}-day horizon")
+
+    variables = [v for v in (variables or []) if v]
+    if not variables:
+        return DEFAULT_SELECTION._replace(days=days, hours=hours)
+
+    sections: Dict[str, List[str]] = {"current": [], "daily": [], "hourly": []}
+    for name in variables:
+        spec = VARIABLE_MAP.get(name)
+        if spec is None:
+            raise ValueError(f"Unknown variable: {name}")
+        api_name = spec["path"][1]
+        if api_name not in sections[spec["source"]]:
+            sections[spec["source"]].append(api_name)
+
+    return ForecastSelection(days, tuple(sections["current"]), tuple(sections["daily"]), tuple(sections["hourly"]), hours)
+
+
+async def get_weather_data(
+    latitude: float,
+    longitude: float,
+    days: int = 1,
+    variables: Optional[Iterable[str]] = None,
+    hours: Optional[int] = None,
+    max_age: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Get weather data from Open-Meteo API
+
+    max_age refetches entries older than that many seconds even while they are
+    still fresh (used by the pre-warmer to refresh keys shortly before expiry).
+    """
+    selection = build_selection(days, variables, hours)
+
+    # Cache key: nearby points snap to the same grid cell and share one entry.
+    # The entry keeps the raw forecast plus its coverage, so a longer/wider
+    # forecast serves any shorter horizon or variable subset.
+    point = snap_coordinates(latitude, longitude)
+    cache_key = point.key
+
     # Check cache first
-    cached_result = get_weather_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    entry = await aget_weather_entry(cache_key)
+    covered = entry is not None and covers(entry.data, selection)
+    if covered and not entry.stale and (max_age is None or entry.age < max_age):
+        return result_from_entry(entry, point, selection)
+
+    fetch_selection = widen(selection, entry.data if entry else None)
+    fetch = lambda: _fetch_weather_data(point, fetch_selection)
+    probe = lambda: _fresh_entry(cache_key, selection)
+    flight_key = f"{cache_key}|{fetch_selection.key}"
+
+    # Stale-while-revalidate: answer with the stale payload, refresh in background
+    if covered and entry.stale and CACHE_SWR_ENABLED:
+        weather_flight.refresh(flight_key, fetch, probe=probe)
+        return result_from_entry(entry, point, selection)
+
+    # Concurrent misses for the same coordinates share one upstream call
+    try:
+        fresh = await weather_flight.do(flight_key, fetch, probe=probe)
+        return result_from_entry(fresh, point, selection)
+    except Exception:
+        if covered:
+            logger.warning(f"Serving stale weather data for {cache_key} after upstream error", extra=SAMPLED)
+            return result_from_entry(entry, point, selection)
+        raise
+
+async def get_weather_batch(
+    locations: List[Tuple[float, float]],
+    selection: ForecastSelection = DEFAULT_SELECTION,
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """Get weather data for many locations, yielding (index, outcome) as results arrive.
+
+    Cached cells are answered first (stale ones too, refreshed in the background);
+    the remaining cells are fetched in chunked multi-location upstream requests.
+    outcome is {"status": "ok", "data": ...} or {"status": "not_found", "message": ...}.
+    """
+    points = [snap_coordinates(lat, lon) for lat, lon in locations]
+    indexes_by_key: Dict[str, List[int]] = {}
+    for i, point in enumerate(points):
+        indexes_by_key.setdefault(point.key, []).append(i)
+
+    keys = list(indexes_by_key)
+    entries = await asyncio.gather(*(aget_weather_entry(key) for key in keys))
+
+    fetcher = BatchFetcher()
+    answered: List[Tuple[str, Dict[str, Any]]] = []
+    # fetch task -> (cell, stale entry to fall back on)
+    fetches: Dict[asyncio.Future, Tuple[GridPoint, Optional[CacheEntry]]] = {}
+    for key, entry in zip(keys, entries):
+        point = points[indexes_by_key[key][0]]
+        covered = entry is not None and covers(entry.data, selection)
+        # Keep the coverage already cached for this cell
+        fetch_selection = widen(selection, entry.data if entry else None)
+        if covered and (not entry.stale or CACHE_SWR_ENABLED):
+            answered.append((key, result_from_entry(entry, point, selection)))
+            if entry.stale:
+                fetcher.refresh(point, fetch_selection, selection)
+            continue
+        fetches[fetcher.fetch(point, fetch_selection, selection)] = (point, entry if covered else None)
+
+    for key, result in answered:
+        for i in indexes_by_key[key]:
+            yield i, {"status": "ok", "data": result}
+
+    pending = set(fetches)
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            # Get current weather and daily forecast
-            api_url = os.getenv("OPEN_METEO_API_URL", "https://api.open-meteo.com/v1/forecast")
-            response = await client.get(
-                api_url,
-                params={
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "current": ",".join([
-                        "temperature_2m",
-                        "relative_humidity_2m",
-                        "apparent_temperature",
-                        "precipitation",
-                        "wind_speed_10m",
-                        "wind_gusts_10m",
-                        "wind_direction_10m",
-                        "cloud_cover",
-                        "pressure_msl",
-                        "vapour_pressure_deficit",
-                    ]),
-                    "daily": ",".join([
-                        "temperature_2m_max",
-                        "temperature_2m_min",
-                        "precipitation_sum",
-                        "precipitation_hours",
-                        "precipitation_probability_max",
-                        "precipitation_probability_mean",
-                        "wind_speed_10m_max",
-                        "wind_gusts_10m_max",
-                        "wind_direction_10m_dominant",
-                        "shortwave_radiation_sum",
-                        "sunshine_duration",
-                        "uv_index_max",
-                        "et0_fao_evapotranspiration",
-                    ]),
-                    "hourly": ",".join([
-                        "precipitation_probability",
-                        "precipitation",
-                        "wind_speed_10m",
-                        "wind_gusts_10m",
-                        "cloud_cover",
-                    ]),
-                    "timezone": "auto",
-                    "forecast_days": 1,
-                    "wind_speed_unit": "kmh",
-                    "temperature_unit": "celsius",
-                    "precipitation_unit": "mm",
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            # Process current weather
-            current_data = data.get("current", {})
-            current = WeatherCurrent(
-                time=current_data.get("time", datetime.now().isoformat()),
-                temperature_2m=current_data.get("temperature_2m"),
-                relative_humidity_2m=current_data.get("relative_humidity_2m"),
-                apparent_temperature=current_data.get("apparent_temperature"),
-                precipitation=current_data.get("precipitation"),
-                wind_speed_10m=current_data.get("wind_speed_10m"),
-                wind_gusts_10m=current_data.get("wind_gusts_10m"),
-                wind_direction_10m=current_data.get("wind_direction_10m"),
-                cloud_cover=current_data.get("cloud_cover"),
-                pressure_msl=current_data.get("pressure_msl"),
-                vapour_pressure_deficit=current_data.get("vapour_pressure_deficit"),
-            )
-            
-            # Process daily data
-            daily_data = data.get("daily", {})
-            daily_list = daily_data.get("time", [])
-            today = None
-            if daily_list:
-                idx = 0
-                today = WeatherToday(
-                    date=daily_list[idx],
-                    temperature_2m_max=_first(daily_data.get("temperature_2m_max")),
-                    temperature_2m_min=_first(daily_data.get("temperature_2m_min")),
-                    precipitation_sum=_first(daily_data.get("precipitation_sum")),
-                    precipitation_hours=_first(daily_data.get("precipitation_hours")),
-                    precipitation_probability_max=_first(daily_data.get("precipitation_probability_max")),
-                    precipitation_probability_mean=_first(daily_data.get("precipitation_probability_mean")),
-                    wind_speed_10m_max=_first(daily_data.get("wind_speed_10m_max")),
-                    wind_gusts_10m_max=_first(daily_data.get("wind_gusts_10m_max")),
-                    wind_direction_10m_dominant=_first(daily_data.get("wind_direction_10m_dominant")),
-                    shortwave_radiation_sum=_first(daily_data.get("shortwave_radiation_sum")),
-                    sunshine_duration=_first(daily_data.get("sunshine_duration")),
-                    uv_index_max=_first(daily_data.get("uv_index_max")),
-                    et0_fao_evapotranspiration=_first(daily_data.get("et0_fao_evapotranspiration")),
-                )
-            
-            # Calculate derived metrics
-            wb = None
-            wb_class = None
-            if today and today.precipitation_sum is not None and today.et0_fao_evapotranspiration is not None:
-                wb = today.precipitation_sum - today.et0_fao_evapotranspiration
-                wb_class = _classify_water_balance(wb)
-
-            temp_ok = (current.temperature_2m is not None) and (22 <= current.temperature_2m <= 30)
-
-            derived = WeatherDerived(
-                water_balance_today_mm=wb,
-                water_balance_class=wb_class,
-                temp_ok_22_30=temp_ok,
-            )
-
-            # Next 6 hours
-            hourly = data.get("hourly", {})
-            times: List[str] = hourly.get("time", [])
-            next_hours: List[NextHour] = []
-            start_idx = 0
-            current_time_str = current_data.get("time")
-            if current_time_str and isinstance(times, list):
-                try:
-                    if current_time_str in times:
-                        start_idx = times.index(current_time_str)
-                    else:
-                        now_dt = datetime.fromisoformat(current_time_str.replace("Z", "+00:00"))
-                        for i, ts in enumerate(times):
-                            try:
-                                t = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                                if t >= now_dt:
-                                    start_idx = i
-                                    break
-                            except Exception:
-                                continue
-                except Exception:
-                    start_idx = 0
-
-            for i in range(start_idx, min(start_idx + 6, len(times))):
-                next_hours.append(NextHour(
-                    time=times[i],
-                    precipitation_probability=_get(hourly.get("precipitation_probability"), i),
-                    precipitation=_get(hourly.get("precipitation"), i),
-                    wind_speed_10m=_get(hourly.get("wind_speed_10m"), i),
-                    wind_gusts_10m=_get(hourly.get("wind_gusts_10m"), i),
-                    cloud_cover=_get(hourly.get("cloud_cover"), i),
-                ))
-
-            # Operation window next 2-3 hours
-            op_ok = None
-            if next_hours:
-                check_range = next_hours[:3]
-                op_ok = all(
-                    (
-                        (h.precipitation_probability or 0) <= 20 and
-                        (h.wind_speed_10m or 0) <= 12
-                    ) for h in check_range
-                )
-                derived.operation_window_ok = op_ok
-            
-            units = {
-                "temperature_2m": "°C",
-                "relative_humidity_2m": "%",
-                "apparent_temperature": "°C",
-                "precipitation": "mm",
-                "wind_speed_10m": "km/h",
-                "wind_gusts_10m": "km/h",
-                "cloud_cover": "%",
-                "pressure_msl": "hPa",
-                "vapour_pressure_deficit": "kPa",
-                "et0_fao_evapotranspiration": "mm",
-                "shortwave_radiation_sum": "MJ/m²",
-                "sunshine_duration": "min",
-            }
-
-            result = {
-                "current": current.model_dump(),
-                "today": today.model_dump() if today else None,
-                "next_hours": [h.model_dump() for h in next_hours],
-                "derived": derived.model_dump(),
-                "units": units,
-                "meta": {
-                    "timezone": data.get("timezone"),
-                    "units": units,
-                },
-            }
-            
-            # Cache the result
-            set_weather_cache(cache_key, result)
-            return result
-            
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                point, fallback = fetches[task]
+                error = task.exception()
+                if error is None:
+                    outcome = {"status": "ok", "data": result_from_entry(task.result(), point, selection)}
+                elif fallback:
+                    logger.warning(f"Serving stale weather data for {point.key} after upstream error", extra=SAMPLED)
+                    outcome = {"status": "ok", "data": result_from_entry(fallback, point, selection)}
+                else:
+                    outcome = {"status": "not_found", "message": f"Error fetching weather data: {error}"}
+                for i in indexes_by_key[point.key]:
+                    yield i, outcome
+    finally:
+        # The shared fetches keep running for whoever else is waiting on them
+        for task in pending:
+            task.cancel()
+
+
+class BatchFetcher:
+    """Fetches forecast cells through weather_flight, one flight per cell.
+
+    Cells another request (or worker) is already fetching are joined; the ones
+    this fetcher leads are queued and sent together in chunked multi-location
+    upstream calls, grouped by the selection they are fetched with.
+    """
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(WEATHER_BATCH_CONCURRENCY)
+        self._queues: Dict[str, List[Tuple[GridPoint, asyncio.Future]]] = {}
+        self._selections: Dict[str, ForecastSelection] = {}
+        self._flush_scheduled = False
+        self._chunks: Set[asyncio.Task] = set()
+
+    def fetch(self, point: GridPoint, fetch_selection: ForecastSelection,
+              selection: ForecastSelection) -> "asyncio.Future[CacheEntry]":
+        """Fetch one cell with fetch_selection; resolves to its fresh cache entry"""
+        fn, probe = self._flight(point, fetch_selection, selection)
+        return asyncio.ensure_future(weather_flight.do(f"{point.key}|{fetch_selection.key}", fn, probe=probe))
+
+    def refresh(self, point: GridPoint, fetch_selection: ForecastSelection, selection: ForecastSelection) -> None:
+        """Refresh one (stale) cell in the background"""
+        fn, probe = self._flight(point, fetch_selection, selection)
+        weather_flight.refresh(f"{point.key}|{fetch_selection.key}", fn, probe=probe)
+
+    def _flight(self, point: GridPoint, fetch_selection: ForecastSelection, selection: ForecastSelection):
+        return (lambda: self._enqueue(point, fetch_selection)), (lambda: _fresh_entry(point.key, selection))
+
+    async def _enqueue(self, point: GridPoint, selection: ForecastSelection) -> CacheEntry:
+        # Runs once this fetcher leads the cell's flight
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.setdefault(selection.key, [])
+        self._selections[selection.key] = selection
+        queue.append((point, future))
+        if len(queue) >= WEATHER_BATCH_CHUNK_SIZE:
+            self._start_chunk(selection, self._queues.pop(selection.key))
+        elif not self._flush_scheduled:
+            # Cells whose flights start in the same loop iteration share a chunk
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        queues, self._queues = self._queues, {}
+        for key, queue in queues.items():
+            self._start_chunk(self._selections[key], queue)
+
+    def _start_chunk(self, selection: ForecastSelection, queue: List[Tuple[GridPoint, asyncio.Future]]) -> None:
+        task = asyncio.ensure_future(self._run_chunk(selection, queue))
+        self._chunks.add(task)
+        task.add_done_callback(self._chunks.discard)
+
+    async def _run_chunk(self, selection: ForecastSelection, queue: List[Tuple[GridPoint, asyncio.Future]]) -> None:
+        points = [point for point, _ in queue]
+        try:
+            async with self._semaphore:
+                entries = await _fetch_weather_chunk(points, selection)
+        except Exception as e:
+            logger.error(f"Error fetching weather batch chunk ({len(points)} locations): {e}", extra=SAMPLED)
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), entry in zip(queue, entries):
+            if not future.done():
+                future.set_result(entry)
+
+def make_record(payload: Dict[str, Any], selection: ForecastSelection) -> Dict[str, Any]:
+    """Cached form of a forecast: the raw location payload plus what it covers"""
+    return {
+        "days": selection.days,
+        "current": list(selection.current),
+        "daily": list(selection.daily),
+        "hourly": list(selection.hourly),
+        "payload": payload,
+    }
+
+def covers(record: Any, selection: ForecastSelection) -> bool:
+    if not isinstance(record, dict) or "payload" not in record:
+        return False
+    return (
+        record["days"] >= selection.days
+        and set(selection.current) <= set(record["current"])
+        and set(selection.daily) <= set(record["daily"])
+        and set(selection.hourly) <= set(record["hourly"])
+    )
+
+def widen(selection: ForecastSelection, record: Any) -> ForecastSelection:
+    """Union of a request with the coverage of an existing record"""
+    if not isinstance(record, dict) or "payload" not in record:
+        return selection
+
+    def merge(existing, requested):
+        return tuple(existing) + tuple(v for v in requested if v not in existing)
+
+    return ForecastSelection(
+        max(selection.days, record["days"]),
+        merge(record["current"], selection.current),
+        merge(record["daily"], selection.daily),
+        merge(record["hourly"], selection.hourly),
+        selection.hours,
+    )
+
+async def _fresh_entry(cache_key: str, selection: ForecastSelection) -> Optional[CacheEntry]:
+    # Straight from Redis: the leader's write must be visible to other workers
+    entry = await aget_weather_entry(cache_key, l1=False)
+    if entry and not entry.stale and covers(entry.data, selection):
+        return entry
+    return None
+
+def result_from_entry(entry: CacheEntry, point: GridPoint, selection: ForecastSelection) -> Dict[str, Any]:
+    """Build the response for a cached record, stamping its age into meta"""
+    result = build_weather_result(entry.data["payload"], point, selection)
+    meta = result["meta"]
+    age = entry.age
+    if entry.stored_at is not None:
+        meta["fetched_at"] = datetime.fromtimestamp(entry.stored_at, timezone.utc).isoformat()
+    meta["age_seconds"] = round(age, 1) if age is not None else None
+    meta["stale"] = entry.stale
+    return result
+
+async def _fetch_weather_data(point: GridPoint, selection: ForecastSelection) -> CacheEntry:
+    """Fetch and cache the forecast record for one grid cell"""
+    try:
+        # Get current weather and daily forecast
+        api_url = os.getenv("OPEN_METEO_API_URL", "https://api.open-meteo.com/v1/forecast")
+        response = await upstream_get(
+            "forecast",
+            api_url,
+            params=_forecast_params([point.latitude], [point.longitude], selection),
+            timeout=timeout_for(OPEN_METEO_TIMEOUT),
+        )
+        response.raise_for_status()
+        record = make_record(response.json(), selection)
+
+        # Cache the result
+        return await aset_weather_cache(point.key, record)
+
     except httpx.RequestError as e:
-        logger.error(f"Error fetching weather data: {e}", exc_info=True)
+        logger.error(f"Error fetching weather data: {e}", exc_info=True, extra=SAMPLED)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error fetching weather data: {e}", exc_info=True)
+        logger.error(f"Unexpected error fetching weather data: {e}", exc_info=True, extra=SAMPLED)
         raise
 
+async def _fetch_weather_chunk(points: List[GridPoint], selection: ForecastSelection) -> List[CacheEntry]:
+    """Fetch and cache forecast records for many grid cells with one upstream request"""
+    api_url = os.getenv("OPEN_METEO_API_URL", "https://api.open-meteo.com/v1/forecast")
+    response = await upstream_get(
+        "forecast",
+        api_url,
+        params=_forecast_params([p.latitude for p in points], [p.longitude for p in points], selection),
+        timeout=timeout_for(OPEN_METEO_TIMEOUT),
+    )
+    response.raise_for_status()
+    data = response.json()
+    # A single location comes back as an object, several as a list in request order
+    payloads = data if isinstance(data, list) else [data]
+    if len(payloads) != len(points):
+        raise ValueError(f"Expected {len(points)} locations from Open-Meteo, got {len(payloads)}")
+
+    records = [make_record(payload, selection) for payload in payloads]
+    return list(await asyncio.gather(*(aset_weather_cache(point.key, record) for point, record in zip(points, records))))
+
+def _forecast_params(latitudes: List[float], longitudes: List[float], selection: ForecastSelection) -> Dict[str, Any]:
+    """Query parameters for one or many locations (Open-Meteo accepts comma-separated lists)"""
+    params = {
+        "latitude": ",".join(str(lat) for lat in latitudes),
+        "longitude": ",".join(str(lon) for lon in longitudes),
+        "timezone": "auto",
+        "forecast_days": selection.days,
+        "wind_speed_unit": "kmh",
+        "temperature_unit": "celsius",
+        "precipitation_unit": "mm",
+    }
+    # Only ask for the sections/variables the request needs
+    for section in ("current", "daily", "hourly"):
+        names = getattr(selection, section)
+        if names:
+            params[section] = ",".join(names)
+    return params
+
+def build_weather_result(data: Dict[str, Any], point: GridPoint, selection: ForecastSelection = DEFAULT_SELECTION) -> Dict[str, Any]:
+    """Turn one Open-Meteo location payload into the API result (with derived metrics).
+
+    The payload may cover a longer horizon or more variables than the selection;
+    only the selected days and variables are serialized.
+    """
+    # Process current weather
+    current_data = data.get("current", {})
+    current = WeatherCurrent(
+        time=current_data.get("time", datetime.now().isoformat()),
+        **{name: current_data.get(name) for name in selection.current}
+    )
+
+    # Process daily data (columnar: one float array per variable)
+    daily = ForecastFrame.from_section(data.get("daily"), selection.daily, limit=selection.days)
+    days = daily.rows(label_field="date")
+    today = days[0] if days else None
+
+    # Calculate derived metrics
+    wb = None
+    wb_class = None
+    if today and today.get("precipitation_sum") is not None and today.get("et0_fao_evapotranspiration") is not None:
+        wb = today["precipitation_sum"] - today["et0_fao_evapotranspiration"]
+        wb_class = _classify_water_balance(wb)
+
+    rules = get_rules()
+    derived = WeatherDerived(
+        water_balance_today_mm=wb,
+        water_balance_class=wb_class,
+        temp_ok_22_30=rules.check("temp_ok_22_30", {name: current_data.get(name) for name in selection.current}),
+    )
+
+    # Next hours (6 by default), starting at the current hour (binary search on the time axis)
+    hourly = ForecastFrame.from_section(data.get("hourly"), selection.hourly, limit=selection.days * 24)
+    start_idx = hourly.index_at(current_data.get("time"))
+    window = hourly.window(start_idx, start_idx + selection.hours)
+    next_hours = window.rows()
+
+    if "precipitation" in selection.hourly:
+        derived.precipitation_next_hours_mm = window.sum("precipitation")
+    if "wind_gusts_10m" in selection.hourly:
+        derived.wind_gusts_max_next_hours = window.max("wind_gusts_10m")
+
+    # Operation windows (operation_rules.py): the default operation over the
+    # next hours, and every window of each operation until the end of the horizon
+    derived.operation_window_ok = rules.operation_ok(window)
+    ahead = hourly.window(start_idx, len(hourly))
+    if len(ahead):
+        derived.operation_windows = rules.windows(ahead) or None
+
+    selected = set(selection.current) | set(selection.daily) | set(selection.hourly)
+    units = {name: unit for name, unit in UNITS.items() if name in selected}
+
+    result = {
+        "current": current.model_dump(include={"time", *selection.current}),
+        "today": today,
+        "next_hours": next_hours,
+        "derived": derived.model_dump(),
+        "units": units,
+        "meta": {
+            "timezone": data.get("timezone"),
+            "units": units,
+            "forecast_days": selection.days,
+            "grid": {
+                "latitude": point.latitude,
+                "longitude": point.longitude,
+                "cell": point.cell,
+                "scheme": point.scheme,
+            },
+        },
+    }
+    if selection.days > 1:
+        result["daily"] = days
+    return result
+
 def _first(arr):
     if isinstance(arr, list) and arr:
         return arr[0]
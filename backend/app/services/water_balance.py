@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+import numpy as np
+from datetime import date, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from ..history_store import get_history_store
+from ..logger import logger, SAMPLED
+from ..spatial import snap_coordinates
+from .. import fao56
+from . import history
+
+# Soil water balance for a set of fields
+# The per-field state (depletion and the last day applied) is kept in the
+# history database, so each call only applies the days since the previous one:
+# daily rain and ET0 come from the history store (one range read/backfill per
+# grid cell, not per field), and all fields advance in one vectorized pass.
+# A field whose location, planting date or AWC changes starts over.
+# The saved state stops at the last final (archive) day; the provisional days
+# after it are re-applied on every read, so archive corrections are picked up.
+# Ad-hoc points from /weather are bounded: a long backfill runs in the
+# background instead of inline, and their saved rows expire.
+
+WATER_BALANCE_CONCURRENCY = int(os.getenv("WATER_BALANCE_CONCURRENCY", "8"))
+# /weather?planted_on=: days applied inline; longer backfills run in the background
+WATER_BALANCE_INLINE_MAX_DAYS = int(os.getenv("WATER_BALANCE_INLINE_MAX_DAYS", "31"))
+# Saved point states: dropped when unused this many days, and at most this many kept
+WATER_BALANCE_POINT_TTL_DAYS = int(os.getenv("WATER_BALANCE_POINT_TTL_DAYS", "30"))
+WATER_BALANCE_MAX_POINTS = int(os.getenv("WATER_BALANCE_MAX_POINTS", "10000"))
+POINT_PREFIX = "point:"
+_PRUNE_INTERVAL_SECONDS = 3600
+
+_INPUTS = ["precipitation_sum", "et0_fao_evapotranspiration"]
+
+
+class FieldSpec(NamedTuple):
+    id: str
+    latitude: float
+    longitude: float
+    planted_on: date
+    awc_mm: float = fao56.WATER_BALANCE_DEFAULT_AWC_MM
+
+
+def _signature(field: FieldSpec, cell: str) -> str:
+    return f"{cell}|{field.planted_on.isoformat()}|{field.awc_mm:g}"
+
+
+def _start(field: FieldSpec, signature: str, saved: Optional[Tuple[str, str, float]], earliest: date) -> Tuple[str, float]:
+    """(as_of, depletion) to continue from: the saved state, or field capacity for a new one"""
+    if saved is not None and saved[0] == signature and saved[1] >= (earliest - timedelta(days=1)).isoformat():
+        return saved[1], saved[2]
+    # New, changed or long-unused field: at field capacity the day before
+    # planting (or before the oldest day history can serve)
+    return max(field.planted_on - timedelta(days=1), earliest - timedelta(days=1)).isoformat(), 0.0
+
+
+def _window() -> Tuple[date, date, date]:
+    """(yesterday, last final day, oldest day history serves)"""
+    yesterday = history.today() - timedelta(days=1)
+    final_day = min(yesterday, history.today() - timedelta(days=history.HISTORY_ARCHIVE_LAG_DAYS))
+    # The balance can't start before the oldest day the history store serves
+    earliest = yesterday - timedelta(days=history.HISTORY_MAX_DAYS - 1)
+    return yesterday, final_day, earliest
+
+
+async def field_balances(fields: Sequence[FieldSpec], concurrency: int = WATER_BALANCE_CONCURRENCY) -> List[Dict[str, Any]]:
+    """Current soil water status of every field, advanced through yesterday"""
+    if not fields:
+        return []
+    store = get_history_store()
+    yesterday, final_day, earliest = _window()
+
+    cells = [snap_coordinates(f.latitude, f.longitude) for f in fields]
+    signatures = [_signature(f, cell.key) for f, cell in zip(fields, cells)]
+    stored = await asyncio.to_thread(store.load_balance_states, [f.id for f in fields])
+
+    starts = [_start(f, signatures[i], stored.get(f.id), earliest) for i, f in enumerate(fields)]
+    state = fao56.new_state(
+        [f.planted_on.isoformat() for f in fields],
+        [f.awc_mm for f in fields],
+        [as_of for as_of, _ in starts],
+    )._replace(depletion=np.array([depletion for _, depletion in starts], dtype=np.float64))
+
+    pending = state.as_of < np.datetime64(yesterday, "D")
+    if pending.any():
+        start, precipitation, et0, through = await _load_history(state, fields, cells, pending, yesterday, concurrency)
+        # Save only through the last final day; provisional days are applied on top
+        final = fao56.advance(state, start, precipitation, et0, through=np.minimum(through, np.datetime64(final_day, "D")))
+        rows = [
+            (f.id, signatures[i], str(final.as_of[i]), float(final.depletion[i]))
+            for i, f in enumerate(fields)
+            if stored.get(f.id) != (signatures[i], str(final.as_of[i]), float(final.depletion[i]))
+        ]
+        if rows:
+            await asyncio.to_thread(store.save_balance_states, rows)
+        state = fao56.advance(final, start, precipitation, et0, through=through)
+
+    return [{"id": f.id, **result} for f, result in zip(fields, fao56.summarize(state))]
+
+
+async def _load_history(state: fao56.BalanceState, fields: Sequence[FieldSpec], cells, pending: np.ndarray,
+                        yesterday: date, concurrency: int) -> Tuple[np.datetime64, np.ndarray, np.ndarray, np.ndarray]:
+    """Daily rain and ET0 for the pending fields: (first day, rain, ET0, last usable day per field)"""
+    start = state.as_of[pending].min() + 1
+    start_day = date.fromisoformat(str(start))
+    n_days = (yesterday - start_day).days + 1
+    precipitation = np.full((len(fields), n_days), np.nan)
+    et0 = np.full((len(fields), n_days), np.nan)
+    # Days a field may advance through: yesterday, or nothing if its cell's history failed
+    through = np.full(len(fields), np.datetime64(yesterday, "D"))
+
+    rows_by_cell: Dict[str, List[int]] = {}
+    for i in np.flatnonzero(pending):
+        rows_by_cell.setdefault(cells[i].key, []).append(int(i))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(rows: List[int]) -> None:
+        cell_start = max(date.fromisoformat(str(state.as_of[rows].min() + 1)), start_day)
+        field = fields[rows[0]]
+        async with semaphore:
+            try:
+                result = await history.get_history(field.latitude, field.longitude, cell_start, yesterday, "daily", _INPUTS)
+            except Exception as e:
+                result = None
+                logger.error(f"Water balance history failed for {cells[rows[0]].key}: {e}", extra=SAMPLED)
+        if result is None or not result["meta"]["complete"]:
+            through[rows] = state.as_of[rows]
+            return
+        # The cell's own timezone may still be on the day before yesterday
+        through[rows] = np.datetime64(result["meta"]["end"], "D")
+        offsets = (np.array(result["time"], dtype="datetime64[D]") - np.datetime64(start_day, "D")).astype(int)
+        precipitation[np.ix_(rows, offsets)] = np.array(result["data"]["precipitation_sum"], dtype=np.float64)
+        et0[np.ix_(rows, offsets)] = np.array(result["data"]["et0_fao_evapotranspiration"], dtype=np.float64)
+
+    await asyncio.gather(*(load(rows) for rows in rows_by_cell.values()))
+    return np.datetime64(start_day, "D"), precipitation, et0, through
+
+
+# field id -> background backfill for a point too far behind to compute inline
+_backfills: Dict[str, "asyncio.Task[Any]"] = {}
+_last_prune = 0.0
+
+
+async def point_balance(latitude: float, longitude: float, planted_on: date,
+                        awc_mm: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Soil water status for an ad-hoc location (used by /weather).
+
+    None if unavailable, {"pending": True} while a long backfill runs in the background.
+    """
+    awc_mm = fao56.WATER_BALANCE_DEFAULT_AWC_MM if awc_mm is None else awc_mm
+    cell = snap_coordinates(latitude, longitude).key
+    field = FieldSpec(f"{POINT_PREFIX}{cell}|{planted_on.isoformat()}|{awc_mm:g}", latitude, longitude, planted_on, awc_mm)
+    try:
+        store = get_history_store()
+        yesterday, final_day, earliest = _window()
+        if field.id in _backfills:
+            return {"pending": True}
+        saved = (await asyncio.to_thread(store.load_balance_states, [field.id])).get(field.id)
+        as_of, _ = _start(field, _signature(field, cell), saved, earliest)
+        if (yesterday - date.fromisoformat(as_of)).days > WATER_BALANCE_INLINE_MAX_DAYS:
+            task = asyncio.create_task(_backfill_point(field))
+            _backfills[field.id] = task
+            task.add_done_callback(lambda _: _backfills.pop(field.id, None))
+            return {"pending": True}
+        result = (await field_balances([field]))[0]
+        await _prune_points(store, final_day)
+        return result
+    except Exception as e:
+        logger.error(f"Soil water balance failed for {cell}: {e}", extra=SAMPLED)
+        return None
+
+
+async def _backfill_point(field: FieldSpec) -> None:
+    try:
+        await field_balances([field])
+    except Exception as e:
+        logger.error(f"Background soil water balance failed for {field.id}: {e}", extra=SAMPLED)
+
+
+async def _prune_points(store, final_day: date) -> None:
+    """Expire saved point states (at most once per _PRUNE_INTERVAL_SECONDS)"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < _PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = now
+    # Every use moves a point's saved day up to the last final day
+    cutoff = final_day - timedelta(days=WATER_BALANCE_POINT_TTL_DAYS)
+    removed = await asyncio.to_thread(store.prune_balance_states, POINT_PREFIX, cutoff.isoformat(), WATER_BALANCE_MAX_POINTS)
+    if removed:
+        logger.info(f"Pruned {removed} soil water point states")
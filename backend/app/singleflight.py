@@ -0,0 +1,126 @@
+import asyncio
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+from . import cache
+from .logger import logger
+
+# Request coalescing (single-flight)
+# Concurrent callers asking for the same key share a single upstream fetch.
+# "local" mode coalesces within one process. "redis" mode additionally takes a
+# short-lived Redis lock (via the asyncio client) so only one worker fetches a key;
+# the others poll the shared cache until the leader has written the result.
+
+SINGLEFLIGHT_MODE = os.getenv("SINGLEFLIGHT_MODE", "local").lower()
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "20.0"))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", "0.05"))
+
+# Only delete the lock if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    def __init__(self, namespace: str, mode: Optional[str] = None):
+        self.namespace = namespace
+        self.mode = mode or SINGLEFLIGHT_MODE
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def inflight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        probe: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Run fn once per key; concurrent callers await the same result.
+
+        probe is used in redis mode to read the shared cache while another
+        worker holds the lock.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start(key, fn, probe)
+        # Shield so a cancelled caller does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def refresh(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        probe: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> None:
+        """Start a background fetch for key unless one is already running"""
+        if key in self._inflight:
+            return
+        task = self._start(key, fn, probe)
+        task.add_done_callback(self._log_refresh_failure)
+
+    def _start(self, key, fn, probe) -> asyncio.Task:
+        task = asyncio.ensure_future(self._run(key, fn, probe))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        return task
+
+    def _log_refresh_failure(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.warning(f"Background refresh failed for {self.namespace}: {error}")
+
+    async def _run(self, key, fn, probe):
+        if self.mode == "redis" and cache.async_redis_client is not None:
+            return await self._run_with_lock(key, fn, probe)
+        return await fn()
+
+    async def _run_with_lock(self, key, fn, probe):
+        lock_key = f"lock:{self.namespace}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await cache.async_redis_client.set(lock_key, token, nx=True, px=int(SINGLEFLIGHT_LOCK_TTL * 1000))
+        except Exception as e:
+            logger.error(f"Redis lock error: {e}")
+            return await fn()
+
+        if acquired:
+            try:
+                return await fn()
+            finally:
+                try:
+                    await cache.async_redis_client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+                except Exception as e:
+                    logger.error(f"Redis unlock error: {e}")
+
+        # Another worker is fetching: wait for its result to land in the cache
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SINGLEFLIGHT_LOCK_TTL
+        while loop.time() < deadline:
+            await asyncio.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+            if probe is not None:
+                result = await probe()
+                if result:
+                    return result
+            try:
+                if not await cache.async_redis_client.exists(lock_key):
+                    break
+            except Exception as e:
+                logger.error(f"Redis lock error: {e}")
+                break
+
+        # Leader finished without caching (error) or lock expired: fetch ourselves
+        if probe is not None:
+            result = await probe()
+            if result:
+                return result
+        return await fn()
+
+
+weather_flight = SingleFlight("weather")
+geocoding_flight = SingleFlight("geo")
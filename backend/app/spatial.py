@@ -0,0 +1,92 @@
+import os
+from typing import NamedTuple, Optional, Tuple
+
+# Spatial cache keys
+# Forecast models resolve coordinates to grid cells several km wide, so nearby
+# points (fields of the same farm) get the same forecast. Snapping coordinates
+# before building the weather cache key lets those requests share one entry.
+#   none    -> raw coordinates (one entry per distinct float)
+#   round   -> nearest node of a regular lat/lon grid (WEATHER_GRID_RESOLUTION degrees)
+#   geohash -> centre of the geohash cell (WEATHER_GEOHASH_PRECISION chars)
+
+WEATHER_GRID_SCHEME = os.getenv("WEATHER_GRID_SCHEME", "round").lower()
+WEATHER_GRID_RESOLUTION = float(os.getenv("WEATHER_GRID_RESOLUTION", "0.05"))
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", "5"))
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+class GridPoint(NamedTuple):
+    latitude: float
+    longitude: float
+    cell: str
+    scheme: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.latitude},{self.longitude}"
+
+
+def snap_coordinates(latitude: float, longitude: float, scheme: Optional[str] = None) -> GridPoint:
+    """Snap a point to the configured cache grid"""
+    scheme = (scheme or WEATHER_GRID_SCHEME).lower()
+
+    if scheme == "round":
+        res = WEATHER_GRID_RESOLUTION
+        lat = round(round(latitude / res) * res, 6)
+        lon = round(round(longitude / res) * res, 6)
+        return GridPoint(lat, lon, f"{lat},{lon}", scheme)
+
+    if scheme == "geohash":
+        cell = geohash_encode(latitude, longitude, WEATHER_GEOHASH_PRECISION)
+        lat, lon = geohash_decode(cell)
+        return GridPoint(round(lat, 6), round(lon, 6), cell, scheme)
+
+    return GridPoint(latitude, longitude, f"{latitude},{longitude}", "none")
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+
+    while len(chars) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def geohash_decode(cell: str) -> Tuple[float, float]:
+    """Centre (lat, lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in cell:
+        value = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
@@ -0,0 +1,243 @@
+import asyncio
+import os
+import random
+import time
+import weakref
+import httpx
+from typing import Any, Dict, Optional
+from .http_client import get_http_client
+from .logger import logger, SAMPLED
+from . import metrics
+
+# Upstream resilience
+# Every call to Open-Meteo (forecast and geocoding) goes through upstream_get:
+#   - a per-process semaphore bounds outstanding requests; callers that cannot
+#     get a slot within UPSTREAM_QUEUE_TIMEOUT fail fast instead of piling up
+#   - connection errors, 429 and 5xx are retried with full-jitter exponential
+#     backoff, capped per request and by a shared retry budget (retries may be
+#     at most UPSTREAM_RETRY_BUDGET_RATIO of requests) so retries can't amplify
+#     an outage
+#   - a circuit breaker per API opens after UPSTREAM_BREAKER_FAILURES
+#     consecutive failures; while open, calls raise CircuitOpenError at once and
+#     the services fall back to stale cache. After UPSTREAM_BREAKER_RESET seconds
+#     a single trial request decides whether it closes again.
+
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "5.0"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.2"))
+UPSTREAM_RETRY_BACKOFF_MAX = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MAX", "2.0"))
+UPSTREAM_RETRY_BUDGET_RATIO = float(os.getenv("UPSTREAM_RETRY_BUDGET_RATIO", "0.2"))
+UPSTREAM_RETRY_BUDGET_MAX = float(os.getenv("UPSTREAM_RETRY_BUDGET_MAX", "10"))
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream call was not attempted (no free slot or circuit open)"""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+def _retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = UPSTREAM_BREAKER_FAILURES, reset_timeout: float = UPSTREAM_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            # One trial request at a time decides whether to close
+            self._trial = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def release(self) -> None:
+        """The call ended without a verdict (e.g. cancelled)"""
+        self._trial = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected,
+            "retry_in_seconds": round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1) if state == "open" else None,
+        }
+
+
+class RetryBudget:
+    """Token bucket: each request earns `ratio` tokens, each retry spends one"""
+
+    def __init__(self, ratio: float = UPSTREAM_RETRY_BUDGET_RATIO, max_tokens: float = UPSTREAM_RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_retry_budget = RetryBudget()
+# asyncio primitives are bound to one event loop (tests and CLIs run several)
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_in_flight = 0
+
+
+metrics.Gauge("upstream_requests_in_flight", "Open-Meteo requests currently outstanding", function=lambda: _in_flight)
+# (duration, {status class: counter}) per API, bound on first use
+_api_metrics: Dict[str, Any] = {}
+
+
+def _metrics_for(api: str):
+    bound = _api_metrics.get(api)
+    if bound is None:
+        statuses = {status: metrics.upstream_responses.labels(api, status) for status in metrics.STATUS_CLASSES + ("error",)}
+        bound = _api_metrics[api] = (metrics.upstream_request_duration.labels(api), statuses)
+    return bound
+
+
+def get_breaker(api: str) -> CircuitBreaker:
+    breaker = _breakers.get(api)
+    if breaker is None:
+        breaker = _breakers[api] = CircuitBreaker(api)
+    return breaker
+
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+    return semaphore
+
+
+async def _send(api: str, url: str, params: Optional[Dict[str, Any]], timeout: Any) -> httpx.Response:
+    global _in_flight
+    semaphore = _semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), UPSTREAM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise UpstreamUnavailable(f"No upstream slot free within {UPSTREAM_QUEUE_TIMEOUT}s")
+    duration, statuses = _metrics_for(api)
+    status = "error"
+    _in_flight += 1
+    started = time.perf_counter()
+    try:
+        response = await get_http_client().get(url, params=params, timeout=timeout)
+        status = metrics.status_class(response.status_code)
+        return response
+    finally:
+        # Queue wait excluded: this is the upstream's latency, not ours
+        duration.observe(time.perf_counter() - started)
+        statuses[status].inc()
+        _in_flight -= 1
+        semaphore.release()
+
+
+async def upstream_get(api: str, url: str, params: Optional[Dict[str, Any]] = None, timeout: Any = None) -> httpx.Response:
+    """GET with concurrency limit, retries and circuit breaker.
+
+    Returns the last response (callers still raise_for_status) or raises the
+    last transport error, UpstreamUnavailable or CircuitOpenError.
+    """
+    breaker = get_breaker(api)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{api} upstream unavailable (circuit open)")
+    _retry_budget.deposit()
+
+    attempt = 0
+    try:
+        while True:
+            error: Optional[Exception] = None
+            response: Optional[httpx.Response] = None
+            try:
+                response = await _send(api, url, params, timeout)
+            except UpstreamUnavailable:
+                # Our own queue is full: says nothing about the upstream's health
+                breaker.release()
+                raise
+            except httpx.TransportError as e:
+                error = e
+
+            if response is not None and not _retryable(response.status_code):
+                # Any non-5xx answer (including 4xx) means the upstream is healthy
+                breaker.record_success()
+                return response
+
+            # A read timeout already cost the full timeout; retrying it only stacks waits
+            final = isinstance(error, httpx.ReadTimeout)
+            if final or attempt >= UPSTREAM_MAX_RETRIES or not _retry_budget.withdraw():
+                breaker.record_failure()
+                if response is not None:
+                    return response
+                raise error
+
+            attempt += 1
+            delay = random.uniform(0, min(UPSTREAM_RETRY_BACKOFF_MAX, UPSTREAM_RETRY_BACKOFF * 2 ** attempt))
+            logger.warning(f"Retrying {api} request (attempt {attempt + 1}) in {delay:.2f}s: {error or response.status_code}", extra=SAMPLED)
+            await asyncio.sleep(delay)
+    except BaseException:
+        # Cancelled or unexpected error: don't leave a half-open trial pending
+        breaker.release()
+        raise
+
+
+def upstream_status() -> Dict[str, Any]:
+    """Breaker states, in-flight requests and retry budget (for /health)"""
+    return {
+        "in_flight": _in_flight,
+        "max_concurrency": UPSTREAM_MAX_CONCURRENCY,
+        "retry_budget": round(_retry_budget.tokens, 2),
+        "circuits": {name: breaker.snapshot() for name, breaker in _breakers.items()},
+    }
+
+
+def reset_upstream_state() -> None:
+    """Forget breaker and budget state (tests)"""
+    global _retry_budget
+    _breakers.clear()
+    _retry_budget = RetryBudget()
@@ -31,5 +31,6 @@ VARIABLE_MAP = {
     "hourly_precipitation": {"label": "Precipitação", "unit": "mm", "source": "hourly", "path": ["hourly", "precipitation"]},
     "hourly_wind_speed_10m": {"label": "Vento", "unit": "km/h", "source": "hourly", "path": ["hourly", "wind_speed_10m"]},
     "hourly_wind_gusts_10m": {"label": "Rajadas", "unit": "km/h", "source": "hourly", "path": ["hourly", "wind_gusts_10m"]},
+    "hourly_cloud_cover": {"label": "Nebulosidade", "unit": "%", "source": "hourly", "path": ["hourly", "cloud_cover"]},
 }
 
@@ -0,0 +1,155 @@
+"""End-to-end load scenarios against the ASGI app with a fake Open-Meteo upstream.
+
+Requests go through the whole stack (middleware, routes, caches, upstream
+client with retries/breaker) in-process via httpx.ASGITransport; the upstream
+is benchmarks.fake_open_meteo, also in-process, so runs need no network and
+are repeatable. Each scenario starts from empty caches.
+
+    hot_key        every request for the same location (response-cache path)
+    cold_key       every request for a new grid cell (full upstream path)
+    mixed          80% over a few hot locations, 15% cold, 5% /cities autocomplete
+    upstream_slow  cold keys against a slow, flaky upstream (queueing, retries)
+
+    cd backend && python -m benchmarks.bench_load --requests 2000 --concurrency 50 --output load.json
+"""
+import argparse
+import asyncio
+import dataclasses
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple
+
+import httpx
+
+from benchmarks.common import emit, summarize
+from benchmarks.fake_open_meteo import FakeOpenMeteo, FakeUpstreamConfig, upstream_client
+
+from app import cache, http_client, response_cache, upstream
+from app.main import app
+from app.services import geocoding
+
+HOT_LOCATIONS = [(-21.17 + i * 0.3, -47.81 + i * 0.3) for i in range(10)]
+CITY_QUERIES = ["rib", "ribeirao", "pira", "piracicaba", "sertaozinho", "jabo", "campinas", "franca", "araraquara", "sao c"]
+
+
+def _weather_url(lat: float, lon: float) -> str:
+    return f"/weather?city=Bench&lat={lat:.4f}&lon={lon:.4f}"
+
+
+def _cold_url(i: int) -> str:
+    # Steps wider than the cache grid, so every request is a new cell
+    return _weather_url(-33.0 + (i // 300) * 0.1, -73.0 + (i % 300) * 0.1)
+
+
+def _hot(i: int, rnd: random.Random) -> str:
+    return _weather_url(*HOT_LOCATIONS[0])
+
+
+def _cold(i: int, rnd: random.Random) -> str:
+    return _cold_url(i)
+
+
+def _mixed(i: int, rnd: random.Random) -> str:
+    roll = rnd.random()
+    if roll < 0.80:
+        return _weather_url(*rnd.choice(HOT_LOCATIONS))
+    if roll < 0.95:
+        return _cold_url(i)
+    return f"/cities?q={rnd.choice(CITY_QUERIES)}"
+
+
+class Scenario(NamedTuple):
+    name: str
+    url_for: Callable[[int, random.Random], str]
+    upstream: FakeUpstreamConfig
+
+
+SCENARIOS = {
+    "hot_key": Scenario("hot_key", _hot, FakeUpstreamConfig(latency_ms=50)),
+    "cold_key": Scenario("cold_key", _cold, FakeUpstreamConfig(latency_ms=50, jitter_ms=10)),
+    "mixed": Scenario("mixed", _mixed, FakeUpstreamConfig(latency_ms=50, jitter_ms=10, error_rate=0.01)),
+    "upstream_slow": Scenario("upstream_slow", _cold, FakeUpstreamConfig(latency_ms=500, jitter_ms=150, error_rate=0.05)),
+}
+
+
+def _outcome(response: httpx.Response) -> str:
+    # /weather answers 200 with status ok/not_found in the body
+    if response.status_code == 200 and response.url.path == "/weather":
+        return response.json().get("status", "200")
+    return str(response.status_code)
+
+
+def _reset_state() -> None:
+    cache._memory_cache.clear()
+    cache._l1_cache.clear()
+    response_cache._response_cache.clear()
+    geocoding._prefix_cache.clear()
+    upstream.reset_upstream_state()
+
+
+async def run_scenario(scenario: Scenario, requests: int, concurrency: int, seed: int = 7,
+                       latency_scale: float = 1.0) -> Dict[str, Any]:
+    config = dataclasses.replace(
+        scenario.upstream,
+        latency_ms=scenario.upstream.latency_ms * latency_scale,
+        jitter_ms=scenario.upstream.jitter_ms * latency_scale,
+    )
+    fake = FakeOpenMeteo(config)
+    _reset_state()
+    http_client.set_http_client(upstream_client(fake))
+    rnd = random.Random(seed)
+    urls = [scenario.url_for(i, rnd) for i in range(requests)]
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal next_index
+        while next_index < len(urls):
+            url = urls[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                status = _outcome(await client.get(url))
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=60) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await http_client.shutdown_http_client()
+
+    return {
+        **summarize(latencies),
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "outcomes": dict(statuses),
+        "upstream": {**fake.stats.as_dict(), "latency_ms": config.latency_ms, "error_rate": config.error_rate},
+    }
+
+
+async def main(scenarios: List[str], requests: int, concurrency: int, latency_scale: float) -> Dict[str, Any]:
+    app.state.limiter.enabled = False
+    results = {}
+    for name in scenarios:
+        results[name] = await run_scenario(SCENARIOS[name], requests, concurrency, latency_scale=latency_scale)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Repeatable (default: all)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply the fake upstream latencies")
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    args = parser.parse_args()
+    scenarios = args.scenario or list(SCENARIOS)
+    emit("load", asyncio.run(main(scenarios, args.requests, args.concurrency, args.latency_scale)), vars(args), args.output)
@@ -0,0 +1,85 @@
+"""Micro-benchmarks of the forecast parse/derive path and the cache get/set paths.
+
+Everything runs in-process (no network) against the configured cache backend,
+i.e. the memory cache unless REDIS_URL is set; each case reports the
+per-operation cost over --iterations calls.
+
+    cd backend && python -m benchmarks.bench_micro --iterations 5000 --output micro.json
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from benchmarks.common import emit
+from benchmarks.fake_open_meteo import forecast_payload
+
+from app import cache
+from app.cache import CacheEntry
+from app.memory_cache import MemoryCache
+from app.response_cache import build_response, serialize
+from app.services.open_meteo import build_selection, build_weather_result, make_record, result_from_entry
+from app.spatial import snap_coordinates
+
+
+def _timed(fn: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return {"iterations": iterations, "us_per_op": round(elapsed / iterations * 1e6, 3), "ops_per_sec": round(iterations / elapsed, 1)}
+
+
+async def _atimed(fn: Callable[[], Awaitable[Any]], iterations: int) -> Dict[str, float]:
+    await fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    elapsed = time.perf_counter() - start
+    return {"iterations": iterations, "us_per_op": round(elapsed / iterations * 1e6, 3), "ops_per_sec": round(iterations / elapsed, 1)}
+
+
+async def main(iterations: int) -> Dict[str, Any]:
+    point = snap_coordinates(-21.17, -47.81)
+    results: Dict[str, Any] = {}
+
+    # Parse/derive: raw location payload -> API result (current, today, next hours, derived)
+    for days in (1, 7, 16):
+        selection = build_selection(days)
+        sections = {"current": list(selection.current), "daily": list(selection.daily), "hourly": list(selection.hourly)}
+        payload = forecast_payload(point.latitude, point.longitude, days, sections)
+        results[f"build_weather_result_{days}d"] = _timed(lambda: build_weather_result(payload, point, selection), iterations)
+
+    selection = build_selection(7)
+    sections = {"current": list(selection.current), "daily": list(selection.daily), "hourly": list(selection.hourly)}
+    record = make_record(forecast_payload(point.latitude, point.longitude, 7, sections), selection)
+    entry = CacheEntry(data=record, stored_at=time.time(), ttl=cache.WEATHER_CACHE_TTL)
+    results["result_from_entry_7d"] = _timed(lambda: result_from_entry(entry, point, build_selection(1)), iterations)
+
+    result = result_from_entry(entry, point, selection)
+    results["serialize_result_7d"] = _timed(lambda: serialize(result), iterations)
+    results["build_response_7d"] = _timed(lambda: build_response(result, etag='W/"x"', stored_at=entry.stored_at), iterations)
+
+    # Cache paths (with REDIS_URL set these include the Redis round trip)
+    cache._memory_cache.clear()
+    await cache.aset_weather_cache(point.key, record)
+    results["cache_aset_weather"] = await _atimed(lambda: cache.aset_weather_cache(point.key, record), iterations)
+    results["cache_aget_weather_hit"] = await _atimed(lambda: cache.aget_weather_entry(point.key), iterations)
+    results["cache_aget_weather_miss"] = await _atimed(lambda: cache.aget_weather_entry("0.0,0.0"), iterations)
+
+    memory = MemoryCache(max_entries=1024)
+    keys = [f"k{i}" for i in range(2048)]
+    counter = iter(range(10 ** 9))
+    results["memory_cache_set_evicting"] = _timed(lambda: memory.set(keys[next(counter) % 2048], record, 600), iterations)
+    results["memory_cache_get"] = _timed(lambda: memory.get(keys[next(counter) % 2048]), iterations)
+    results["cache_backend"] = "redis" if cache.async_redis_client is not None else "memory"
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    args = parser.parse_args()
+    emit("micro", asyncio.run(main(args.iterations)), vars(args), args.output)
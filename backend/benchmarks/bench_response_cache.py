@@ -0,0 +1,70 @@
+"""Hit-path latency of GET /weather with and without the precomputed response cache.
+
+Both runs serve the forecast from the in-process weather cache (the upstream
+is mocked and called once), so the difference is the cost of rebuilding the
+City/WeatherResponse models, response_model validation and serialization.
+
+    cd backend && python -m benchmarks.bench_response_cache --requests 2000
+"""
+import argparse
+import asyncio
+import time
+from unittest.mock import patch
+
+import httpx
+import respx
+
+from benchmarks.common import emit, summarize
+from benchmarks.fake_open_meteo import forecast_payload
+
+from app.main import app
+from app import response_cache
+
+URL = "/weather?city=Ribeirao Preto&lat=-21.17&lon=-47.81&days=1"
+
+
+def _forecast(request: httpx.Request) -> httpx.Response:
+    """Synthetic forecast with exactly the variables the app asked for"""
+    params = request.url.params
+    sections = {name: [v for v in params.get(name, "").split(",") if v] for name in ("current", "daily", "hourly")}
+    payload = forecast_payload(float(params["latitude"]), float(params["longitude"]), int(params["forecast_days"]), sections)
+    return httpx.Response(200, json=payload)
+
+
+async def _run(client: httpx.AsyncClient, requests: int, headers: dict) -> list:
+    await client.get(URL, headers=headers)  # warm the weather (and response) cache
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(URL, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    return latencies
+
+
+async def main(requests: int, gzip: bool) -> dict:
+    app.state.limiter.enabled = False
+    headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+    results = {}
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(side_effect=_forecast)
+        respx_mock.route(host="testserver").pass_through()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            for name, enabled in (("without_response_cache", False), ("with_response_cache", True)):
+                response_cache._response_cache.clear()
+                with patch.object(response_cache, "RESPONSE_CACHE_ENABLED", enabled):
+                    results[name] = summarize(await _run(client, requests, headers))
+    before = results["without_response_cache"]["p50_ms"]
+    after = results["with_response_cache"]["p50_ms"]
+    results["p50_speedup"] = round(before / after, 2) if after else None
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--gzip", action="store_true", help="Send Accept-Encoding: gzip")
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    args = parser.parse_args()
+    emit("response_cache", asyncio.run(main(args.requests, args.gzip)), vars(args), args.output)
@@ -0,0 +1,65 @@
+"""Shared helpers for the benchmark scripts: latency summaries and JSON output."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# Keep the API's logs (fake upstream errors, retries) out of the JSON on stdout;
+# must be set before anything imports app.logger
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, Any]:
+    if not latencies_ms:
+        return {"requests": 0}
+    ordered = sorted(latencies_ms)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p) - 1))], 4)
+
+    return {
+        "requests": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 4),
+        "p50_ms": round(ordered[len(ordered) // 2], 4),
+        "p90_ms": pct(0.90),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1], 4),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def emit(benchmark: str, results: Dict[str, Any], params: Dict[str, Any], output: Optional[str] = None) -> Dict[str, Any]:
+    """Wrap results with run metadata and print them (or write them to `output`)"""
+    document = {
+        "benchmark": benchmark,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        Path(output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return document
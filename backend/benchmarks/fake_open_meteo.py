@@ -0,0 +1,153 @@
+"""Local stand-in for the Open-Meteo forecast and geocoding APIs.
+
+Answers /v1/forecast (single or comma-separated multi-location) and /v1/search
+with synthetic but well-formed payloads, after a configurable latency and with
+a configurable error rate. Used in-process by the benchmarks (upstream_client),
+or standalone to point a running API at it:
+
+    cd backend && python -m benchmarks.fake_open_meteo --port 8081 --latency-ms 80 --error-rate 0.02
+    OPEN_METEO_API_URL=http://127.0.0.1:8081/v1/forecast \\
+    OPEN_METEO_GEOCODING_API_URL=http://127.0.0.1:8081/v1/search uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+@dataclass
+class FakeUpstreamConfig:
+    latency_ms: float = 0.0
+    # Uniform +- jitter around latency_ms
+    jitter_ms: float = 0.0
+    # Fraction of requests answered with error_status instead of data
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int = 42
+
+
+@dataclass
+class FakeUpstreamStats:
+    forecast_calls: int = 0
+    forecast_locations: int = 0
+    search_calls: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+@dataclass
+class FakeOpenMeteo:
+    config: FakeUpstreamConfig = field(default_factory=FakeUpstreamConfig)
+    stats: FakeUpstreamStats = field(default_factory=FakeUpstreamStats)
+
+    def __post_init__(self):
+        self._random = random.Random(self.config.seed)
+        self.app = Starlette(routes=[
+            Route("/v1/forecast", self.forecast),
+            Route("/v1/search", self.search),
+        ])
+
+    def reset(self) -> None:
+        self.stats = FakeUpstreamStats()
+
+    async def _delay_or_error(self):
+        config = self.config
+        delay = config.latency_ms + self._random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if config.error_rate and self._random.random() < config.error_rate:
+            self.stats.errors += 1
+            return JSONResponse({"error": True, "reason": "fake upstream error"}, status_code=config.error_status)
+        return None
+
+    async def forecast(self, request: Request):
+        self.stats.forecast_calls += 1
+        error = await self._delay_or_error()
+        if error is not None:
+            return error
+        params = request.query_params
+        latitudes = [float(v) for v in params["latitude"].split(",")]
+        longitudes = [float(v) for v in params["longitude"].split(",")]
+        days = int(params.get("forecast_days", 1))
+        sections = {name: [v for v in params.get(name, "").split(",") if v] for name in ("current", "daily", "hourly")}
+        payloads = [forecast_payload(lat, lon, days, sections) for lat, lon in zip(latitudes, longitudes)]
+        self.stats.forecast_locations += len(payloads)
+        return JSONResponse(payloads[0] if len(payloads) == 1 else payloads)
+
+    async def search(self, request: Request):
+        self.stats.search_calls += 1
+        error = await self._delay_or_error()
+        if error is not None:
+            return error
+        name = request.query_params.get("name", "").strip().title()
+        count = int(request.query_params.get("count", 10))
+        results = [
+            {
+                "id": 3000000 + i,
+                "name": f"{name} {i}" if i else name,
+                "latitude": -21.0 - i * 0.1,
+                "longitude": -47.8 + i * 0.1,
+                "country": "Brasil",
+                "country_code": "BR",
+                "admin1": "São Paulo",
+                "timezone": "America/Sao_Paulo",
+            }
+            for i in range(min(count, 3))
+        ]
+        return JSONResponse({"results": results})
+
+
+def forecast_payload(latitude: float, longitude: float, days: int, sections: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Synthetic Open-Meteo location payload with the requested variables"""
+    start = datetime(2025, 11, 28)
+    # Deterministic per location, so repeated fetches return the same forecast
+    seed = int(abs(latitude) * 1000) * 100003 + int(abs(longitude) * 1000)
+    rnd = random.Random(seed)
+    hours = days * 24
+
+    def series(n: int) -> List[float]:
+        return [round(rnd.uniform(0, 30), 1) for _ in range(n)]
+
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "timezone": "America/Sao_Paulo",
+        "current": {"time": f"{start:%Y-%m-%d}T12:00", **{name: round(rnd.uniform(0, 30), 1) for name in sections["current"]}},
+        "daily": {
+            "time": [f"{start + timedelta(days=d):%Y-%m-%d}" for d in range(days)],
+            **{name: series(days) for name in sections["daily"]},
+        },
+        "hourly": {
+            "time": [f"{start + timedelta(hours=h):%Y-%m-%dT%H:00}" for h in range(hours)],
+            **{name: series(hours) for name in sections["hourly"]},
+        },
+    }
+
+
+def upstream_client(fake: FakeOpenMeteo) -> httpx.AsyncClient:
+    """Client that routes every upstream request to the fake app in-process"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app), base_url="http://fake-open-meteo")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeOpenMeteo(FakeUpstreamConfig(args.latency_ms, args.jitter_ms, args.error_rate))
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,96 @@
+import httpx
+import pytest
+from unittest.mock import patch
+
+from app import cache, http_client, response_cache
+from app.services import geocoding, grid
+from app import upstream
+
+
+def make_forecast_payload(**overrides):
+    """Open-Meteo /v1/forecast response for a single location"""
+    payload = {
+        "latitude": -21.17,
+        "longitude": -47.81,
+        "timezone": "America/Sao_Paulo",
+        "current": {
+            "time": "2025-11-28T12:00",
+            "temperature_2m": 25.0,
+            "relative_humidity_2m": 60,
+            "apparent_temperature": 26.0,
+            "precipitation": 0.0,
+            "wind_speed_10m": 10.0,
+            "wind_gusts_10m": 15.0,
+            "wind_direction_10m": 180,
+            "cloud_cover": 20,
+            "pressure_msl": 1013.0,
+            "vapour_pressure_deficit": 1.5
+        },
+        "daily": {
+            "time": ["2025-11-28"],
+            "temperature_2m_max": [30.0],
+            "temperature_2m_min": [20.0],
+            "precipitation_sum": [5.0],
+            "precipitation_hours": [2.0],
+            "precipitation_probability_max": [40],
+            "precipitation_probability_mean": [20],
+            "wind_speed_10m_max": [20.0],
+            "wind_gusts_10m_max": [30.0],
+            "wind_direction_10m_dominant": [180],
+            "shortwave_radiation_sum": [20.0],
+            "sunshine_duration": [600.0],
+            "uv_index_max": [8.0],
+            "et0_fao_evapotranspiration": [4.0]
+        },
+        "hourly": {
+            "time": ["2025-11-28T12:00", "2025-11-28T13:00", "2025-11-28T14:00"],
+            "precipitation_probability": [0, 0, 10],
+            "precipitation": [0.0, 0.0, 0.0],
+            "wind_speed_10m": [10.0, 10.0, 8.0],
+            "wind_gusts_10m": [15.0, 15.0, 12.0],
+            "cloud_cover": [20, 20, 30]
+        }
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture(autouse=True)
+def clear_memory_cache():
+    cache._memory_cache.clear()
+    cache._l1_cache.clear()
+    response_cache._response_cache.clear()
+    geocoding._prefix_cache.clear()
+    grid._grids.clear()
+    yield
+    cache._memory_cache.clear()
+    cache._l1_cache.clear()
+    response_cache._response_cache.clear()
+    geocoding._prefix_cache.clear()
+    grid._grids.clear()
+
+
+@pytest.fixture
+def mock_http_client(request):
+    """Install an httpx.MockTransport handler (sync or async) as the shared upstream client.
+
+    Call the fixture with the handler, or pass it with indirect parametrization.
+    """
+    def install(handler) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        http_client.set_http_client(client)
+        return client
+
+    if getattr(request, "param", None) is not None:
+        install(request.param)
+    yield install
+    http_client.set_http_client(None)
+
+
+@pytest.fixture(autouse=True)
+def reset_upstream():
+    # Fresh breakers/budget per test, and no real sleeping between retries
+    upstream.reset_upstream_state()
+    with patch("app.upstream.UPSTREAM_RETRY_BACKOFF", 0.0):
+        yield
+    upstream.reset_upstream_state()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import httpx
+import numpy as np
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.alerts import (
+    AlertBroker,
+    AlertEngine,
+    AlertField,
+    WebhookDispatcher,
+    compile_rules,
+    sse_events,
+    transitions,
+)
+from app.main import app
+
+RULES = compile_rules([
+    {"name": "heavy_rain", "variable": "hourly_precipitation", "aggregate": "sum", "threshold": 20, "clear": 10},
+    {"name": "strong_gusts", "variable": "hourly_wind_gusts_10m", "aggregate": "max", "threshold": 60},
+])
+
+FIELDS = [AlertField("a", -21.17, -47.81), AlertField("b", -22.0, -48.0), AlertField("c", -23.0, -49.0)]
+
+
+def _batch(rain, gusts):
+    """Fake get_weather_batch: per-field hourly rain and gust (None = fetch failed)"""
+    async def fake(locations, selection):
+        for i in reversed(range(len(locations))):
+            if rain[i] is None:
+                yield i, {"status": "not_found", "message": "upstream down"}
+                continue
+            rows = [{"time": f"T{h}", "precipitation": rain[i], "wind_gusts_10m": gusts[i]} for h in range(selection.hours)]
+            yield i, {"status": "ok", "data": {"next_hours": rows}}
+    return fake
+
+
+def test_hysteresis_keeps_state_between_clear_and_threshold():
+    rule = RULES[0]
+    previous = np.array([False, True, True, False, True])
+    values = np.array([15.0, 15.0, 5.0, 25.0, np.nan])
+    assert transitions(previous, values, rule).tolist() == [False, True, False, True, True]
+
+
+@pytest.mark.parametrize("spec", [
+    {"name": "x", "variable": "precipitation_sum", "aggregate": "sum", "threshold": 1},
+    {"name": "x", "variable": "hourly_precipitation", "aggregate": "mean", "threshold": 1},
+    {"name": "x", "variable": "hourly_precipitation", "aggregate": "sum", "threshold": 1, "clear": 2},
+])
+def test_invalid_rules_are_rejected(spec):
+    with pytest.raises(ValueError):
+        compile_rules([spec])
+
+
+@pytest.mark.asyncio
+async def test_engine_emits_only_state_changes():
+    broker = AlertBroker()
+    subscription = broker.subscribe()
+    engine = AlertEngine(RULES, broker, hours=6)
+
+    with patch("app.alerts.get_weather_batch", _batch([4.0, 0.0, 0.0], [10.0, 70.0, 10.0])):
+        stats = await engine.evaluate(FIELDS)
+    assert stats["triggered"] == 2 and stats["cleared"] == 0
+    events = [subscription.queue.get_nowait() for _ in range(2)]
+    assert {(e["field_id"], e["rule"], e["state"]) for e in events} == {("a", "heavy_rain", "triggered"), ("b", "strong_gusts", "triggered")}
+    assert next(e for e in events if e["rule"] == "heavy_rain")["value"] == 24.0
+
+    # Same conditions (and a failed fetch for "a"): nothing new
+    with patch("app.alerts.get_weather_batch", _batch([None, 0.0, 0.0], [None, 70.0, 10.0])):
+        stats = await engine.evaluate(FIELDS)
+    assert stats["triggered"] == stats["cleared"] == 0 and stats["failed"] == 1
+    assert subscription.queue.empty()
+
+    # Rain eases but stays above the clear level for "a"; gusts drop for "b"
+    with patch("app.alerts.get_weather_batch", _batch([2.0, 0.0, 0.0], [10.0, 20.0, 10.0])):
+        stats = await engine.evaluate(FIELDS)
+    assert (stats["triggered"], stats["cleared"], stats["active"]) == (0, 1, 1)
+    assert subscription.queue.get_nowait()["state"] == "cleared"
+    assert [(a["field_id"], a["rule"]) for a in engine.active_alerts()] == [("a", "heavy_rain")]
+
+
+@pytest.mark.asyncio
+async def test_engine_evaluates_in_chunks():
+    calls = []
+    fake = _batch([4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+
+    async def counting(locations, selection):
+        calls.append(len(locations))
+        async for item in fake(locations, selection):
+            yield item
+
+    engine = AlertEngine(RULES, AlertBroker(), hours=6, batch_size=2)
+    with patch("app.alerts.get_weather_batch", counting):
+        stats = await engine.evaluate(FIELDS)
+    assert calls == [2, 1]
+    assert stats["triggered"] == 3
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_cut_off_and_replays():
+    broker = AlertBroker(queue_size=2, replay_size=10)
+    slow = broker.subscribe()
+    for i in range(3):
+        broker.publish({"field_id": str(i)})
+    assert broker.subscribers == 0 and slow.overflowed
+    assert not slow.finished
+    slow.queue.get_nowait(), slow.queue.get_nowait()
+    assert slow.finished
+
+    resumed = broker.subscribe(last_event_id=2)
+    assert resumed.queue.get_nowait()["field_id"] == "2"
+    assert resumed.queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_sse_format_and_heartbeat():
+    broker = AlertBroker()
+    subscription = broker.subscribe()
+    stream = sse_events(subscription, heartbeat=0.01)
+    assert await stream.__anext__() == "retry: 5000\n\n"
+    assert await stream.__anext__() == ": keepalive\n\n"
+    broker.publish({"field_id": "a", "rule": "heavy_rain"})
+    chunk = await stream.__anext__()
+    assert chunk.startswith("id: 1\nevent: alert\ndata: ")
+    assert json.loads(chunk.split("data: ", 1)[1])["field_id"] == "a"
+    await stream.aclose()
+    assert broker.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_webhook_dispatcher_bounds_concurrency_and_retries(mock_http_client):
+    state = {"active": 0, "peak": 0, "bodies": [], "fail_once": True}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        if state["fail_once"]:
+            state["fail_once"] = False
+            return httpx.Response(503)
+        state["bodies"].append(json.loads(request.content))
+        return httpx.Response(204)
+
+    mock_http_client(handler)
+    dispatcher = WebhookDispatcher("https://hooks.example/alerts", concurrency=2, queue_size=4, retries=1)
+    try:
+        with patch("app.alerts.random.uniform", return_value=0.0):
+            dispatcher.start()
+            for i in range(6):
+                assert await dispatcher.submit({"field_id": str(i)})
+            await asyncio.wait_for(dispatcher.queue.join(), 5)
+    finally:
+        await dispatcher.stop()
+    assert state["peak"] == 2
+    assert sorted(b["field_id"] for b in state["bodies"]) == [str(i) for i in range(6)]
+
+
+@pytest.mark.asyncio
+async def test_webhook_queue_full_drops_after_timeout():
+    dispatcher = WebhookDispatcher("https://hooks.example/alerts", queue_size=1, enqueue_timeout=0.01)
+    assert await dispatcher.submit({"field_id": "a"})
+    assert not await dispatcher.submit({"field_id": "b"})
+
+
+def test_active_alerts_route():
+    response = TestClient(app).get("/alerts")
+    assert response.status_code == 200
+    body = response.json()
+    assert [rule["name"] for rule in body["rules"]] == ["heavy_rain", "strong_gusts"]
+    assert body["active"] == []
@@ -0,0 +1,59 @@
+import json
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app import cache
+from app.cache import (
+    aget_weather_cache,
+    aset_weather_cache,
+    aget_geocoding_cache,
+    aset_geocoding_cache,
+    WEATHER_CACHE_TTL,
+    WEATHER_CACHE_STALE_TTL,
+)
+from app.schemas import City
+
+
+@pytest.mark.asyncio
+async def test_async_redis_set_get():
+    mock_redis = AsyncMock()
+    mock_redis.get.return_value = json.dumps({"data": {"temp": 25}, "stored_at": cache.time.time()})
+
+    with patch("app.cache.async_redis_client", mock_redis):
+        await aset_weather_cache("k", {"temp": 25})
+        key, ttl, _payload = mock_redis.setex.call_args[0]
+        assert key == "weather:k"
+        assert ttl == WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL
+
+        assert await aget_weather_cache("k") == {"temp": 25}
+        # Second read is served by the L1
+        assert await aget_weather_cache("k") == {"temp": 25}
+
+    mock_redis.get.assert_awaited_once_with("weather:k")
+
+
+@pytest.mark.asyncio
+async def test_async_redis_errors_fall_back():
+    mock_redis = AsyncMock()
+    mock_redis.get.side_effect = ConnectionError("redis down")
+    mock_redis.setex.side_effect = ConnectionError("redis down")
+
+    with patch("app.cache.async_redis_client", mock_redis):
+        assert await aget_weather_cache("k") is None
+        # Writes land in the memory fallback instead of raising
+        await aset_weather_cache("k", {"temp": 25})
+
+    with patch("app.cache.async_redis_client", None):
+        assert await aget_weather_cache("k") == {"temp": 25}
+
+
+@pytest.mark.asyncio
+async def test_async_memory_fallback_geocoding():
+    city = City(
+        name="Sertãozinho", admin1="São Paulo", country="Brasil",
+        latitude=-21.14, longitude=-47.99, timezone="America/Sao_Paulo",
+        label="Sertãozinho - São Paulo - Brasil",
+    )
+    with patch("app.cache.async_redis_client", None):
+        await aset_geocoding_cache("sertaozinho", [city])
+        assert await aget_geocoding_cache("sertaozinho") == [city]
@@ -0,0 +1,40 @@
+import pytest
+
+from app.main import app
+from benchmarks.bench_load import SCENARIOS, run_scenario
+from benchmarks.fake_open_meteo import FakeOpenMeteo, FakeUpstreamConfig, upstream_client
+
+
+@pytest.mark.asyncio
+async def test_fake_upstream_answers_multi_location_forecasts():
+    fake = FakeOpenMeteo()
+    async with upstream_client(fake) as client:
+        response = await client.get("/v1/forecast", params={
+            "latitude": "-21.1,-22.7", "longitude": "-47.8,-47.6", "forecast_days": 2,
+            "daily": "precipitation_sum", "hourly": "precipitation",
+        })
+
+    payloads = response.json()
+    assert len(payloads) == 2
+    assert len(payloads[0]["daily"]["precipitation_sum"]) == 2
+    assert len(payloads[0]["hourly"]["time"]) == 48
+    assert fake.stats.forecast_locations == 2
+
+
+@pytest.mark.asyncio
+async def test_fake_upstream_error_rate():
+    fake = FakeOpenMeteo(FakeUpstreamConfig(error_rate=1.0))
+    async with upstream_client(fake) as client:
+        response = await client.get("/v1/search", params={"name": "x"})
+    assert response.status_code == 503
+    assert fake.stats.errors == 1
+
+
+@pytest.mark.asyncio
+async def test_load_scenario_smoke(monkeypatch):
+    monkeypatch.setattr(app.state.limiter, "enabled", False)
+    result = await run_scenario(SCENARIOS["cold_key"], requests=20, concurrency=4, latency_scale=0)
+
+    assert result["requests"] == 20
+    assert result["outcomes"] == {"ok": 20}
+    assert result["upstream"]["forecast_calls"] == 20
@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from app.cache import get_weather_cache, set_weather_cache, WEATHER_CACHE_TTL
+from app.cache import get_weather_cache, set_weather_cache, get_weather_entry, WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL
 
 class TestCache(unittest.TestCase):
     def setUp(self):
@@ -8,14 +8,19 @@ class TestCache(unittest.TestCase):
         from app.cache import _memory_cache
         _memory_cache.clear()
 
+    @patch("app.cache.time.time", return_value=1000.0)
     @patch("app.cache.redis_client")
-    def test_redis_set_get(self, mock_redis):
-        # Setup mock
+    def test_redis_set_get(self, mock_redis, _mock_time):
+        # Setup mock (entries written before timestamps were stored are still readable)
         mock_redis.get.return_value = '{"temp": 25}'
         
-        # Test Set
+        # Test Set (expiry is the hard TTL so stale entries can still be served)
         set_weather_cache("test-key", {"temp": 25})
-        mock_redis.setex.assert_called_with("weather:test-key", WEATHER_CACHE_TTL, '{"temp": 25}')
+        mock_redis.setex.assert_called_with(
+            "weather:test-key",
+            WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL,
+            '{"data": {"temp": 25}, "stored_at": 1000.0}'
+        )
         
         # Test Get
         result = get_weather_cache("test-key")
@@ -29,5 +34,24 @@ class TestCache(unittest.TestCase):
             result = get_weather_cache("mem-key")
             self.assertEqual(result, {"val": 1})
 
+    def test_entry_age_and_staleness(self):
+        with patch("app.cache.redis_client", None):
+            with patch("app.cache.time.time", return_value=1000.0):
+                set_weather_cache("age-key", {"val": 1})
+
+            with patch("app.cache.time.time", return_value=1000.0 + 30):
+                entry = get_weather_entry("age-key")
+                self.assertEqual(entry.age, 30)
+                self.assertFalse(entry.stale)
+
+            with patch("app.cache.time.time", return_value=1000.0 + WEATHER_CACHE_TTL + 1):
+                entry = get_weather_entry("age-key")
+                self.assertTrue(entry.stale)
+                self.assertEqual(entry.data, {"val": 1})
+
+            # Past the hard TTL the entry is gone
+            with patch("app.cache.time.time", return_value=1000.0 + WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL):
+                self.assertIsNone(get_weather_entry("age-key"))
+
 if __name__ == '__main__':
     unittest.main()
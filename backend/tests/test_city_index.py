@@ -0,0 +1,95 @@
+import respx
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.city_index import get_city_index, load_city_index
+
+client = TestClient(app)
+
+
+def _names(query, **kwargs):
+    return [c.name for c in get_city_index().search(query, **kwargs)]
+
+
+def test_prefix_search_is_accent_insensitive():
+    assert _names("ribeirao")[0] == "Ribeirão Preto"
+    assert _names("RIBEIRÃO PR")[0] == "Ribeirão Preto"
+    assert _names("santa barbara d oeste") == ["Santa Bárbara d'Oeste"]
+
+
+def test_results_ranked_by_population():
+    assert _names("sao jose")[:3] == ["São José dos Campos", "São José do Rio Preto", "São José dos Pinhais"]
+    # Word prefixes match too, after names that start with the query
+    assert _names("preto")[:2] == ["Ribeirão Preto", "São José do Rio Preto"]
+
+
+def test_indexes_every_municipality():
+    assert len(get_city_index()) == 5570
+    assert _names("sao jose do rio pardo") == ["São José do Rio Pardo"]
+    assert _names("campo limpo paulista") == ["Campo Limpo Paulista"]
+    assert _names("serrana")[0] == "Serrana"
+
+
+def test_state_suffix_filters_results():
+    assert _names("sao jose sc") == ["São José", "São José do Cedro", "São José do Cerrito"]
+    assert _names("campo grande - ms") == ["Campo Grande"]
+
+
+def test_fuzzy_match_tolerates_typos():
+    assert _names("piracicba") == []
+    assert [c.name for c in get_city_index().fuzzy_search("piracicba")][0] == "Piracicaba"
+    assert get_city_index().fuzzy_search("qwxz") == []
+
+
+def test_city_fields_and_timezones():
+    city = get_city_index().search("eirunepe")[0]
+    assert city.admin1 == "Amazonas"
+    assert city.timezone == "America/Eirunepe"
+    assert city.label == "Eirunepé - Amazonas - Brasil"
+    assert get_city_index().search("cuiaba")[0].timezone == "America/Cuiaba"
+
+
+def test_loads_ibge_municipality_list(tmp_path):
+    path = tmp_path / "municipios.csv"
+    path.write_text(
+        "codigo_ibge,nome,latitude,longitude,capital,codigo_uf,fuso_horario\n"
+        "1200401,Rio Branco,-9.97499,-67.8243,1,12,America/Rio_Branco\n"
+        "3543402,Ribeirão Preto,-21.1699,-47.8099,0,35,America/Sao_Paulo\n",
+        encoding="utf-8",
+    )
+    index = load_city_index(str(path))
+    assert len(index) == 2
+    city = index.search("rio b")[0]
+    assert (city.name, city.admin1, city.timezone) == ("Rio Branco", "Acre", "America/Rio_Branco")
+
+
+def test_cities_route_uses_index_before_remote_api():
+    with respx.mock(base_url="https://geocoding-api.open-meteo.com", assert_all_called=False) as respx_mock:
+        route = respx_mock.get("/v1/search").mock(return_value=Response(200, json={"results": [{
+            "name": "Bonfim Paulista", "latitude": -21.26, "longitude": -47.81,
+            "country_code": "BR", "admin1": "São Paulo", "timezone": "America/Sao_Paulo",
+        }]}))
+        local = client.get("/cities?q=sertaoz")
+        assert route.call_count == 0
+        remote = client.get("/cities?q=Bonfim Paulista")
+        assert route.call_count == 1
+
+    assert [(c["name"], c["admin1"]) for c in local.json()] == [("Sertãozinho", "São Paulo"), ("Sertãozinho", "Paraíba")]
+    assert [c["name"] for c in remote.json()] == ["Bonfim Paulista"]
+
+
+def test_near_miss_is_not_answered_with_a_different_city():
+    # A district missing from the index is close to "Paulista" and "Bonfim"; the
+    # remote answer wins, and fuzzy matches are used only when it finds nothing
+    with respx.mock(base_url="https://geocoding-api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/search")
+        route.side_effect = lambda request: Response(200, json={"results": [{
+            "name": "Distrito de Bonfim Paulista", "latitude": -21.26, "longitude": -47.81,
+            "country_code": "BR", "admin1": "São Paulo", "timezone": "America/Sao_Paulo",
+        }]} if "bonfim" in request.url.params["name"] else {})
+        near_miss = client.get("/cities?q=distrito de bonfim paulista")
+        typo = client.get("/cities?q=piracicba")
+
+    assert [c["name"] for c in near_miss.json()] == ["Distrito de Bonfim Paulista"]
+    assert typo.json()[0]["name"] == "Piracicaba"
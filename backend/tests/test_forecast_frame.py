@@ -0,0 +1,53 @@
+import math
+import unittest
+
+from app.forecast_frame import ForecastFrame
+
+HOURLY = {
+    "time": ["2025-11-28T12:00", "2025-11-28T13:00", "2025-11-28T14:00", "2025-11-28T15:00"],
+    "precipitation": [0.0, None, 1.5, 2.0],
+    "wind_speed_10m": [10.0, 14.0, None, 8.0],
+    "precipitation_probability": [0, 10, 30, None],
+}
+
+
+class TestForecastFrame(unittest.TestCase):
+    def setUp(self):
+        self.frame = ForecastFrame.from_section(HOURLY, ["precipitation", "wind_speed_10m", "precipitation_probability"])
+
+    def test_nulls_become_nan(self):
+        self.assertEqual(len(self.frame), 4)
+        self.assertTrue(math.isnan(self.frame.column("precipitation")[1]))
+        self.assertTrue(all(math.isnan(v) for v in self.frame.column("missing_var")))
+
+    def test_index_at_uses_first_row_at_or_after(self):
+        self.assertEqual(self.frame.index_at("2025-11-28T13:00"), 1)
+        self.assertEqual(self.frame.index_at("2025-11-28T13:15"), 2)
+        self.assertEqual(self.frame.index_at("2025-11-28T11:00"), 0)
+        # Past the end or unknown: start at the beginning
+        self.assertEqual(self.frame.index_at("2025-11-29T00:00"), 0)
+        self.assertEqual(self.frame.index_at(None), 0)
+
+    def test_window_statistics(self):
+        window = self.frame.window(1, 4)
+        self.assertEqual(window.sum("precipitation"), 3.5)
+        self.assertEqual(window.max("wind_speed_10m"), 14.0)
+        self.assertIsNone(window.window(0, 0).sum("precipitation"))
+
+    def test_threshold_mask(self):
+        mask = self.frame.within({"precipitation_probability": 20, "wind_speed_10m": 12})
+        self.assertEqual(mask.tolist(), [True, False, False, True])
+
+    def test_rows_serialize_nulls_as_none(self):
+        rows = self.frame.window(0, 2).rows()
+        self.assertEqual(rows[0], {"time": "2025-11-28T12:00", "precipitation": 0.0, "wind_speed_10m": 10.0, "precipitation_probability": 0.0})
+        self.assertIsNone(rows[1]["precipitation"])
+
+    def test_limit_truncates_and_pads(self):
+        frame = ForecastFrame.from_section({"time": HOURLY["time"], "precipitation": [1.0]}, ["precipitation"], limit=3)
+        self.assertEqual(len(frame), 3)
+        self.assertEqual(frame.sum("precipitation"), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import pytest
+import respx
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.open_meteo import build_selection, get_weather_data, DEFAULT_SELECTION
+from tests.conftest import make_forecast_payload
+
+client = TestClient(app)
+
+
+def _multi_day_payload(days):
+    dates = [f"2025-12-{d + 1:02d}" for d in range(days)]
+    hours = [f"{date}T{h:02d}:00" for date in dates for h in range(24)]
+    daily = {name: [float(i) for i in range(days)] for name in DEFAULT_SELECTION.daily}
+    hourly = {name: [1.0] * len(hours) for name in DEFAULT_SELECTION.hourly}
+    return make_forecast_payload(
+        current={"time": "2025-12-01T10:00", "temperature_2m": 24.0},
+        daily={"time": dates, **daily},
+        hourly={"time": hours, **hourly},
+    )
+
+
+def test_build_selection_maps_variable_names():
+    selection = build_selection(7, ["precipitation_sum", "hourly_precipitation", "temperature_2m"], 48)
+    assert selection.days == 7
+    assert selection.hours == 48
+    assert selection.current == ("temperature_2m",)
+    assert selection.daily == ("precipitation_sum",)
+    assert selection.hourly == ("precipitation",)
+
+
+@pytest.mark.parametrize("kwargs", [{"days": 0}, {"days": 17}, {"variables": ["nope"]}, {"days": 1, "hours": 25}])
+def test_build_selection_rejects_invalid(kwargs):
+    with pytest.raises(ValueError):
+        build_selection(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_long_horizon_serves_shorter_subset_without_upstream_call():
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=_multi_day_payload(16)))
+
+        full = await get_weather_data(-21.17, -47.81, days=16)
+        subset = await get_weather_data(-21.17, -47.81, days=3, variables=["precipitation_sum", "hourly_precipitation"], hours=12)
+
+    assert route.call_count == 1
+    assert route.calls[0].request.url.params["forecast_days"] == "16"
+    assert len(full["daily"]) == 16
+
+    assert [d["date"] for d in subset["daily"]] == ["2025-12-01", "2025-12-02", "2025-12-03"]
+    assert subset["today"] == {"date": "2025-12-01", "precipitation_sum": 0.0}
+    assert subset["current"] == {"time": "2025-12-01T10:00"}
+    assert len(subset["next_hours"]) == 12
+    assert set(subset["next_hours"][0]) == {"time", "precipitation"}
+    assert subset["next_hours"][0]["time"] == "2025-12-01T10:00"
+    assert subset["units"] == {"precipitation": "mm"}
+
+
+@pytest.mark.asyncio
+async def test_subset_fetches_only_requested_variables_and_widens_later():
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=_multi_day_payload(7)))
+
+        await get_weather_data(-22.72, -47.64, variables=["precipitation_sum"])
+        params = route.calls[0].request.url.params
+        assert params["daily"] == "precipitation_sum"
+        assert "current" not in params and "hourly" not in params
+
+        # A wider request refetches the union so both shapes stay cached
+        await get_weather_data(-22.72, -47.64, days=7, variables=["et0_fao_evapotranspiration"])
+        params = route.calls[1].request.url.params
+        assert params["daily"] == "precipitation_sum,et0_fao_evapotranspiration"
+        assert params["forecast_days"] == "7"
+
+        await get_weather_data(-22.72, -47.64, variables=["precipitation_sum"])
+
+    assert route.call_count == 2
+
+
+def test_weather_route_accepts_horizon_and_variables():
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=_multi_day_payload(7)))
+        response = client.get("/weather?city=Ribeirao&lat=-21.5&lon=-47.5&days=7&variables=precipitation_sum")
+
+    data = response.json()
+    assert data["status"] == "ok"
+    assert len(data["data"]["daily"]) == 7
+
+    response = client.get("/weather?city=Ribeirao&lat=-21.5&lon=-47.5&variables=unknown_var")
+    assert response.status_code == 400
@@ -1,6 +1,7 @@
 import pytest
 import respx
 from httpx import Response
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -32,8 +33,9 @@ async def test_search_cities_integration():
         ]
     }
 
-    # Mock the external API call
-    with respx.mock(base_url="https://geocoding-api.open-meteo.com", assert_all_called=False) as respx_mock:
+    # Mock the external API call (the local index also knows São Paulo)
+    with respx.mock(base_url="https://geocoding-api.open-meteo.com", assert_all_called=False) as respx_mock, \
+            patch("app.city_index.CITY_INDEX_ENABLED", False):
         respx_mock.get("/v1/search").mock(return_value=Response(200, json=mock_data))
 
         response = client.get("/cities/?q=Sao Paulo")
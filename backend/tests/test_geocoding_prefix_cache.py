@@ -0,0 +1,75 @@
+import httpx
+import pytest
+from unittest.mock import patch
+
+from app.services.geocoding import search_cities, geocoding_cache_stats, GEOCODING_RESULT_COUNT
+
+
+def _result(name, admin1="São Paulo", country_code="BR"):
+    return {"name": name, "latitude": -21.0, "longitude": -47.0, "country_code": country_code,
+            "admin1": admin1, "timezone": "America/Sao_Paulo"}
+
+
+@pytest.fixture
+def upstream(mock_http_client):
+    calls = []
+    responses = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        name = request.url.params["name"]
+        calls.append(name)
+        return httpx.Response(200, json={"results": responses.get(name, [])})
+
+    mock_http_client(handler)
+    # Exercise the remote path only
+    with patch("app.city_index.CITY_INDEX_ENABLED", False):
+        yield calls, responses
+
+
+@pytest.mark.asyncio
+async def test_longer_queries_filter_a_complete_prefix(upstream):
+    calls, responses = upstream
+    responses["Rib"] = [
+        _result("Ribeirão Pires"),
+        _result("Ribeirão Preto"),
+        _result("Ribeira do Pombal", "Bahia"),
+        _result("Ribeira", country_code="PT"),
+    ]
+    before = geocoding_cache_stats()
+
+    assert [c.name for c in await search_cities("Rib")] == ["Ribeirão Pires", "Ribeirão Preto", "Ribeira do Pombal"]
+    assert [c.name for c in await search_cities("Ribei")] == ["Ribeirão Pires", "Ribeirão Preto", "Ribeira do Pombal"]
+    assert [c.name for c in await search_cities("Ribeirão")] == ["Ribeirão Pires", "Ribeirão Preto"]
+    assert [c.name for c in await search_cities("ribeirao pr")] == ["Ribeirão Preto"]
+    assert await search_cities("ribeirao x") == []
+
+    after = geocoding_cache_stats()
+    assert calls == ["Rib"]
+    assert after["upstream_calls"] - before["upstream_calls"] == 1
+    assert after["prefix_hits"] - before["prefix_hits"] == 4
+
+
+@pytest.mark.asyncio
+async def test_truncated_results_are_not_used_as_prefix(upstream):
+    calls, responses = upstream
+    responses["Sa"] = [_result(f"Santa {i}") for i in range(GEOCODING_RESULT_COUNT)]
+    responses["San"] = [_result("Santa 1")]
+
+    await search_cities("Sa")
+    await search_cities("San")
+    await search_cities("Sant")
+
+    # "Sa" was truncated upstream; "San" was complete and serves "Sant"
+    assert calls == ["Sa", "San"]
+
+
+@pytest.mark.asyncio
+async def test_two_character_queries_do_not_block_longer_ones(upstream):
+    calls, responses = upstream
+    # Open-Meteo answers 2-character queries with exact matches only
+    responses["Xa"] = []
+    responses["Xanxere"] = [_result("Xanxerê", "Santa Catarina")]
+
+    assert await search_cities("Xa") == []
+    assert [c.name for c in await search_cities("Xanxere")] == ["Xanxerê"]
+    assert calls == ["Xa", "Xanxere"]
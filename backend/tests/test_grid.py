@@ -0,0 +1,161 @@
+import asyncio
+import numpy as np
+import pytest
+import respx
+from datetime import datetime, timedelta, timezone
+from httpx import Response
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.cache import WEATHER_CACHE_TTL
+from app.main import app
+from app.services import grid
+from app.services.grid import decode_tile, get_grid, grid_spec
+
+client = TestClient(app)
+
+UTC_OFFSET = -3 * 3600
+# Local midnight today in the payloads' time zone
+LOCAL_MIDNIGHT = (datetime.now(timezone.utc) + timedelta(seconds=UTC_OFFSET)).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def _payload(lat, lon, days):
+    hours = [(LOCAL_MIDNIGHT + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(days * 24)]
+    # Encodes the location and the (local) hour, so placement can be checked
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "utc_offset_seconds": UTC_OFFSET,
+        "hourly": {
+            "time": hours,
+            "precipitation": [round(-lat * 10) + h / 100 for h in range(len(hours))],
+            "wind_speed_10m": [round(-lon * 10) for _ in hours],
+        },
+    }
+
+
+def _forecast(request):
+    params = request.url.params
+    lats = [float(v) for v in params["latitude"].split(",")]
+    lons = [float(v) for v in params["longitude"].split(",")]
+    payloads = [_payload(lat, lon, int(params["forecast_days"])) for lat, lon in zip(lats, lons)]
+    return Response(200, json=payloads if len(payloads) > 1 else payloads[0])
+
+
+def test_grid_spec_aligns_to_cache_grid():
+    spec = grid_spec([-47.83, -21.22, -47.70, -21.08])
+    assert spec.latitudes().tolist() == [-21.2, -21.15, -21.1]
+    assert spec.longitudes().tolist() == [-47.8, -47.75, -47.7]
+    assert spec.variables == ("precipitation", "wind_speed_10m", "wind_gusts_10m")
+
+    coarse = grid_spec([-47.83, -21.22, -47.70, -21.08], resolution=0.08)
+    assert coarse.step == 0.1
+    assert coarse.latitudes().tolist() == [-21.2, -21.1]
+
+    # Low zoom: 360 / 2**6 / 32 ~ 0.18 degrees -> every 4th cache node
+    assert grid_spec([-48, -22, -47, -21], zoom=6).step == 0.2
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"bbox": [-47, -21, -48, -22]},
+    {"bbox": [-47.81, -21.17, -47.81, -21.17]},
+    {"bbox": [-60, -30, -40, -10]},
+    {"bbox": [-48, -22, -47, -21], "variables": ["precipitation_sum"]},
+    {"bbox": [-48, -22, -47, -21], "hours": 0},
+])
+def test_grid_spec_rejects_invalid(kwargs):
+    with pytest.raises(ValueError):
+        grid_spec(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_grid_is_fetched_in_chunks_and_aligned_to_utc():
+    spec = grid_spec([-47.8, -21.2, -47.7, -21.1], variables=["hourly_precipitation", "hourly_wind_speed_10m"], hours=6)
+    start = np.datetime64(LOCAL_MIDNIGHT, "h") + 13 - UTC_OFFSET // 3600  # 13:00 local
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(side_effect=_forecast)
+        tile = await get_grid(spec, start)
+        again = await get_grid(spec, start)
+        # Every coarse node is a cached fine node: no new upstream call
+        coarse = await get_grid(grid_spec([-47.8, -21.2, -47.7, -21.1], resolution=0.1, hours=6, variables=["hourly_precipitation"]), start)
+
+    assert route.call_count == 1
+    assert route.calls[0].request.url.params["latitude"].count(",") == 8
+    assert again is tile
+    assert tile.missing_points == 0
+    precipitation = tile.data["precipitation"]
+    assert precipitation.dtype == np.float32 and precipitation.shape == (6, 3, 3)
+    # Row = latitude, column = longitude, first step = 13:00 local
+    assert precipitation[0, 0, 0] == pytest.approx(212.13)
+    assert precipitation[5, 2, 0] == pytest.approx(211.18)
+    assert tile.data["wind_speed_10m"][0, 0].tolist() == [478, 478, 477]
+    assert tile.times[0] == f"{start}:00Z"
+    assert coarse.data["precipitation"][0].ravel().tolist() == pytest.approx([212.13, 212.13, 211.13, 211.13])
+
+
+@pytest.mark.asyncio
+async def test_failed_chunk_leaves_missing_points():
+    spec = grid_spec([-47.8, -21.2, -47.75, -21.2], hours=3)
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(500))
+        tile = await get_grid(spec)
+    assert tile.missing_points == 2
+    assert np.isnan(tile.data["precipitation"]).all()
+    assert tile.to_json()["values"]["precipitation"][:2] == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_stale_cells_are_served_and_refreshed_in_background(mock_http_client):
+    spec = grid_spec([-47.8, -21.2, -47.75, -21.2], hours=3)
+    release = asyncio.Event()
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) > 1:
+            await release.wait()
+        return _forecast(request)
+
+    mock_http_client(handler)
+    with patch("app.cache.time.time", return_value=1000.0):
+        await get_grid(spec)
+    grid._grids.clear()
+
+    with patch("app.cache.time.time", return_value=1000.0 + WEATHER_CACHE_TTL + 5):
+        # Answered from the stale forecasts without waiting for the refresh
+        tile = await asyncio.wait_for(get_grid(spec), 1.0)
+    assert tile.missing_points == 0
+    assert tile.stored_at == 1000.0
+    await asyncio.sleep(0.01)
+    assert len(calls) == 2
+    # Not kept: the next request picks up the refreshed forecasts
+    assert grid.grid_cache_stats()["entries"] == 0
+    release.set()
+
+
+def test_grid_route_binary_and_json():
+    params = {"bbox": "-47.8,-21.2,-47.7,-21.1", "variables": "hourly_precipitation", "hours": 4}
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(side_effect=_forecast)
+        binary = client.get("/weather/grid", params={**params, "format": "binary"})
+        compact = client.get("/weather/grid", params=params)
+        revalidated = client.get("/weather/grid", params=params, headers={"If-None-Match": compact.headers["etag"]})
+
+    assert route.call_count == 1
+    assert binary.status_code == 200
+    assert binary.headers["content-type"] == grid.BINARY_MEDIA_TYPE
+    header, data = decode_tile(binary.content)
+    assert header["shape"] == [4, 3, 3] and header["variables"] == ["precipitation"]
+    assert data["precipitation"].dtype == np.dtype("<f4")
+
+    body = compact.json()
+    assert body["shape"] == [4, 3, 3]
+    assert len(body["values"]["precipitation"]) == 36
+    assert body["values"]["precipitation"][0] == pytest.approx(float(data["precipitation"][0, 0, 0]), abs=0.05)
+    assert "max-age" in compact.headers["cache-control"]
+    assert revalidated.status_code == 304
+
+
+def test_grid_route_rejects_bad_parameters():
+    assert client.get("/weather/grid", params={"bbox": "a,b,c,d"}).status_code == 400
+    assert client.get("/weather/grid", params={"bbox": "-48,-22,-47,-21", "format": "png"}).status_code == 400
@@ -0,0 +1,181 @@
+from datetime import date, timedelta
+
+import pytest
+import respx
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app.history_store import HistoryStore, missing_ranges, date_range, set_history_store
+from app.main import app
+from app.services import history
+from app.spatial import snap_coordinates
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+TODAY = date(2025, 6, 30)
+
+client = TestClient(app)
+
+
+def _section_response(request):
+    params = request.url.params
+    start, end = date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"])
+    days = date_range(start, end)
+    if "daily" in params:
+        section = {"time": [d.isoformat() for d in days]}
+        for name in params["daily"].split(","):
+            section[name] = [2.0 if name == "precipitation_sum" else 4.0 for _ in days]
+        return Response(200, json={"daily": section})
+    times = [f"{d.isoformat()}T{h:02d}:00" for d in days for h in range(24)]
+    section = {"time": times, **{name: [0.5] * len(times) for name in params["hourly"].split(",")}}
+    return Response(200, json={"hourly": section})
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    set_history_store(store)
+    monkeypatch.setattr(history, "today", lambda timezone=None: TODAY)
+    yield store
+    set_history_store(None)
+    store.close()
+
+
+def test_missing_ranges():
+    wanted = date_range(date(2025, 1, 1), date(2025, 1, 10))
+    present = [date(2025, 1, 3), date(2025, 1, 4), date(2025, 1, 8)]
+    assert missing_ranges(wanted, present) == [
+        (date(2025, 1, 1), date(2025, 1, 2)),
+        (date(2025, 1, 5), date(2025, 1, 7)),
+        (date(2025, 1, 9), date(2025, 1, 10)),
+    ]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_backfill_fetches_only_missing_days(store):
+    archive = respx.get(ARCHIVE_URL).mock(side_effect=_section_response)
+    forecast = respx.get(FORECAST_URL).mock(side_effect=_section_response)
+
+    first = await history.get_history(-21.17, -47.81, date(2025, 6, 1), date(2025, 6, 10))
+    assert first["meta"]["fetched_days"] == 10
+    assert first["time"][0] == "2025-06-01" and len(first["time"]) == 10
+    assert first["summary"] == {"precipitation_total_mm": 20.0, "et0_total_mm": 40.0, "water_balance_mm": -20.0}
+    assert archive.call_count == 1 and forecast.call_count == 0
+
+    # Same range again: served from the store
+    again = await history.get_history(-21.17, -47.81, date(2025, 6, 1), date(2025, 6, 10))
+    assert again["meta"]["fetched_days"] == 0
+    assert archive.call_count == 1
+
+    # Wider range: only the new days are requested
+    await history.get_history(-21.17, -47.81, date(2025, 5, 25), date(2025, 6, 12))
+    params = [call.request.url.params for call in archive.calls[1:]]
+    assert [(p["start_date"], p["end_date"]) for p in params] == [("2025-05-25", "2025-05-31"), ("2025-06-11", "2025-06-12")]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_recent_days_are_provisional_until_archived(store, monkeypatch):
+    archive = respx.get(ARCHIVE_URL).mock(side_effect=_section_response)
+    forecast = respx.get(FORECAST_URL).mock(side_effect=_section_response)
+
+    # Cutoff is 2025-06-25: the last four days come from the forecast API
+    result = await history.get_history(-21.17, -47.81, date(2025, 6, 20), date(2025, 6, 29))
+    assert len(result["time"]) == 10
+    assert archive.calls[-1].request.url.params["end_date"] == "2025-06-25"
+    assert forecast.calls[-1].request.url.params["start_date"] == "2025-06-26"
+
+    await history.get_history(-21.17, -47.81, date(2025, 6, 20), date(2025, 6, 29))
+    assert (archive.call_count, forecast.call_count) == (1, 1)
+
+    # A week later the provisional days are replaced by archive data
+    monkeypatch.setattr(history, "today", lambda timezone=None: TODAY + timedelta(days=7))
+    await history.get_history(-21.17, -47.81, date(2025, 6, 20), date(2025, 6, 29))
+    assert archive.calls[-1].request.url.params["start_date"] == "2025-06-26"
+    assert (archive.call_count, forecast.call_count) == (2, 1)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_null_archive_days_stay_provisional(store, monkeypatch):
+    def lagging_archive(request):
+        # The archive lists the last day before it has values for it
+        response = _section_response(request).json()
+        section = response["daily"]
+        for name in section:
+            if name != "time":
+                section[name][-1] = None
+        return Response(200, json=response)
+
+    archive = respx.get(ARCHIVE_URL).mock(side_effect=lagging_archive)
+    forecast = respx.get(FORECAST_URL).mock(side_effect=_section_response)
+
+    result = await history.get_history(-21.17, -47.81, date(2025, 6, 20), date(2025, 6, 25))
+    assert result["data"]["precipitation_sum"][-1] == 2.0
+    assert [(p["start_date"], p["end_date"]) for p in (c.request.url.params for c in forecast.calls)] == [("2025-06-25", "2025-06-25")]
+    stored = store.stored_days(snap_coordinates(-21.17, -47.81).key, "daily", date(2025, 6, 20), date(2025, 6, 25), date(2025, 6, 25))
+    assert stored == date_range(date(2025, 6, 20), date(2025, 6, 24))
+
+    # Within the retry window the provisional day is served as stored
+    archive.side_effect = _section_response
+    again = await history.get_history(-21.17, -47.81, date(2025, 6, 20), date(2025, 6, 25))
+    assert again["meta"]["fetched_days"] == 0
+    assert (archive.call_count, forecast.call_count) == (1, 1)
+
+    # Once it has passed, the archive is asked for that day again
+    monkeypatch.setattr(history, "HISTORY_ARCHIVE_RETRY_HOURS", 0)
+    await history.get_history(-21.17, -47.81, date(2025, 6, 20), date(2025, 6, 25))
+    assert archive.calls[-1].request.url.params["start_date"] == "2025-06-25"
+    assert archive.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_dates_follow_the_cell_timezone(store, monkeypatch):
+    def in_manaus(request):
+        return Response(200, json={**_section_response(request).json(), "timezone": "America/Manaus"})
+
+    archive = respx.get(ARCHIVE_URL).mock(side_effect=in_manaus)
+    seen = []
+    monkeypatch.setattr(history, "today", lambda timezone=None: seen.append(timezone) or TODAY)
+
+    first = await history.get_history(-3.10, -60.02, date(2025, 6, 1), date(2025, 6, 5))
+    assert archive.calls[0].request.url.params["timezone"] == "auto"
+    assert first["meta"]["timezone"] == "America/Manaus"
+    assert store.cell_timezone(snap_coordinates(-3.10, -60.02).key) == "America/Manaus"
+
+    # Later requests for the cell check the range against its own calendar
+    seen.clear()
+    await history.get_history(-3.10, -60.02, date(2025, 6, 1), date(2025, 6, 5))
+    assert set(seen) == {"America/Manaus"}
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_hourly_history_and_partial_failure(store):
+    respx.get(ARCHIVE_URL).mock(side_effect=[Response(500), Response(500), Response(500)])
+
+    result = await history.get_history(-21.17, -47.81, date(2025, 6, 1), date(2025, 6, 2), "hourly", ["precipitation"])
+    assert result["meta"]["complete"] is False
+    assert result["time"] == []
+
+    respx.get(ARCHIVE_URL).mock(side_effect=_section_response)
+    result = await history.get_history(-21.17, -47.81, date(2025, 6, 1), date(2025, 6, 2), "hourly", ["precipitation"])
+    assert len(result["time"]) == 48
+    assert list(result["data"]) == ["precipitation"]
+    assert result["summary"]["precipitation_total_mm"] == 24.0
+
+
+@respx.mock
+def test_history_route(store):
+    respx.get(ARCHIVE_URL).mock(side_effect=_section_response)
+
+    response = client.get("/weather/history?lat=-21.17&lon=-47.81&start=2025-06-01&end=2025-06-05&variables=precipitation_sum")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["data"] == {"precipitation_sum": [2.0] * 5}
+    assert body["units"] == {"precipitation_sum": "mm"}
+
+    assert client.get("/weather/history?lat=-21.17&lon=-47.81&start=2025-06-05&end=2025-06-01").status_code == 400
+    assert client.get("/weather/history?lat=-21.17&lon=-47.81&variables=uv_index_max").status_code == 400
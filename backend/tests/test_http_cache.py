@@ -0,0 +1,103 @@
+import os
+import time
+from email.utils import formatdate
+
+import respx
+from unittest.mock import patch
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app import response_cache
+from app.cache import GEOCODING_CACHE_TTL
+from app.city_index import CITY_INDEX_PATH
+from app.http_cache import cache_headers, etag_matches, make_etag
+from tests.conftest import make_forecast_payload
+
+client = TestClient(app)
+
+WEATHER_URL = "/weather?city=Ribeirao Preto&lat=-21.17&lon=-47.81"
+
+
+def test_cache_control_tracks_entry_age():
+    fresh = cache_headers('W/"x"', stored_at=1000.0, ttl=600, stale_ttl=3600, now=1100.0)
+    assert fresh["Cache-Control"] == "public, max-age=500, stale-while-revalidate=3600"
+    assert fresh["Last-Modified"] == "Thu, 01 Jan 1970 00:16:40 GMT"
+
+    stale = cache_headers('W/"x"', stored_at=1000.0, ttl=600, stale_ttl=3600, now=2600.0)
+    assert stale["Cache-Control"] == "public, max-age=0, stale-while-revalidate=2600"
+
+
+def test_etag_matching():
+    etag = make_etag("weather", "k", 1)
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag[2:]}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_weather_revalidation_returns_304():
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+        first = client.get(WEATHER_URL)
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"].startswith("public, max-age=")
+        assert "last-modified" in first.headers
+
+        revalidated = client.get(WEATHER_URL, headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+
+        # Rebuilding the body from the same cache entry keeps the validators
+        response_cache._response_cache.clear()
+        rebuilt = client.get(WEATHER_URL, headers={"If-None-Match": etag})
+        assert rebuilt.status_code == 304
+
+        by_date = client.get(WEATHER_URL, headers={"If-Modified-Since": first.headers["last-modified"]})
+        assert by_date.status_code == 304
+
+        changed = client.get(WEATHER_URL, headers={"If-None-Match": 'W/"outdated"'})
+        assert changed.status_code == 200
+        assert changed.json()["status"] == "ok"
+
+
+def test_weather_errors_are_not_cacheable():
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(500))
+        response = client.get(WEATHER_URL)
+
+    assert response.json()["status"] == "not_found"
+    assert response.headers["cache-control"] == "no-store"
+    assert "etag" not in response.headers
+
+
+def test_local_city_results_have_stable_validators():
+    first = client.get("/cities?q=Piracicaba")
+    # A later TTL window (or another worker) sends the same validators
+    with patch("app.services.geocoding.time.time", return_value=time.time() + 10 * GEOCODING_CACHE_TTL):
+        later = client.get("/cities?q=Piracicaba", headers={"If-None-Match": first.headers["etag"]})
+        by_date = client.get("/cities?q=Piracicaba", headers={"If-Modified-Since": first.headers["last-modified"]})
+
+    assert later.status_code == by_date.status_code == 304
+    assert later.headers["etag"] == first.headers["etag"]
+    assert later.headers["last-modified"] == first.headers["last-modified"]
+    assert first.headers["last-modified"] == formatdate(os.path.getmtime(CITY_INDEX_PATH), usegmt=True)
+
+
+def test_cities_revalidation_returns_304():
+    results = {"results": [{
+        "name": "Piracicaba", "latitude": -22.72, "longitude": -47.64,
+        "country_code": "BR", "admin1": "São Paulo", "timezone": "America/Sao_Paulo",
+    }]}
+    with respx.mock(base_url="https://geocoding-api.open-meteo.com", assert_all_called=False) as respx_mock, \
+            patch("app.city_index.CITY_INDEX_ENABLED", False):
+        route = respx_mock.get("/v1/search").mock(return_value=Response(200, json=results))
+        first = client.get("/cities?q=Piracicaba")
+        revalidated = client.get("/cities?q=Piracicaba", headers={"If-None-Match": first.headers["etag"]})
+
+    assert first.json()[0]["name"] == "Piracicaba"
+    assert revalidated.status_code == 304
+    assert route.call_count == 1
@@ -0,0 +1,52 @@
+import pytest
+import httpx
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app import http_client
+from app.main import app
+from app.services.geocoding import search_cities
+
+
+@pytest.fixture(autouse=True)
+def reset_client():
+    http_client.set_http_client(None)
+    yield
+    http_client.set_http_client(None)
+
+
+def test_client_is_shared():
+    first = http_client.get_http_client()
+    second = http_client.get_http_client()
+    assert first is second
+
+
+def test_lifespan_creates_and_closes_client():
+    with TestClient(app):
+        client = http_client._client
+        assert client is not None
+        assert not client.is_closed
+
+    assert client.is_closed
+    assert http_client._client is None
+
+
+def _piracicaba(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"results": [{
+        "name": request.url.params["name"],
+        "latitude": -22.72,
+        "longitude": -47.64,
+        "country_code": "BR",
+        "admin1": "São Paulo",
+        "timezone": "America/Sao_Paulo",
+    }]})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mock_http_client", [_piracicaba], indirect=True)
+async def test_services_use_replaced_client(mock_http_client):
+    # Remote path: keep the offline city index out of the way
+    with patch("app.city_index.CITY_INDEX_ENABLED", False):
+        cities = await search_cities("Piracicaba stand-in")
+
+    assert [city.name for city in cities] == ["Piracicaba stand-in"]
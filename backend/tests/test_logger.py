@@ -0,0 +1,80 @@
+import json
+import logging
+import queue
+
+from fastapi.testclient import TestClient
+
+from app.logger import (
+    DroppingQueueHandler,
+    JsonFormatter,
+    RequestIdFilter,
+    SamplingFilter,
+    request_id_var,
+)
+from app.main import app
+
+client = TestClient(app)
+
+
+def _record(message="boom", sampled=False, lineno=10):
+    record = logging.LogRecord("test", logging.ERROR, "app/x.py", lineno, message, None, None)
+    if sampled:
+        record.sampled = True
+    return record
+
+
+def test_queue_handler_drops_when_full():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(_record(f"m{i}"))
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_queue_handler_defers_formatting():
+    handler = DroppingQueueHandler(queue.Queue())
+    record = logging.LogRecord("test", logging.INFO, "app/x.py", 1, "value %s", ("a",), None)
+    handler.handle(record)
+
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "value a" and queued.args is None
+    # The JSON line is only built on the listener side
+    assert json.loads(JsonFormatter().format(queued))["message"] == "value a"
+
+
+def test_sampling_limits_repeated_call_site(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("app.logger.time.monotonic", lambda: now[0])
+    sampler = SamplingFilter(burst=2, window=10)
+
+    passed = [sampler.filter(_record(sampled=True)) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    # Unsampled records and other call sites are never limited
+    assert sampler.filter(_record())
+    assert sampler.filter(_record(sampled=True, lineno=99))
+
+    now[0] = 11.0
+    record = _record(sampled=True)
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+    assert json.loads(JsonFormatter().format(record))["suppressed"] == 3
+
+
+def test_request_id_is_attached_to_records():
+    token = request_id_var.set("req-1")
+    try:
+        record = _record()
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    assert json.loads(JsonFormatter().format(record))["request_id"] == "req-1"
+
+
+def test_request_id_header_is_echoed_or_generated():
+    response = client.get("/health", headers={"X-Request-ID": "abc-123"})
+    assert response.headers["x-request-id"] == "abc-123"
+
+    generated = client.get("/health", headers={"X-Request-ID": "not valid\x01"}).headers["x-request-id"]
+    assert len(generated) == 32 and generated != "abc-123"
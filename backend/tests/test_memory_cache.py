@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+
+from app.memory_cache import MemoryCache
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_get_set_counters(self):
+        cache = MemoryCache(max_entries=10)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", {"temp": 25}, ttl=60)
+        self.assertEqual(cache.get("a"), {"temp": 25})
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_entries_expire(self):
+        cache = MemoryCache()
+        with patch("app.memory_cache.time.time", return_value=1000.0):
+            cache.set("a", 1, ttl=600)
+        with patch("app.memory_cache.time.time", return_value=1599.0):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("app.memory_cache.time.time", return_value=1600.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction_by_count(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", 1, ttl=60)
+        cache.set("b", 2, ttl=60)
+        cache.get("a")  # "b" is now least recently used
+        cache.set("c", 3, ttl=60)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_eviction_by_byte_budget(self):
+        cache = MemoryCache(max_entries=100, max_bytes=100)
+        cache.set("a", "x" * 40, ttl=60)
+        cache.set("b", "y" * 40, ttl=60)
+        cache.set("c", "z" * 40, ttl=60)
+
+        self.assertNotIn("a", cache)
+        self.assertIn("c", cache)
+        self.assertLessEqual(cache.stats()["bytes"], 100)
+
+    def test_memory_backend_is_bounded(self):
+        from app import cache as app_cache
+        bounded = MemoryCache(max_entries=3)
+        with patch("app.cache.redis_client", None), patch("app.cache._memory_cache", bounded):
+            for i in range(10):
+                app_cache.set_weather_cache(f"-21.{i},-47.8", {"i": i})
+            self.assertEqual(len(bounded), 3)
+            self.assertIsNone(app_cache.get_weather_cache("-21.0,-47.8"))
+            self.assertEqual(app_cache.get_weather_cache("-21.9,-47.8"), {"i": 9})
+
+
+if __name__ == '__main__':
+    unittest.main()
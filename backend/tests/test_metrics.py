@@ -0,0 +1,118 @@
+import httpx
+import pytest
+import respx
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app import cache, metrics
+from app.main import app
+from app.metrics import Counter, Histogram, render_metrics
+from app.upstream import upstream_get
+from tests.conftest import make_forecast_payload
+
+client = TestClient(app)
+
+
+def _value(metric, *labels):
+    return metric.labels(*labels).value
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Test", ("route",), buckets=(0.1, 1.0))
+    metrics.REGISTRY.remove(histogram)
+    child = histogram.labels("/x")
+    child.observe(0.05)
+    child.observe(0.5)
+    child.observe(3)
+
+    lines = histogram.render()
+    assert 'test_latency_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/x",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{route="/x"} 3' in lines
+    assert 'test_latency_seconds_sum{route="/x"} 3.55' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "Test", ("name",))
+    metrics.REGISTRY.remove(counter)
+    counter.labels('a"b').inc()
+    assert 'test_total{name="a\\"b"} 1' in counter.render()
+
+
+def test_metrics_endpoint_exposes_request_metrics():
+    before = _value(metrics.http_requests, "/health", "2xx")
+    other_before = _value(metrics.http_requests, "other", "4xx")
+
+    client.get("/health")
+    client.get("/wp-login.php")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert _value(metrics.http_requests, "/health", "2xx") == before + 1
+    # Unknown paths share one label value
+    assert _value(metrics.http_requests, "other", "4xx") == other_before + 1
+    assert 'http_request_duration_seconds_count{route="/health"}' in response.text
+    assert "http_requests_in_flight 1" in response.text
+
+
+def test_request_metrics_use_route_templates():
+    alerts = _value(metrics.http_requests, "/alerts", "2xx")
+    history = _value(metrics.http_requests, "/weather/history", "4xx")
+
+    client.get("/alerts")
+    client.get("/weather/history?lat=-21.17&lon=-47.81&start=2025-06-10&end=2025-06-01")
+
+    assert _value(metrics.http_requests, "/alerts", "2xx") == alerts + 1
+    assert _value(metrics.http_requests, "/weather/history", "4xx") == history + 1
+
+
+@respx.mock
+def test_cache_lookups_are_counted_per_namespace():
+    respx.get("https://api.open-meteo.com/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+    miss = _value(metrics.cache_lookups, "weather", "miss")
+    hit = _value(metrics.cache_lookups, "weather", "hit")
+
+    client.get("/weather?city=Piracicaba&lat=-22.72&lon=-47.64")
+    # Second request is answered from the response cache, the third from the entry
+    client.get("/weather?city=Piracicaba&lat=-22.72&lon=-47.64")
+    client.get("/weather?city=Piracicaba&lat=-22.72&lon=-47.64&days=2")
+
+    assert _value(metrics.cache_lookups, "weather", "miss") >= miss + 1
+    assert _value(metrics.cache_lookups, "weather", "hit") >= hit + 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_status_and_errors_are_counted(mock_http_client):
+    outcomes = [httpx.ConnectError("reset"), 404]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        item = outcomes.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return httpx.Response(item, json={})
+
+    mock_http_client(handler)
+    errors = _value(metrics.upstream_responses, "geocoding", "error")
+    client_errors = _value(metrics.upstream_responses, "geocoding", "4xx")
+    await upstream_get("geocoding", "https://geocoding-api.open-meteo.com/v1/search")
+
+    assert _value(metrics.upstream_responses, "geocoding", "error") == errors + 1
+    assert _value(metrics.upstream_responses, "geocoding", "4xx") == client_errors + 1
+    assert metrics.upstream_request_duration.labels("geocoding").count >= 2
+    assert "upstream_requests_in_flight 0" in render_metrics()
+
+
+def test_redis_errors_are_counted(monkeypatch):
+    class BrokenRedis:
+        def get(self, key):
+            raise ConnectionError("down")
+
+    monkeypatch.setattr(cache, "redis_client", BrokenRedis())
+    monkeypatch.setattr(cache, "CACHE_L1_ENABLED", False)
+    errors = _value(metrics.redis_errors, "get")
+
+    assert cache.get_weather_entry("k") is None
+    assert _value(metrics.redis_errors, "get") == errors + 1
+    assert metrics.redis_operation_duration.labels("get").count >= 1
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from app import operation_rules
+from app.forecast_frame import ForecastFrame
+from app.operation_rules import DEFAULT_RULES, RuleSet, load_rules
+from app.services.open_meteo import DEFAULT_SELECTION, build_weather_result
+from app.spatial import snap_coordinates
+from tests.conftest import make_forecast_payload
+
+HOURS = [f"2025-12-01T{h:02d}:00" for h in range(12)]
+
+RULES = {
+    "default_operation": "pulverizacao",
+    "operations": {
+        "pulverizacao": {
+            "min_hours": 3,
+            "conditions": [
+                {"variable": "hourly_precipitation_probability", "op": "<=", "value": 20, "missing_ok": True},
+                {"variable": "hourly_wind_speed_10m", "op": "between", "value": [3, 12]},
+            ],
+        },
+        "colheita": {
+            "min_hours": 2,
+            "conditions": [{"variable": "hourly_precipitation_probability", "op": "<", "value": 50}],
+        },
+    },
+    "checks": {"quente": [{"variable": "temperature_2m", "op": ">", "value": 30}]},
+}
+
+
+def _frame(**columns):
+    return ForecastFrame.from_section({"time": HOURS, **columns}, list(columns))
+
+
+def test_windows_are_runs_of_at_least_min_hours():
+    frame = _frame(
+        precipitation_probability=[0, 10, None, 0, 60, 0, 0, 70, 0, 0, 0, 0],
+        wind_speed_10m=[5, 5, 5, 5, 5, 20, 5, 5, 2, 5, 5, 5],
+    )
+    windows = RuleSet(RULES).windows(frame)
+    # Nulls pass only where missing_ok; the 2-hour run (05-07) is too short for spraying
+    assert windows["pulverizacao"] == [
+        {"start": "2025-12-01T00:00", "end": "2025-12-01T04:00", "hours": 4},
+        {"start": "2025-12-01T09:00", "end": "2025-12-01T12:00", "hours": 3},
+    ]
+    assert [w["hours"] for w in windows["colheita"]] == [2, 2, 4]
+
+
+def test_operations_without_their_variables_are_skipped():
+    rules = RuleSet(RULES)
+    frame = _frame(precipitation_probability=[0] * 12)
+    assert rules.windows(frame) == {"colheita": [{"start": HOURS[0], "end": "2025-12-01T12:00", "hours": 12}]}
+    assert rules.operation_ok(frame) is None
+
+
+def test_operation_ok_uses_lookahead_and_checks():
+    rules = RuleSet(RULES)
+    frame = _frame(precipitation_probability=[0, 0, 0, 90] + [0] * 8, wind_speed_10m=[5] * 12)
+    assert rules.operation_ok(frame) is True
+    assert rules.operation_ok(frame.window(1, 12)) is False
+    assert rules.check("quente", {"temperature_2m": 31.0}) is True
+    assert rules.check("quente", {"temperature_2m": None}) is False
+    assert rules.check("quente", {}) is None
+
+
+@pytest.mark.parametrize("change", [
+    {"variable": "nope"},
+    {"variable": "temperature_2m"},
+    {"op": "~"},
+    {"op": "between", "value": 3},
+])
+def test_invalid_rules_are_rejected(change):
+    condition = {"variable": "hourly_precipitation", "op": "<=", "value": 1, **change}
+    with pytest.raises(ValueError):
+        RuleSet({"operations": {"x": {"conditions": [condition]}}})
+
+
+def test_load_rules_falls_back_to_defaults(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES))
+    assert [op.name for op in load_rules(str(path)).operations] == ["pulverizacao", "colheita"]
+    path.write_text('{"operations": {"x": {"conditions": []}}}')
+    assert [op.name for op in load_rules(str(path)).operations] == list(DEFAULT_RULES["operations"])
+
+
+def test_weather_result_keeps_legacy_flags_and_adds_windows():
+    operation_rules.set_rules(None)
+    hours = [f"2025-12-01T{h:02d}:00" for h in range(24)]
+    hourly = {name: [0.0] * 24 for name in DEFAULT_SELECTION.hourly}
+    hourly["wind_speed_10m"] = [5.0] * 12 + [20.0] * 12
+    payload = make_forecast_payload(
+        current={"time": "2025-12-01T10:00", "temperature_2m": 24.0},
+        hourly={"time": hours, **hourly},
+    )
+    result = build_weather_result(payload, snap_coordinates(-21.17, -47.81))
+    derived = result["derived"]
+    assert derived["operation_window_ok"] is False  # wind picks up at 12:00
+    assert derived["temp_ok_22_30"] is True
+    windows = derived["operation_windows"]
+    assert set(windows) == set(DEFAULT_RULES["operations"])
+    # Windows start at the current hour
+    assert windows["pulverizacao"] == []
+    assert windows["colheita"] == [{"start": "2025-12-01T10:00", "end": "2025-12-02T00:00", "hours": 14}]
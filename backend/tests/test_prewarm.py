@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app.cache import set_weather_cache, WEATHER_CACHE_TTL
+from app.prewarm import load_watchlist, prewarm_cycle, prewarm_once, WatchItem, PREWARM_LEAD_TIME, PREWARM_LOCK_KEY
+from app.services.open_meteo import make_record, DEFAULT_SELECTION
+from app.spatial import snap_coordinates
+from tests.conftest import make_forecast_payload
+
+
+@pytest.fixture
+def upstream(mock_http_client):
+    state = {"calls": 0, "active": 0, "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["calls"] += 1
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        return httpx.Response(200, json=make_forecast_payload())
+
+    mock_http_client(handler)
+    return state
+
+
+def _seed(lat, lon, age):
+    point = snap_coordinates(lat, lon)
+    record = make_record(make_forecast_payload(), DEFAULT_SELECTION)
+    with patch("app.cache.time.time", return_value=time.time() - age):
+        set_weather_cache(point.key, record)
+
+
+@pytest.mark.asyncio
+async def test_watchlist_merges_file_and_redis_set(tmp_path):
+    path = tmp_path / "watchlist.json"
+    path.write_text(json.dumps([
+        {"latitude": -21.17, "longitude": -47.81},
+        {"latitude": -21.171, "longitude": -47.811},  # same grid cell
+        {"latitude": -21.17, "longitude": -47.81, "days": 7},
+        {"latitude": -20.0, "longitude": -48.0, "variables": ["not_a_variable"]},
+    ]))
+    redis = AsyncMock()
+    redis.smembers.return_value = {"-22.72,-47.64", "garbage"}
+
+    with patch("app.cache.async_redis_client", redis):
+        items = await load_watchlist(str(path), "prewarm:watchlist")
+
+    assert sorted((i.latitude, i.days) for i in items) == [(-22.72, 1), (-21.17, 1), (-21.17, 7)]
+    redis.smembers.assert_called_once_with("prewarm:watchlist")
+
+
+@pytest.mark.asyncio
+async def test_refreshes_only_entries_close_to_expiry(upstream):
+    _seed(-21.17, -47.81, age=WEATHER_CACHE_TTL - PREWARM_LEAD_TIME / 2)  # about to expire
+    _seed(-22.72, -47.64, age=10)  # just fetched
+
+    stats = await prewarm_once([WatchItem(-21.17, -47.81), WatchItem(-22.72, -47.64)], jitter=0)
+
+    assert stats["ok"] == 2
+    assert upstream["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded(upstream):
+    watchlist = [WatchItem(-20.0 - i, -47.0) for i in range(6)]
+
+    stats = await prewarm_once(watchlist, concurrency=2, jitter=0)
+
+    assert stats == {**stats, "locations": 6, "ok": 6, "failed": 0}
+    assert upstream["calls"] == 6
+    assert upstream["peak"] == 2
+
+
+@pytest.mark.asyncio
+async def test_one_worker_runs_each_cycle():
+    redis = AsyncMock()
+    # The first worker takes the lock, the second finds it held
+    redis.set.side_effect = [True, None]
+    run = AsyncMock(return_value={"locations": 0})
+
+    with patch("app.cache.async_redis_client", redis), patch("app.prewarm.prewarm_once", run):
+        results = await asyncio.gather(prewarm_cycle(60), prewarm_cycle(60))
+
+    assert sorted(results, key=bool) == [None, {"locations": 0}]
+    assert run.await_count == 1
+    _, kwargs = redis.set.call_args
+    assert redis.set.call_args[0][0] == PREWARM_LOCK_KEY
+    assert kwargs == {"nx": True, "px": 60000}
@@ -0,0 +1,61 @@
+import gzip
+import respx
+from httpx import Response
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app import response_cache
+from tests.conftest import make_forecast_payload
+
+client = TestClient(app)
+
+URL = "/weather?city=Ribeirao Preto&lat=-21.17&lon=-47.81"
+
+
+def test_hit_returns_stored_bytes_without_rebuilding():
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+        first = client.get(URL)
+
+        with patch("app.routes.weather._weather_response") as rebuild:
+            second = client.get(URL)
+            rebuild.assert_not_called()
+
+    assert route.call_count == 1
+    assert first.json()["status"] == "ok"
+    assert second.content == first.content
+    assert second.headers["content-type"] == "application/json"
+
+
+def test_gzip_body_served_when_accepted():
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+        plain = client.get(URL, headers={"Accept-Encoding": "identity"})
+        compressed = client.get(URL, headers={"Accept-Encoding": "gzip"})
+
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    # httpx decodes gzip transparently; the payload must match the plain body
+    assert compressed.content == plain.content
+    key = next(iter(response_cache._response_cache._data))
+    cached = response_cache._response_cache.get(key)
+    assert gzip.decompress(cached.gzip_body) == cached.body
+
+
+def test_error_responses_are_not_stored():
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(500))
+        response = client.get(URL)
+
+    assert response.json()["status"] == "not_found"
+    assert len(response_cache._response_cache) == 0
+
+
+def test_store_caps_ttl_and_skips_expired():
+    cached = response_cache.build_response({"status": "ok"})
+    response_cache.store_response("k", cached, 10_000)
+    assert response_cache._response_cache.ttl("k") <= response_cache.RESPONSE_CACHE_MAX_TTL
+
+    response_cache.store_response("expired", cached, 0)
+    assert response_cache.get_cached_response("expired") is None
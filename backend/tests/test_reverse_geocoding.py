@@ -0,0 +1,63 @@
+import numpy as np
+import respx
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.city_index import get_city_index, nearest_city, _haversine_km
+from tests.conftest import make_forecast_payload
+
+client = TestClient(app)
+
+
+def test_nearest_municipality_state_and_timezone():
+    found = nearest_city(-21.2, -47.8)
+    assert (found.city.name, found.uf) == ("Ribeirão Preto", "SP")
+    assert found.distance_km < 5
+
+    # Western states are not on São Paulo time
+    assert nearest_city(-10.0, -67.8).city.timezone == "America/Rio_Branco"
+    assert nearest_city(-15.6, -56.1).city.timezone == "America/Cuiaba"
+    assert nearest_city(-3.1, -60.0).city.timezone == "America/Manaus"
+
+
+def test_points_outside_brazil_have_no_match():
+    assert nearest_city(40.4, -3.7) is None
+    assert nearest_city(-34.9, -18.0) is None  # South Atlantic
+
+
+def test_points_far_from_any_seat_have_no_locality():
+    assert nearest_city(-4.0, -63.0).city.name == "Coari"
+    assert nearest_city(-9.0, -68.6).city.name == "Sena Madureira"
+    # Deep in the Amazon: the nearest seat (Carauari) is 160 km away
+    assert get_city_index().nearest(-6.0, -66.0).distance_km > 100
+    assert nearest_city(-6.0, -66.0) is None
+
+    payload = make_forecast_payload()
+    payload["timezone"] = "America/Manaus"
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=payload))
+        response = client.get("/weather?city=Igarape&lat=-6.0&lon=-66.0")
+
+    location = response.json()["data"]["location"]
+    assert (location["admin1"], location["timezone"]) == ("", "America/Manaus")
+    assert location["label"] == "Igarape - Brasil"
+
+
+def test_grid_search_matches_brute_force():
+    index = get_city_index()
+    rng = np.random.default_rng(7)
+    for lat, lon in zip(rng.uniform(-33, 5, 200), rng.uniform(-73, -35, 200)):
+        expected = np.argmin(_haversine_km(lat, lon, index.latitudes, index.longitudes))
+        assert index.nearest(lat, lon).city.name == index.names[expected]
+
+
+def test_weather_by_coordinates_fills_location():
+    with respx.mock(base_url="https://api.open-meteo.com", assert_all_called=False) as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+        response = client.get("/weather?city=Seringal&lat=-9.9&lon=-67.9")
+
+    location = response.json()["data"]["location"]
+    assert location["admin1"] == "Acre"
+    assert location["timezone"] == "America/Rio_Branco"
+    assert location["label"] == "Seringal - Acre - Brasil"
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_fetch():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"temp": 25}
+
+    results = await asyncio.gather(*(flight.do("-21.17,-47.81", fetch) for _ in range(20)))
+
+    assert calls == 1
+    assert all(r == {"temp": 25} for r in results)
+    assert not flight.inflight("-21.17,-47.81")
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_cached():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("k", failing) for _ in range(5)), return_exceptions=True)
+    assert calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    # The next call starts a fresh fetch
+    with pytest.raises(RuntimeError):
+        await flight.do("k", failing)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_mode_leader_fetches_and_releases_lock():
+    flight = SingleFlight("weather", mode="redis")
+    mock_redis = AsyncMock()
+    mock_redis.set.return_value = True
+
+    async def fetch():
+        return {"temp": 25}
+
+    with patch("app.cache.async_redis_client", mock_redis):
+        result = await flight.do("k", fetch)
+
+    assert result == {"temp": 25}
+    args, kwargs = mock_redis.set.call_args
+    assert args[0] == "lock:weather:k"
+    assert kwargs["nx"] is True
+    mock_redis.eval.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_redis_mode_follower_waits_for_cache():
+    flight = SingleFlight("weather", mode="redis")
+    mock_redis = AsyncMock()
+    mock_redis.set.return_value = None  # lock held by another worker
+    mock_redis.exists.return_value = 1
+    probes = iter([None, None, {"temp": 30}])
+
+    async def fetch():
+        raise AssertionError("follower must not call upstream")
+
+    async def probe():
+        return next(probes)
+
+    with patch("app.cache.async_redis_client", mock_redis), \
+            patch("app.singleflight.SINGLEFLIGHT_POLL_INTERVAL", 0.001):
+        result = await flight.do("k", fetch, probe=probe)
+
+    assert result == {"temp": 30}
@@ -0,0 +1,76 @@
+import random
+import pytest
+import respx
+from httpx import Response
+
+from app.spatial import snap_coordinates, geohash_encode, geohash_decode
+from app.services.open_meteo import get_weather_data
+from tests.conftest import make_forecast_payload
+
+# Sugarcane mills around Ribeirão Preto / Sertãozinho / Piracicaba
+MILLS = [(-21.17, -47.81), (-21.14, -47.99), (-21.47, -47.97), (-22.72, -47.64), (-20.54, -47.40)]
+
+
+def _field_points(n_per_mill=80, spread_km=3.0, seed=42):
+    """Field centroids scattered within a few km of each mill"""
+    rng = random.Random(seed)
+    spread = spread_km / 111.0
+    points = []
+    for lat, lon in MILLS:
+        for _ in range(n_per_mill):
+            points.append((lat + rng.uniform(-spread, spread), lon + rng.uniform(-spread, spread)))
+    return points
+
+
+def _hit_rate(points, scheme):
+    seen = set()
+    hits = 0
+    for lat, lon in points:
+        key = snap_coordinates(lat, lon, scheme).key
+        if key in seen:
+            hits += 1
+        seen.add(key)
+    return hits / len(points)
+
+
+def test_float_noise_maps_to_same_key():
+    a = snap_coordinates(-21.17, -47.81, "round")
+    b = snap_coordinates(-21.1700001, -47.81, "round")
+    assert a.key == b.key
+    assert snap_coordinates(-21.17, -47.81, "none").key != snap_coordinates(-21.1700001, -47.81, "none").key
+
+
+def test_geohash_roundtrip():
+    cell = geohash_encode(-21.17, -47.81, 5)
+    assert len(cell) == 5
+    lat, lon = geohash_decode(cell)
+    assert abs(lat + 21.17) < 0.03
+    assert abs(lon + 47.81) < 0.03
+    assert geohash_encode(lat, lon, 5) == cell
+
+
+def test_snapping_raises_hit_rate_on_field_portfolio():
+    points = _field_points()
+
+    raw = _hit_rate(points, "none")
+    rounded = _hit_rate(points, "round")
+    geohashed = _hit_rate(points, "geohash")
+
+    assert raw == 0.0
+    assert rounded > 0.9
+    assert geohashed > 0.9
+
+
+@pytest.mark.asyncio
+async def test_neighbouring_fields_share_one_upstream_call():
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+
+        first = await get_weather_data(-21.171, -47.812)
+        second = await get_weather_data(-21.169, -47.808)
+
+    assert route.call_count == 1
+    grid = second["meta"]["grid"]
+    assert grid == first["meta"]["grid"]
+    assert grid["scheme"] == "round"
+    assert route.calls[0].request.url.params["latitude"] == str(grid["latitude"])
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+import respx
+from httpx import Response
+from unittest.mock import patch
+
+from app.cache import WEATHER_CACHE_TTL, set_weather_cache, get_weather_entry
+from app.services.open_meteo import get_weather_data, make_record, DEFAULT_SELECTION
+from app.spatial import snap_coordinates
+from tests.conftest import make_forecast_payload
+
+LAT, LON = -21.17, -47.81
+KEY = snap_coordinates(LAT, LON).key
+
+
+def _seed_stale_entry(temperature: float):
+    with patch("app.cache.time.time", return_value=1000.0):
+        payload = make_forecast_payload(current={"time": "2025-11-28T12:00", "temperature_2m": temperature})
+        set_weather_cache(KEY, make_record(payload, DEFAULT_SELECTION))
+
+
+@pytest.mark.asyncio
+async def test_fresh_fetch_reports_age():
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+        result = await get_weather_data(LAT, LON)
+
+    assert result["meta"]["age_seconds"] == 0.0
+    assert result["meta"]["stale"] is False
+    assert result["meta"]["fetched_at"]
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_while_refreshing():
+    _seed_stale_entry(19.0)
+
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        route = respx_mock.get("/v1/forecast").mock(return_value=Response(200, json=make_forecast_payload()))
+
+        with patch("app.cache.time.time", return_value=1000.0 + WEATHER_CACHE_TTL + 5):
+            result = await get_weather_data(LAT, LON)
+            assert result["current"]["temperature_2m"] == 19.0
+            assert result["meta"]["stale"] is True
+            assert result["meta"]["age_seconds"] == WEATHER_CACHE_TTL + 5
+
+            # A second caller does not start another refresh
+            await get_weather_data(LAT, LON)
+
+        await asyncio.sleep(0.05)
+
+    assert route.call_count == 1
+    refreshed = get_weather_entry(KEY)
+    assert refreshed.data["payload"]["current"]["temperature_2m"] == 25.0
+    assert not refreshed.stale
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_on_upstream_error():
+    _seed_stale_entry(19.0)
+
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(503))
+
+        with patch("app.cache.time.time", return_value=1000.0 + WEATHER_CACHE_TTL + 5), \
+                patch("app.services.open_meteo.CACHE_SWR_ENABLED", False):
+            result = await get_weather_data(LAT, LON)
+
+    assert result["current"]["temperature_2m"] == 19.0
+    assert result["meta"]["stale"] is True
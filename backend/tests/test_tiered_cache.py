@@ -0,0 +1,80 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app import cache
+from app.cache import get_weather_cache, set_weather_cache, WEATHER_CACHE_TTL
+
+
+class TestTieredCache(unittest.TestCase):
+    def setUp(self):
+        cache._l1_cache.clear()
+
+    def tearDown(self):
+        cache._l1_cache.clear()
+
+    @patch("app.cache.redis_client")
+    def test_hot_key_served_from_l1(self, mock_redis):
+        mock_redis.get.return_value = json.dumps({"data": {"temp": 25}, "stored_at": cache.time.time()})
+        hits_before = cache.l1_cache_stats()["hits"]
+
+        for _ in range(5):
+            self.assertEqual(get_weather_cache("hot"), {"temp": 25})
+
+        mock_redis.get.assert_called_once_with("weather:hot")
+        self.assertEqual(cache.l1_cache_stats()["hits"] - hits_before, 4)
+
+    @patch("app.cache.redis_client")
+    def test_l1_ttl_stops_at_soft_ttl(self, mock_redis):
+        stored_at = 1000.0
+        mock_redis.get.return_value = json.dumps({"data": {"temp": 25}, "stored_at": stored_at})
+
+        with patch("app.cache.time.time", return_value=stored_at + WEATHER_CACHE_TTL - 5), \
+                patch("app.memory_cache.time.time", return_value=stored_at + WEATHER_CACHE_TTL - 5):
+            get_weather_cache("expiring")
+            self.assertLessEqual(cache._l1_cache.ttl("weather:expiring"), 5)
+
+        # Stale envelopes are never kept in L1: the next read sees another worker's refresh
+        with patch("app.cache.time.time", return_value=stored_at + WEATHER_CACHE_TTL + 1):
+            get_weather_cache("stale")
+        self.assertNotIn("weather:stale", cache._l1_cache)
+
+    @patch("app.cache.async_redis_client")
+    def test_l2_only_reads_skip_l1(self, mock_redis):
+        fresh = {"data": {"temp": 26}, "stored_at": cache.time.time()}
+        mock_redis.get = AsyncMock(return_value=json.dumps(fresh))
+        cache._l1_cache.set("weather:k", {"data": {"temp": 25}, "stored_at": cache.time.time()}, ttl=30)
+
+        self.assertEqual(asyncio.run(cache.aget_weather_entry("k")).data, {"temp": 25})
+        mock_redis.get.assert_not_called()
+        self.assertEqual(asyncio.run(cache.aget_weather_entry("k", l1=False)).data, {"temp": 26})
+        mock_redis.get.assert_called_once_with("weather:k")
+
+    @patch("app.cache.redis_client")
+    def test_set_invalidates_local_and_publishes(self, mock_redis):
+        mock_redis.get.return_value = json.dumps({"data": {"temp": 25}, "stored_at": cache.time.time()})
+        get_weather_cache("k")
+        self.assertIn("weather:k", cache._l1_cache)
+
+        with patch("app.cache.CACHE_PUBSUB_ENABLED", True):
+            set_weather_cache("k", {"temp": 26})
+
+        self.assertNotIn("weather:k", cache._l1_cache)
+        channel, message = mock_redis.publish.call_args[0]
+        self.assertEqual(channel, cache.CACHE_INVALIDATION_CHANNEL)
+        self.assertTrue(message.endswith("|weather:k"))
+
+    def test_invalidation_from_other_worker_drops_l1_entry(self):
+        cache._l1_cache.set("weather:k", {"data": 1}, ttl=30)
+
+        # Our own broadcasts are ignored
+        cache._handle_invalidation({"data": f"{cache._instance_id}|weather:k"})
+        self.assertIn("weather:k", cache._l1_cache)
+
+        cache._handle_invalidation({"data": "other-worker|weather:k"})
+        self.assertNotIn("weather:k", cache._l1_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
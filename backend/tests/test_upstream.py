@@ -0,0 +1,128 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app import upstream
+from app.main import app
+from app.upstream import upstream_get, CircuitBreaker, CircuitOpenError, UpstreamUnavailable
+
+URL = "https://api.open-meteo.com/v1/forecast"
+
+
+@pytest.fixture
+def responses(mock_http_client):
+    """Queue of status codes (or exceptions) the fake upstream answers with, in order"""
+    queue = []
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        item = queue.pop(0) if queue else 200
+        if isinstance(item, Exception):
+            raise item
+        if isinstance(item, tuple):
+            await asyncio.sleep(item[1])
+            item = item[0]
+        return httpx.Response(item, json={})
+
+    mock_http_client(handler)
+    return queue, calls
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried(responses):
+    queue, calls = responses
+    queue.extend([503, httpx.ConnectError("reset"), 200])
+
+    response = await upstream_get("forecast", URL)
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert upstream.get_breaker("forecast").state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(responses):
+    queue, calls = responses
+    queue.append(400)
+
+    response = await upstream_get("forecast", URL)
+
+    assert response.status_code == 400
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_caps_retries(responses):
+    queue, calls = responses
+    queue.extend([503] * 10)
+    upstream._retry_budget.tokens = 0
+
+    response = await upstream_get("forecast", URL)
+
+    assert response.status_code == 503
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_fails_fast(responses):
+    queue, calls = responses
+    queue.extend([503] * 100)
+
+    with patch("app.upstream.UPSTREAM_MAX_RETRIES", 0):
+        for _ in range(upstream.UPSTREAM_BREAKER_FAILURES):
+            await upstream_get("forecast", URL)
+        with pytest.raises(CircuitOpenError):
+            await upstream_get("forecast", URL)
+
+    assert len(calls) == upstream.UPSTREAM_BREAKER_FAILURES
+    health = TestClient(app).get("/health/").json()
+    assert health["status"] == "degraded"
+    assert health["upstream"]["circuits"]["forecast"]["state"] == "open"
+
+
+def test_half_open_trial_decides_state():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_saturated_upstream_fails_fast(responses):
+    queue, calls = responses
+    queue.extend([(200, 0.1), (200, 0.1)])
+
+    with patch("app.upstream.UPSTREAM_MAX_CONCURRENCY", 1), \
+            patch("app.upstream.UPSTREAM_QUEUE_TIMEOUT", 0.01):
+        results = await asyncio.gather(upstream_get("geocoding", URL), upstream_get("geocoding", URL), return_exceptions=True)
+
+    assert sum(isinstance(r, httpx.Response) for r in results) == 1
+    assert sum(isinstance(r, UpstreamUnavailable) for r in results) == 1
+    assert upstream.upstream_status()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_timeouts_leave_breaker_closed(responses):
+    queue, calls = responses
+    queue.append((200, 0.2))
+
+    with patch("app.upstream.UPSTREAM_MAX_CONCURRENCY", 1), \
+            patch("app.upstream.UPSTREAM_QUEUE_TIMEOUT", 0.001):
+        holder = asyncio.create_task(upstream_get("geocoding", URL))
+        await asyncio.sleep(0.01)
+        results = await asyncio.gather(*(upstream_get("geocoding", URL) for _ in range(10)), return_exceptions=True)
+        assert all(isinstance(r, UpstreamUnavailable) for r in results)
+
+        # Only our own queue was full; the upstream itself never failed
+        breaker = upstream.get_breaker("geocoding")
+        assert breaker.state == "closed" and breaker.failures == 0
+        assert (await holder).status_code == 200
+    assert len(calls) == 1
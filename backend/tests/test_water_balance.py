@@ -0,0 +1,192 @@
+import asyncio
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+import respx
+from httpx import Response
+from fastapi.testclient import TestClient
+
+from app import fao56
+from app.history_store import HistoryStore, date_range, set_history_store
+from app.main import app
+from app.services import history
+from app.services import water_balance as wb_service
+from app.services.water_balance import FieldSpec, field_balances, point_balance
+from tests.conftest import make_forecast_payload
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+TODAY = date(2025, 6, 30)
+
+client = TestClient(app)
+
+
+def _dry_days(request, et0=5.0):
+    """No rain, 5 mm/day ET0"""
+    params = request.url.params
+    days = date_range(date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"]))
+    section = {"time": [d.isoformat() for d in days]}
+    for name in params["daily"].split(","):
+        section[name] = [et0 if name == "et0_fao_evapotranspiration" else 0.0 for _ in days]
+    return Response(200, json={"daily": section})
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    set_history_store(store)
+    monkeypatch.setattr(history, "today", lambda timezone=None: TODAY)
+    yield store
+    set_history_store(None)
+    store.close()
+
+
+def test_crop_coefficient_follows_cane_stages():
+    kc = fao56.crop_coefficient(np.array([0, 60, 105, 150, 300, 360, 500]))
+    assert kc.tolist() == pytest.approx([0.4, 0.4, 0.825, 1.25, 1.25, 0.75, 0.75])
+    stages = fao56.crop_stage(np.array([0, 59, 60, 200, 400]))
+    assert [fao56.STAGE_NAMES[i] for i in stages] == [
+        "inicial", "inicial", "desenvolvimento", "maximo_desenvolvimento", "maturacao",
+    ]
+
+
+def test_advance_carries_depletion_with_stress_and_drainage():
+    state = fao56.new_state(["2025-01-01"] * 2, [100.0, 100.0], ["2025-06-01"] * 2)
+    rain = np.array([[0.0, 0.0, 50.0], [0.0, 0.0, 0.0]])
+    et0 = np.full((2, 3), 5.0)
+
+    state = fao56.advance(state, np.datetime64("2025-06-02"), rain, et0)
+
+    # Age ~152 days: Kc 1.25, no stress yet -> 6.25 mm/day; rain refills to field capacity
+    assert state.depletion.tolist() == pytest.approx([0.0, 18.75])
+    assert str(state.as_of[0]) == "2025-06-04"
+
+    dry = fao56.new_state(["2025-01-01"], [100.0], ["2025-06-01"])._replace(depletion=np.array([90.0]))
+    ks = fao56.water_stress_coefficient(dry.depletion, dry.taw)
+    assert ks[0] == pytest.approx(10 / 35)
+    assert fao56.classify(dry) == ["Déficit severo"]
+
+
+def test_advance_is_vectorized_per_field_history():
+    # Field 1 is already up to date for the first day; only later days apply to it
+    state = fao56.new_state(["2025-01-01"] * 2, [100.0, 100.0], ["2025-06-01", "2025-06-02"])
+    et0 = np.full((2, 2), 4.0)
+    state = fao56.advance(state, np.datetime64("2025-06-02"), np.zeros((2, 2)), et0)
+    assert state.depletion.tolist() == pytest.approx([10.0, 5.0])
+    assert [str(d) for d in state.as_of] == ["2025-06-03", "2025-06-03"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_field_balances_update_incrementally(store, monkeypatch):
+    archive = respx.get(ARCHIVE_URL).mock(side_effect=_dry_days)
+    monkeypatch.setattr(history, "HISTORY_ARCHIVE_LAG_DAYS", 0)
+    fields = [
+        FieldSpec("a", -21.17, -47.81, date(2025, 6, 20)),
+        FieldSpec("b", -21.16, -47.81, date(2025, 6, 20), 200.0),
+        FieldSpec("c", -22.70, -47.60, date(2025, 7, 10)),
+    ]
+
+    first = await field_balances(fields)
+    # a and b share a grid cell: one upstream call for both, none for the unplanted field
+    assert archive.call_count == 1
+    # 10 days * 5 mm * Kc 0.4
+    assert first[0]["soil_water_deficit_mm"] == 20.0 and first[0]["as_of"] == "2025-06-29"
+    assert first[1]["taw_mm"] == 200.0 and first[1]["soil_water_deficit_mm"] == 20.0
+    assert first[2]["soil_water_deficit_mm"] == 0.0 and first[2]["crop_stage"] == "inicial"
+
+    # Same day again: state comes from the store, no history reads needed
+    assert await field_balances(fields) == first
+    assert archive.call_count == 1
+
+    # Next day: only the new day is applied
+    monkeypatch.setattr(history, "today", lambda timezone=None: TODAY + timedelta(days=1))
+    later = await field_balances(fields)
+    assert later[0]["soil_water_deficit_mm"] == 22.0
+    assert archive.calls[-1].request.url.params["start_date"] == "2025-06-30"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_provisional_days_are_not_saved(store, monkeypatch):
+    respx.get(ARCHIVE_URL).mock(side_effect=_dry_days)
+    # Recent days from the forecast API overestimate ET0 until the archive has them
+    respx.get("https://api.open-meteo.com/v1/forecast").mock(side_effect=lambda request: _dry_days(request, et0=10.0))
+    monkeypatch.setattr(history, "HISTORY_ARCHIVE_LAG_DAYS", 2)
+    fields = [FieldSpec("a", -21.17, -47.81, date(2025, 6, 20))]
+
+    # 06-20..06-28 final (9 days * 5 mm * Kc 0.4), 06-29 provisional (10 mm * 0.4)
+    (first,) = await field_balances(fields)
+    assert (first["as_of"], first["soil_water_deficit_mm"]) == ("2025-06-29", 22.0)
+    assert store.load_balance_states(["a"])["a"][1:] == ("2025-06-28", 18.0)
+
+    # Next day the archive replaces 06-29; only 06-30 is provisional
+    monkeypatch.setattr(history, "today", lambda timezone=None: TODAY + timedelta(days=1))
+    (later,) = await field_balances(fields)
+    assert (later["as_of"], later["soil_water_deficit_mm"]) == ("2025-06-30", 24.0)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_long_point_backfill_runs_in_background(store, monkeypatch):
+    archive = respx.get(ARCHIVE_URL).mock(side_effect=_dry_days)
+    monkeypatch.setattr(history, "HISTORY_ARCHIVE_LAG_DAYS", 0)
+
+    assert await point_balance(-21.17, -47.81, date(2025, 6, 1)) is not None
+    assert archive.call_count == 1
+
+    # A season is too long to backfill inline
+    assert await point_balance(-21.17, -47.81, date(2025, 1, 1)) == {"pending": True}
+    assert await point_balance(-21.17, -47.81, date(2025, 1, 1)) == {"pending": True}
+    await asyncio.gather(*wb_service._backfills.values())
+    result = await point_balance(-21.17, -47.81, date(2025, 1, 1))
+    assert result["as_of"] == "2025-06-29" and "pending" not in result
+
+
+def test_point_states_expire_and_are_capped(store):
+    store.save_balance_states([
+        ("point:a", "s", "2025-01-01", 1.0),
+        ("point:b", "s", "2025-06-01", 1.0),
+        ("point:c", "s", "2025-06-10", 1.0),
+        ("point:d", "s", "2025-06-20", 1.0),
+        ("field-1", "s", "2025-01-01", 1.0),
+    ])
+    assert store.prune_balance_states("point:", "2025-05-01", 2) == 2
+    assert set(store.load_balance_states(["point:a", "point:b", "point:c", "point:d", "field-1"])) == {"point:c", "point:d", "field-1"}
+
+
+@respx.mock
+def test_water_balance_route_and_weather_derived(store, monkeypatch):
+    respx.get(ARCHIVE_URL).mock(side_effect=_dry_days)
+    # Forecast API: past days for recent history, plain forecast for /weather
+    respx.get("https://api.open-meteo.com/v1/forecast").mock(side_effect=lambda request: (
+        _dry_days(request) if "start_date" in request.url.params else Response(200, json=make_forecast_payload())
+    ))
+
+    response = client.post("/weather/water-balance", json={"fields": [
+        {"id": "talhao-1", "latitude": -21.17, "longitude": -47.81, "planted_on": "2025-03-01", "awc_mm": 60},
+    ]})
+    assert response.status_code == 200
+    (field,) = response.json()["fields"]
+    assert field["id"] == "talhao-1" and field["taw_mm"] == 60.0
+    assert field["soil_water_class"] in ("Déficit moderado", "Déficit severo")
+
+    duplicate = {"id": "x", "latitude": 0, "longitude": 0, "planted_on": "2025-01-01"}
+    assert client.post("/weather/water-balance", json={"fields": [duplicate, duplicate]}).status_code == 400
+
+    url = "/weather?city=Talhao&lat=-21.17&lon=-47.81&planted_on=2025-03-01&awc_mm=60"
+    with TestClient(app) as running:
+        # A season for a new point is backfilled in the background, not inline
+        pending = running.get(url).json()["data"]
+        assert pending["meta"]["soil_water_pending"] is True
+        assert pending["derived"]["soil_water_deficit_mm"] is None
+        for _ in range(100):
+            data = running.get(url).json()["data"]
+            if not data["meta"].get("soil_water_pending"):
+                break
+            time.sleep(0.01)
+    derived = data["derived"]
+    assert derived["soil_water_deficit_mm"] == field["soil_water_deficit_mm"]
+    assert derived["water_balance_class"] == derived["soil_water_class"] == field["soil_water_class"]
+    assert client.get("/weather?city=Talhao&lat=-21.17&lon=-47.81").json()["data"]["derived"]["soil_water_class"] is None
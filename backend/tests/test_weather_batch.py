@@ -0,0 +1,125 @@
+import asyncio
+import json
+import pytest
+import respx
+from httpx import Response
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.spatial import snap_coordinates
+from app.cache import WEATHER_CACHE_TTL, get_weather_entry, set_weather_cache
+from app.services.open_meteo import make_record, get_weather_batch, get_weather_data, DEFAULT_SELECTION
+from tests.conftest import make_forecast_payload
+
+client = TestClient(app)
+
+
+def _multi_location_response(request):
+    latitudes = request.url.params["latitude"].split(",")
+    payloads = [make_forecast_payload(latitude=float(lat)) for lat in latitudes]
+    return Response(200, json=payloads if len(payloads) > 1 else payloads[0])
+
+
+def _post_batch(locations):
+    response = client.post("/weather/batch", json={"locations": locations})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_fetches_misses_in_chunks():
+    locations = [
+        {"id": "field-1", "latitude": -21.17, "longitude": -47.81},
+        {"id": "field-2", "latitude": -21.171, "longitude": -47.811},  # same grid cell as field-1
+        {"id": "field-3", "latitude": -21.47, "longitude": -47.97},
+        {"id": "field-4", "latitude": -22.72, "longitude": -47.64},
+        {"id": "field-5", "latitude": -20.54, "longitude": -47.40},
+    ]
+    cached = snap_coordinates(-20.54, -47.40)
+    payload = make_forecast_payload(current={"time": "2025-11-28T12:00", "temperature_2m": 31.0})
+    set_weather_cache(cached.key, make_record(payload, DEFAULT_SELECTION))
+
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock, \
+            patch("app.services.open_meteo.WEATHER_BATCH_CHUNK_SIZE", 2):
+        route = respx_mock.get("/v1/forecast").mock(side_effect=_multi_location_response)
+        lines = _post_batch(locations)
+
+    # 3 distinct uncached cells -> 2 chunked upstream calls
+    assert route.call_count == 2
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3, 4]
+    assert all(line["status"] == "ok" for line in lines)
+
+    by_id = {line["id"]: line for line in lines}
+    assert by_id["field-5"]["data"]["current"]["temperature_2m"] == 31.0
+    assert by_id["field-1"]["data"]["derived"]["water_balance_class"] == "Neutro"
+    assert by_id["field-1"]["data"]["meta"]["grid"] == by_id["field-2"]["data"]["meta"]["grid"]
+
+
+def test_batch_reports_per_location_failures():
+    locations = [{"latitude": -21.17, "longitude": -47.81}, {"latitude": -22.72, "longitude": -47.64}]
+    with respx.mock(base_url="https://api.open-meteo.com") as respx_mock:
+        respx_mock.get("/v1/forecast").mock(return_value=Response(503))
+        lines = _post_batch(locations)
+
+    assert [line["status"] for line in lines] == ["not_found", "not_found"]
+    assert "Error fetching weather data" in lines[0]["message"]
+
+
+async def _collect(locations):
+    return [outcome async for _, outcome in get_weather_batch(locations)]
+
+
+@pytest.mark.asyncio
+async def test_batch_joins_fetches_already_in_flight(mock_http_client):
+    release = asyncio.Event()
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.params["latitude"])
+        await release.wait()
+        return _multi_location_response(request)
+
+    mock_http_client(handler)
+    first = asyncio.create_task(_collect([(-21.17, -47.81), (-22.72, -47.64)]))
+    while not calls:
+        await asyncio.sleep(0)
+    # Same cells from /weather and from another batch while the first fetch is running
+    single = asyncio.create_task(get_weather_data(-21.17, -47.81))
+    second = asyncio.create_task(_collect([(-22.72, -47.64)]))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    outcomes = await first
+    assert [o["status"] for o in outcomes + await second] == ["ok", "ok", "ok"]
+    assert (await single)["meta"]["grid"]["cell"] == snap_coordinates(-21.17, -47.81).cell
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_serves_stale_cells_while_refreshing(mock_http_client):
+    point = snap_coordinates(-21.17, -47.81)
+    with patch("app.cache.time.time", return_value=1000.0):
+        stale = make_forecast_payload(current={"time": "2025-11-28T12:00", "temperature_2m": 19.0})
+        set_weather_cache(point.key, make_record(stale, DEFAULT_SELECTION))
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return _multi_location_response(request)
+
+    mock_http_client(handler)
+    with patch("app.cache.time.time", return_value=1000.0 + WEATHER_CACHE_TTL + 5):
+        # Answered without waiting for the upstream call
+        outcomes = await asyncio.wait_for(_collect([(-21.17, -47.81)]), 1.0)
+    assert outcomes[0]["data"]["current"]["temperature_2m"] == 19.0
+    assert outcomes[0]["data"]["meta"]["stale"] is True
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert get_weather_entry(point.key).data["payload"]["current"]["temperature_2m"] == 25.0
+
+
+def test_batch_validates_size():
+    response = client.post("/weather/batch", json={"locations": []})
+    assert response.status_code == 400